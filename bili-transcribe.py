@@ -3,7 +3,15 @@
 B站视频转录工具 - 一键下载视频、提取音频、生成逐字稿
 """
 
+import time
+
+_STARTUP_T0 = time.perf_counter()
+
 import argparse
+import atexit
+import copy
+import hashlib
+import importlib.util
 import json
 import os
 import re
@@ -11,538 +19,5690 @@ import shutil
 import subprocess
 import sys
 import tempfile
+import threading
+import wave
+import queue
+import socket
+import socketserver
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Dict
-import urllib.request
+from typing import Optional, Dict, List, Callable, Iterable
 
+# 以下模块只在用到时才导入，缩短启动时间：
+# urllib.request（短链接解析）、importlib.metadata（后端版本）、
+# multiprocessing / concurrent.futures（分块转录、分P枚举）、numpy / torch / 语音识别后端（转录阶段）
 
-class BiliTranscriber:
-    """B站视频转录器"""
+CACHE_DIR = Path.home() / ".cache" / "bili_transcribe"
 
-    COMMON_PATHS = [
-        "/usr/local/bin",
-        "/opt/homebrew/bin",
-        "/usr/bin",
-        "/bin",
-        str(Path.home() / "bin"),
-        str(Path.home() / ".local" / "bin"),
-        "/opt/bin",
-        "/usr/local/opt/bbdown/bin",  # Homebrew 可能的安装路径
-        str(Path.home() / ".dotnet" / "tools"),  # dotnet tools
-    ]
+# Whisper 的输入格式：16kHz 单声道
+SAMPLE_RATE = 16000
 
-    def __init__(self, output_dir: str = "~/bili-transcribe-output", task_mode: bool = False):
-        # 展开 ~ 为实际家目录路径
-        self.output_dir = Path(output_dir).expanduser().resolve()
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.temp_dir = Path.home() / ".cache" / "bili_transcribe"
-        self.temp_dir.mkdir(parents=True, exist_ok=True)
-        self._cmd_cache: Dict[str, Optional[str]] = {}
-        self.task_mode = task_mode
+# 两个后端统一使用的解码参数：束搜索宽度（与 whisper 命令行、faster-whisper 的默认值一致），
+# 保证后端之间的速度和准确度对比只反映引擎差异
+ASR_BEAM_SIZE = 5
 
-    def report_status(self, stage: str, status: str, message: str = "", data: dict = None):
-        """在Task模式下报告状态到stderr"""
-        if self.task_mode:
-            status_obj = {
-                "stage": stage,
-                "status": status,
-                "message": message
-            }
-            if data:
-                status_obj["data"] = data
-            print(json.dumps(status_obj, ensure_ascii=False), file=sys.stderr, flush=True)
+# 超过该时长的音频按窗口记录转录进度，中断后可从断点继续
+RESUME_MIN_SECONDS = 600
+# 长音频分窗解码（不把整段音频读入内存）的窗口长度，与 Whisper 单次输入一致
+STREAM_WINDOW_SECONDS = 30
 
-    def find_executable(self, cmd: str) -> Optional[str]:
-        """查找可执行文件 - 使用多种方法确保找到已安装的命令"""
-        if cmd in self._cmd_cache:
-            return self._cmd_cache[cmd]
 
-        # 方法1: 使用 shutil.which（最标准的方式）
-        result = shutil.which(cmd)
-        if result:
-            self._cmd_cache[cmd] = result
-            return result
+class StartupProfiler:
+    """启动耗时分析（--profile-startup）：记录各步骤耗时，结束时输出报告"""
 
-        # 方法2: 对于 BBDown，尝试各种大小写变体
-        if cmd.lower() == "bbdown":
-            for variant in ["BBDown", "bbdown", "Bbdown", "bbDown"]:
-                result = shutil.which(variant)
-                if result:
-                    self._cmd_cache[cmd] = result
-                    return result
+    def __init__(self):
+        self.enabled = False
+        self.steps: List[tuple] = [("模块导入", time.perf_counter() - _STARTUP_T0)]
 
-        # 方法3: 使用 shell 的 command -v（能处理更多情况）
+    @contextmanager
+    def step(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
         try:
-            shell_cmd = f"command -v {cmd}"
-            result = subprocess.run(
-                shell_cmd, shell=True, capture_output=True, text=True, timeout=5
-            )
-            if result.returncode == 0 and result.stdout.strip():
-                path = result.stdout.strip().split('\n')[0]
-                if os.path.isfile(path) and os.access(path, os.X_OK):
-                    self._cmd_cache[cmd] = path
-                    return path
-        except Exception:
-            pass
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
 
-        # 方法4: 使用 which -a 查找所有可能的匹配
-        try:
-            result = subprocess.run(
-                ["which", "-a", cmd],
-                capture_output=True, text=True, timeout=5
-            )
-            if result.returncode == 0:
-                for line in result.stdout.strip().split('\n'):
-                    path = line.strip()
-                    if path and os.path.isfile(path) and os.access(path, os.X_OK):
-                        self._cmd_cache[cmd] = path
-                        return path
-        except Exception:
-            pass
+    def report(self, task_mode: bool = False):
+        total = time.perf_counter() - _STARTUP_T0
+        if task_mode:
+            data = {"steps": [{"name": n, "ms": round(t * 1000, 1)} for n, t in self.steps],
+                    "total_ms": round(total * 1000, 1)}
+            print(json.dumps({"stage": "startup", "status": "profile", "message": "启动耗时分析", "data": data},
+                             ensure_ascii=False), file=sys.stderr, flush=True)
+            return
+        print("\n⏱️  启动耗时分析:", file=sys.stderr)
+        for name, seconds in self.steps:
+            print(f"   {seconds * 1000:8.1f} ms  {name}", file=sys.stderr)
+        print(f"   {total * 1000:8.1f} ms  总计（自脚本开始执行）", file=sys.stderr)
 
-        # 方法5: 在常见路径中搜索
-        for path in self.COMMON_PATHS:
-            full_path = Path(path) / cmd
-            if full_path.exists() and os.access(full_path, os.X_OK):
-                self._cmd_cache[cmd] = str(full_path)
-                return str(full_path)
 
-            # 对于 BBDown，尝试各种大小写
-            if cmd.lower() == "bbdown":
-                for variant in ["BBDown", "bbdown", "Bbdown"]:
-                    full_path_alt = Path(path) / variant
-                    if full_path_alt.exists() and os.access(full_path_alt, os.X_OK):
-                        self._cmd_cache[cmd] = str(full_path_alt)
-                        return str(full_path_alt)
+PROFILER = StartupProfiler()
 
-        # 方法6: 尝试使用 type 命令（bash 内建）
-        try:
-            result = subprocess.run(
-                ["bash", "-c", f"type -P {cmd}"],
-                capture_output=True, text=True, timeout=5
-            )
-            if result.returncode == 0 and result.stdout.strip():
-                path = result.stdout.strip().split('\n')[0]
-                if os.path.isfile(path):
-                    self._cmd_cache[cmd] = path
-                    return path
-        except Exception:
-            pass
 
-        # 方法7: 使用 whereis
-        try:
-            result = subprocess.run(
-                ["whereis", cmd],
-                capture_output=True, text=True, timeout=5
-            )
-            if result.returncode == 0:
-                paths = result.stdout.strip().split(":")[-1].strip().split()
-                for p in paths:
-                    if os.path.isfile(p) and os.access(p, os.X_OK):
-                        self._cmd_cache[cmd] = p
-                        return p
-        except Exception:
-            pass
+def load_pcm_wav(path: Path):
+    """读取 16kHz 单声道 s16 WAV 为 float32 数组，可直接交给 model.transcribe()"""
+    import numpy as np
 
-        self._cmd_cache[cmd] = None
-        return None
+    with wave.open(str(path), "rb") as wf:
+        if wf.getframerate() != SAMPLE_RATE or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise ValueError(f"音频格式不是 16kHz 单声道 s16: {path}")
+        frames = wf.readframes(wf.getnframes())
+    return np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
 
-    def check_dependency(self, cmd: str) -> bool:
-        """检查依赖是否存在 - 改进版，提供更多诊断信息"""
-        path = self.find_executable(cmd)
-        if path:
-            print(f"  {cmd}: ✅ 已安装 ({path})")
-            return True
 
-        print(f"  {cmd}: ❌ 未安装")
-        return False
+def iter_wav_windows(path: Path, start_seconds: float = 0.0, window_seconds: float = STREAM_WINDOW_SECONDS,
+                     search_seconds: float = 5):
+    """从 16kHz 单声道 s16 WAV 中逐窗口读取音频，产出 (起始采样, float32 数组)
 
-    def get_cmd(self, cmd: str) -> str:
-        """获取命令的绝对路径"""
-        path = self.find_executable(cmd)
-        return path if path else cmd
+    每个窗口在末尾 search_seconds 内能量最低处切开，切点之后的音频留给下一个窗口；
+    内存中只保留当前窗口，与文件长度无关。
+    """
+    import numpy as np
 
-    def extract_bvid(self, url: str) -> str:
-        """从URL中提取BV号"""
-        url = url.strip()
+    window = int(window_seconds * SAMPLE_RATE)
+    search = int(search_seconds * SAMPLE_RATE)
+    with wave.open(str(path), "rb") as wf:
+        if wf.getframerate() != SAMPLE_RATE or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise ValueError(f"音频格式不是 16kHz 单声道 s16: {path}")
+        total = wf.getnframes()
+        pos = min(total, int(start_seconds * SAMPLE_RATE))
+        wf.setpos(pos)
+        carry = np.zeros(0, dtype=np.float32)
+        while pos < total:
+            frames = wf.readframes(window - len(carry))
+            block = np.concatenate([carry, np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0])
+            if len(block) == 0:
+                break
+            if pos + len(block) >= total:
+                yield pos, block
+                break
+            energy, frame_len = frame_energy(block[-search:])
+            cut = len(block) - search + int(np.argmin(energy)) * frame_len if len(energy) else len(block)
+            yield pos, block[:cut]
+            # 复制尾部，让整个窗口的内存可以释放
+            carry = block[cut:].copy()
+            pos += cut
 
-        bv_pattern = r'BV[a-zA-Z0-9]{10}'
-        match = re.search(bv_pattern, url)
-        if match:
-            return match.group()
 
-        if 'b23.tv' in url or 'bili2233.cn' in url:
-            try:
-                print("🔗 正在解析短链接...")
-                req = urllib.request.Request(url, method='HEAD')
-                req.add_header('User-Agent', 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36')
-                req.add_header('Accept', 'text/html,application/xhtml+xml')
-                response = urllib.request.urlopen(req, timeout=15)
-                final_url = response.geturl()
-                match = re.search(bv_pattern, final_url)
-                if match:
-                    return match.group()
-            except Exception as e:
-                print(f"⚠️  解析短链接失败: {e}")
-                try:
-                    req = urllib.request.Request(url, method='GET')
-                    req.add_header('User-Agent', 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36')
-                    response = urllib.request.urlopen(req, timeout=15)
-                    final_url = response.geturl()
-                    match = re.search(bv_pattern, final_url)
-                    if match:
-                        return match.group()
-                except Exception as e2:
-                    print(f"⚠️  GET 请求也失败: {e2}")
+def frame_energy(audio, frame_seconds: float = 0.02):
+    """按帧计算RMS能量（向量化），返回 (能量数组, 每帧采样数)"""
+    import numpy as np
 
-        raise ValueError(f"无法从URL中提取BV号: {url}\n请提供完整的B站视频链接或正确的BV号")
+    frame_len = max(1, int(SAMPLE_RATE * frame_seconds))
+    n_frames = len(audio) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32), frame_len
+    frames = audio[:n_frames * frame_len].reshape(n_frames, frame_len)
+    return np.sqrt(np.mean(frames * frames, axis=1)), frame_len
 
-    def check_dependencies(self) -> Dict[str, bool]:
-        """检查所有依赖"""
-        print("🔍 检查依赖...")
 
-        deps = {
-            "BBDown": self.check_dependency("BBDown"),
-            "ffmpeg": self.check_dependency("ffmpeg"),
-            "whisper": False
-        }
+def split_on_silence(audio, chunk_seconds: float = 300, search_seconds: float = 30) -> List[tuple]:
+    """在目标切分点附近寻找能量最低处切分音频，返回 [(起始采样, 结束采样), ...]"""
+    import numpy as np
 
-        try:
-            import whisper
-            deps["whisper"] = True
-            print(f"  whisper: ✅ 已安装 (Python包)")
-        except ImportError:
-            print(f"  whisper: ❌ 未安装")
+    if chunk_seconds <= 0:
+        raise ValueError(f"分块时长必须为正数: {chunk_seconds}")
+    total = len(audio)
+    chunk = max(1, int(chunk_seconds * SAMPLE_RATE))
+    if total <= chunk * 1.5:
+        return [(0, total)]
 
-        return deps
+    energy, frame_len = frame_energy(audio)
+    # 用 0.5 秒滑动平均，避免切在单个静音帧（如爆破音间隙）上
+    window = max(1, int(0.5 * SAMPLE_RATE / frame_len))
+    smoothed = np.convolve(energy, np.ones(window) / window, mode="same")
+    # 搜索范围不超过块长的四分之一，保证每块长度接近目标
+    search = int(min(search_seconds, chunk_seconds / 4) * SAMPLE_RATE / frame_len)
 
-    def download_video(self, bvid: str, output_name: str) -> Path:
-        """下载视频"""
-        print(f"\n📥 正在下载视频 {bvid}...")
-        print("   这可能需要一些时间，请耐心等待...")
+    bounds = []
+    start = 0
+    while total - start > chunk * 1.5:
+        target = (start + chunk) // frame_len
+        lo = target - search
+        hi = min(len(smoothed), target + search)
+        cut = (lo + int(np.argmin(smoothed[lo:hi]))) * frame_len if hi > lo else target * frame_len
+        if cut <= start:
+            # 块长短于一帧时切点可能不前进
+            cut = start + max(chunk, frame_len)
+        bounds.append((start, cut))
+        start = cut
+    bounds.append((start, total))
+    return bounds
 
-        bbdown_cmd = self.get_cmd("BBDown")
 
-        cmd = [
-            bbdown_cmd,
-            "--work-dir", str(self.temp_dir),
-            "--file-pattern", output_name,
-            "--select-page", "1",
-            bvid
-        ]
+def _normalize_text(text: str) -> str:
+    return re.sub(r"[\s，。！？、,.!?]+", "", text or "")
 
-        try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                errors='ignore'
-            )
 
-            if result.returncode != 0:
-                error_msg = result.stderr or result.stdout
-                if error_msg:
-                    print(f"⚠️  BBDown 输出: {error_msg[:500]}")
+def stitch_chunk_results(chunk_results: List[dict], offsets: List[float]) -> dict:
+    """把各分块的转录结果拼接回整体：修正绝对时间戳，去掉分块边界处的重复文本"""
+    segments = []
+    language = None
+    for result, offset in zip(chunk_results, offsets):
+        language = language or result.get("language")
+        for seg in result.get("segments", []):
+            seg = dict(seg)
+            seg["start"] = round(seg.get("start", 0) + offset, 3)
+            seg["end"] = round(seg.get("end", 0) + offset, 3)
+            if segments:
+                prev = segments[-1]
+                same_text = _normalize_text(seg.get("text")) == _normalize_text(prev.get("text"))
+                if same_text and seg["start"] - prev["end"] < 1.0:
+                    prev["end"] = max(prev["end"], seg["end"])
+                    continue
+            segments.append(seg)
 
-            possible_files = []
-            for ext in ['.mp4', '.flv', '.mkv', '.m4v']:
-                video_file = self.temp_dir / f"{output_name}{ext}"
-                if video_file.exists():
-                    possible_files.append(video_file)
+    for i, seg in enumerate(segments):
+        seg["id"] = i
+    return {
+        "text": "".join(seg.get("text", "") for seg in segments),
+        "segments": segments,
+        "language": language,
+    }
 
-                for f in self.temp_dir.glob(f"{output_name}*{ext}"):
-                    if f.exists():
-                        possible_files.append(f)
 
-            if possible_files:
-                video_file = max(possible_files, key=lambda p: p.stat().st_size)
-                print(f"✅ 视频已下载: {video_file.name}")
-                return video_file
+def detect_speech_energy(audio, frame_seconds: float = 0.03, min_speech: float = 0.25,
+                         min_silence: float = 0.5) -> List[tuple]:
+    """基于短时能量和过零率的语音检测（向量化），返回语音区间 [(起始采样, 结束采样), ...]
 
-            print(f"\n⚠️  未找到下载的视频文件")
-            print(f"   临时目录内容: {list(self.temp_dir.glob('*'))}")
-            raise FileNotFoundError(f"视频文件未找到，BV号: {bvid}")
+    能量阈值按噪声底（第10百分位）自适应；过零率过高的帧视为噪声。
+    """
+    import numpy as np
 
-        except FileNotFoundError:
-            raise
-        except Exception as e:
-            print(f"❌ 下载失败: {e}")
-            raise RuntimeError(f"视频下载失败: {e}")
+    energy, frame_len = frame_energy(audio, frame_seconds)
+    if len(energy) == 0:
+        return []
+    frames = audio[:len(energy) * frame_len].reshape(len(energy), frame_len)
+    zcr = np.mean(np.abs(np.diff(np.signbit(frames).astype(np.int8), axis=1)), axis=1)
 
-    def extract_audio(self, video_path: Path, output_name: str) -> Path:
-        """提取音频"""
-        print(f"\n🎵 正在提取音频...")
+    noise_floor = np.percentile(energy, 10)
+    threshold = max(0.01, noise_floor * 3.0)
+    speech = (energy > threshold) & (zcr < 0.35)
 
-        audio_path = self.temp_dir / f"{output_name}.mp3"
+    # 填平短暂停顿，去掉过短的语音片段
+    gap = int(min_silence / frame_seconds)
+    idx = np.flatnonzero(speech)
+    if len(idx) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(idx) > gap)
+    starts = np.concatenate(([idx[0]], idx[breaks + 1]))
+    ends = np.concatenate((idx[breaks], [idx[-1]])) + 1
+    keep = (ends - starts) * frame_seconds >= min_speech
+    return [(int(a) * frame_len, int(b) * frame_len) for a, b in zip(starts[keep], ends[keep])]
 
-        cmd = [
-            self.get_cmd("ffmpeg"),
-            "-i", str(video_path),
-            "-vn",
-            "-acodec", "libmp3lame",
-            "-q:a", "2",
-            "-y",
-            str(audio_path)
-        ]
 
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='ignore'
-        )
+def detect_speech_silero(audio) -> List[tuple]:
+    """使用 silero-vad 模型检测语音（需要 pip install silero-vad）"""
+    import torch
+    from silero_vad import load_silero_vad, get_speech_timestamps
 
-        if result.returncode != 0:
-            error_msg = result.stderr or "未知错误"
-            print(f"❌ 音频提取失败: {error_msg[:500]}")
-            raise RuntimeError(f"音频提取失败: {error_msg[:200]}")
+    model = load_silero_vad()
+    stamps = get_speech_timestamps(torch.from_numpy(audio), model, sampling_rate=SAMPLE_RATE)
+    return [(int(t["start"]), int(t["end"])) for t in stamps]
 
-        if not audio_path.exists():
-            raise FileNotFoundError(f"音频文件未生成: {audio_path}")
 
-        print(f"✅ 音频已提取: {audio_path.name}")
-        return audio_path
+# 可插拔的语音检测器：名称 -> 函数(audio) -> 语音区间
+VAD_DETECTORS: Dict[str, Callable] = {
+    "energy": detect_speech_energy,
+    "silero": detect_speech_silero,
+}
 
-    def transcribe_audio(self, audio_path: Path, model: str = "medium", language: str = "zh") -> dict:
-        """使用Whisper转录音频"""
-        print(f"\n📝 正在进行语音转录...")
-        print(f"   模型: {model} | 语言: {language}")
-        print("   ⏳ 这可能需要几分钟，请耐心等待...")
 
-        try:
-            import whisper
-        except ImportError:
-            raise ImportError("未安装 openai-whisper，请运行: pip install openai-whisper")
+def pad_regions(regions: List[tuple], total: int, padding: float) -> List[tuple]:
+    """为语音区间两端补上余量并合并重叠区间"""
+    pad = int(padding * SAMPLE_RATE)
+    merged: List[list] = []
+    for start, end in regions:
+        start, end = max(0, start - pad), min(total, end + pad)
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
 
-        valid_models = ["tiny", "base", "small", "medium", "large", "large-v1", "large-v2", "large-v3"]
-        if model not in valid_models:
-            print(f"⚠️  未知模型 '{model}'，使用默认的 'small'")
-            model = "small"
 
-        try:
-            model_obj = whisper.load_model(model)
-        except Exception as e:
-            raise RuntimeError(f"加载 Whisper 模型失败: {e}")
+def compact_speech(audio, regions: List[tuple], gap_seconds: float = 0.2):
+    """只保留语音区间拼成新音频（区间之间插入短静音），返回 (新音频, 时间映射表)
 
-        try:
-            result = model_obj.transcribe(
-                str(audio_path),
-                language=language if language else None,
-                verbose=False,
-                fp16=False
-            )
-        except Exception as e:
-            raise RuntimeError(f"语音转录失败: {e}")
+    映射表每项为 (拼接后起点秒, 原始起点秒, 时长秒)。
+    """
+    import numpy as np
 
-        segments_count = len(result.get('segments', []))
-        print(f"✅ 转录完成! 共 {segments_count} 个片段")
-        return result
+    gap = np.zeros(int(gap_seconds * SAMPLE_RATE), dtype=audio.dtype)
+    pieces = []
+    timeline = []
+    cursor = 0
+    for start, end in regions:
+        if pieces:
+            pieces.append(gap)
+            cursor += len(gap)
+        timeline.append((cursor / SAMPLE_RATE, start / SAMPLE_RATE, (end - start) / SAMPLE_RATE))
+        pieces.append(audio[start:end])
+        cursor += end - start
+    compacted = np.concatenate(pieces) if pieces else np.zeros(0, dtype=audio.dtype)
+    return compacted, timeline
 
-    def save_transcript(self, result: dict, output_name: str, video_info: dict = None) -> Dict[str, Path]:
-        """保存转录结果"""
-        output_base = self.output_dir / output_name
-        self.output_dir.mkdir(parents=True, exist_ok=True)
 
-        files_created = {}
+def remap_time(t: float, timeline: List[tuple]) -> float:
+    """把拼接后音频上的时间映射回原始时间轴"""
+    import bisect
 
-        try:
-            txt_path = output_base.with_suffix(".txt")
-            with open(txt_path, "w", encoding="utf-8") as f:
-                if video_info:
-                    f.write(f"标题: {video_info.get('title', '未知')}\n")
-                    f.write(f"UP主: {video_info.get('up', '未知')}\n")
-                    f.write(f"BV号: {video_info.get('bvid', '未知')}\n")
-                    f.write("=" * 50 + "\n\n")
-                f.write(result.get("text", ""))
-            files_created["txt"] = txt_path
-            print(f"✅ 文本: {txt_path.name}")
-        except Exception as e:
-            print(f"⚠️  保存文本失败: {e}")
+    i = max(0, bisect.bisect_right([entry[0] for entry in timeline], t) - 1)
+    compact_start, orig_start, length = timeline[i]
+    return orig_start + min(max(t - compact_start, 0.0), length)
 
-        try:
-            json_path = output_base.with_suffix(".json")
-            with open(json_path, "w", encoding="utf-8") as f:
-                json.dump(result, f, ensure_ascii=False, indent=2)
-            files_created["json"] = json_path
-            print(f"✅ JSON: {json_path.name}")
-        except Exception as e:
-            print(f"⚠️  保存JSON失败: {e}")
-
-        try:
-            srt_path = output_base.with_suffix(".srt")
-            with open(srt_path, "w", encoding="utf-8") as f:
-                for i, seg in enumerate(result.get("segments", []), 1):
-                    start = self.format_time(seg.get("start", 0))
-                    end = self.format_time(seg.get("end", 0))
-                    text = seg.get("text", "").strip()
-                    f.write(f"{i}\n")
-                    f.write(f"{start} --> {end}\n")
-                    f.write(f"{text}\n\n")
-            files_created["srt"] = srt_path
-            print(f"✅ SRT: {srt_path.name}")
-        except Exception as e:
-            print(f"⚠️  保存SRT失败: {e}")
-
-        try:
-            md_path = output_base.with_suffix(".md")
-            with open(md_path, "w", encoding="utf-8") as f:
-                title = video_info.get('title', '视频转录') if video_info else '视频转录'
-                f.write(f"# {title}\n\n")
-                if video_info:
-                    f.write(f"- **UP主**: {video_info.get('up', '未知')}\n")
-                    f.write(f"- **BV号**: {video_info.get('bvid', '未知')}\n")
-                    duration = result.get('duration', 0)
-                    f.write(f"- **时长**: {self.format_duration(duration)}\n\n")
-
-                f.write("## 逐字稿\n\n")
-                for seg in result.get("segments", []):
-                    time_str = self.format_time(seg.get("start", 0))
-                    text = seg.get("text", "").strip()
-                    f.write(f"**[{time_str}]** {text}\n\n")
-            files_created["md"] = md_path
-            print(f"✅ Markdown: {md_path.name}")
-        except Exception as e:
-            print(f"⚠️  保存Markdown失败: {e}")
 
-        return files_created
+def remap_segment(seg: dict, timeline: List[tuple]) -> dict:
+    """修正单个片段（及逐词）的时间戳"""
+    seg["start"] = round(remap_time(seg.get("start", 0), timeline), 3)
+    seg["end"] = round(remap_time(seg.get("end", 0), timeline), 3)
+    for word in seg.get("words", []) or []:
+        word["start"] = round(remap_time(word.get("start", 0), timeline), 3)
+        word["end"] = round(remap_time(word.get("end", 0), timeline), 3)
+    return seg
 
-    def format_time(self, seconds: float) -> str:
-        """格式化时间为 SRT 格式"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        millis = int((seconds % 1) * 1000)
-        return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
 
-    def format_duration(self, seconds: float) -> str:
-        """格式化时长"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        if hours > 0:
-            return f"{hours}:{minutes:02d}:{secs:02d}"
-        return f"{minutes}:{secs:02d}"
+def remap_segments(result: dict, timeline: List[tuple]) -> dict:
+    """修正转录结果中各片段的时间戳"""
+    for seg in result.get("segments", []):
+        remap_segment(seg, timeline)
+    return result
 
-    def cleanup(self, keep_video: bool = False, output_name: str = None):
-        """清理临时文件"""
-        print("\n🧹 清理临时文件...")
 
-        cleaned = []
+class ASRBackend:
+    """语音识别后端接口
 
-        if output_name:
-            audio_file = self.temp_dir / f"{output_name}.mp3"
-            if audio_file.exists():
-                audio_file.unlink()
-                cleaned.append(audio_file.name)
-
-        if not keep_video and output_name:
-            for ext in ['.mp4', '.flv', '.mkv', '.m4v']:
-                for video_file in self.temp_dir.glob(f"{output_name}*{ext}"):
-                    if video_file.exists():
-                        video_file.unlink()
-                        cleaned.append(video_file.name)
+    各后端负责加载模型、转录，并把结果统一为 save_transcript() 使用的
+    {text, segments, language, duration} 结构。
+    """
 
-        if cleaned:
-            print(f"   已清理: {', '.join(cleaned[:3])}")
-        print("✅ 清理完成")
+    name = ""
+    module = ""          # Python 导入名，用于依赖检测
+    package = ""         # pip 包名，用于版本号
+    install_hint = ""
+    valid_models: List[str] = []
+    devices: List[str] = ["cpu", "cuda"]
+    compute_types: List[str] = []
+    # 多个转录 worker 共用一份权重的方式："fork" 为父进程加载后 fork 子进程（写时复制），
+    # "threads" 为同一进程内一个模型实例供多个线程并行推理
+    share_mode = ""
+    # 是否实现了 decode_batch()（跨任务批量解码）
+    supports_batch = False
 
-    def process(self, url: str, model: str = "medium", language: str = "zh",
-                keep_video: bool = False, skip_download: bool = False) -> Optional[Dict[str, Path]]:
-        """主处理流程"""
+    def available(self) -> bool:
+        """只查找模块而不导入（导入 torch 需要数秒），真正导入推迟到转录阶段"""
+        with PROFILER.step(f"查找模块 {self.module}"):
+            try:
+                return importlib.util.find_spec(self.module) is not None
+            except (ImportError, ValueError):
+                return False
 
-        self.report_status("init", "running", f"开始处理: {url}")
+    def version(self) -> str:
+        from importlib import metadata as importlib_metadata
+        try:
+            return f"{self.package}-{importlib_metadata.version(self.package)}"
+        except importlib_metadata.PackageNotFoundError:
+            return f"{self.package}-unknown"
 
-        bvid = self.extract_bvid(url)
-        print(f"✅ 识别到 BV号: {bvid}")
-        self.report_status("extract_bvid", "completed", f"识别到BV号: {bvid}", {"bvid": bvid})
+    def capabilities(self) -> dict:
+        """能力报告"""
+        return {
+            "name": self.name,
+            "available": self.available(),
+            "version": self.version(),
+            "models": self.valid_models,
+            "devices": self.devices,
+            "compute_types": self.compute_types,
+        }
 
-        output_name = f"{bvid}"
+    def precision(self, device: Optional[str], compute_type: Optional[str]) -> str:
+        raise NotImplementedError
 
-        deps = self.check_dependencies()
-        missing = [name for name, installed in deps.items() if not installed]
-        if missing:
-            print(f"\n❌ 缺少依赖: {', '.join(missing)}")
-            print("\n安装指南:")
-            print("  • BBDown: https://github.com/nilaoda/BBDown/releases")
-            print("  • ffmpeg: brew install ffmpeg")
-            print("  • whisper: pip install openai-whisper")
-            self.report_status("dependencies", "failed", f"缺少依赖: {', '.join(missing)}")
-            raise RuntimeError(f"缺少必要依赖: {', '.join(missing)}")
+    def check_options(self, compute_type: Optional[str] = None, batch_size: int = 0):
+        """校验推理精度和批量解码是否受本后端支持，不支持时抛出 ValueError"""
+        if compute_type and compute_type not in self.compute_types:
+            raise ValueError(f"后端 {self.name} 不支持精度 '{compute_type}'，可选: {', '.join(self.compute_types)}")
+        if batch_size > 1 and not self.supports_batch:
+            raise ValueError(f"后端 {self.name} 不支持批量解码（--batch-size）")
 
-        self.report_status("dependencies", "completed", "所有依赖已安装")
+    def cache_key(self, model: str, device: Optional[str], compute_type: Optional[str]) -> tuple:
+        """模型缓存键：(后端, 模型, 设备, 精度)"""
+        return (self.name, model, device or "auto", self.precision(device, compute_type))
 
-        video_path = None
-        try:
-            if not skip_download:
-                self.report_status("download", "running", "开始下载视频")
-                video_path = self.download_video(bvid, output_name)
-                self.report_status("download", "completed", f"视频下载完成: {video_path.name}")
-            else:
-                found = False
-                for ext in ['.mp4', '.flv', '.mkv', '.m4v']:
-                    for f in self.temp_dir.glob(f"{output_name}*{ext}"):
-                        video_path = f
-                        found = True
-                        break
-                    if found:
-                        break
+    def load(self, model: str, device: Optional[str] = None, compute_type: Optional[str] = None,
+             threads: Optional[int] = None, workers: int = 1):
+        raise NotImplementedError
 
-                if not video_path or not video_path.exists():
-                    raise FileNotFoundError(f"未找到现有视频文件: {self.temp_dir}/{output_name}.*")
-                print(f"✅ 使用现有视频: {video_path.name}")
-                self.report_status("download", "skipped", f"使用现有视频: {video_path.name}")
+    def set_threads(self, threads: int):
+        """调整已加载模型的推理线程数（fork 出的 worker 中使用）"""
 
-            self.report_status("extract_audio", "running", "正在提取音频")
-            audio_path = self.extract_audio(video_path, output_name)
-            self.report_status("extract_audio", "completed", f"音频提取完成: {audio_path.name}")
+    def decode_batch(self, model_obj, windows: list, language: Optional[str]) -> List[dict]:
+        """一次前向推理解码一批不超过 30 秒的音频窗口
 
-            self.report_status("transcribe", "running", "正在进行语音转录")
-            result = self.transcribe_audio(audio_path, model, language)
-            self.report_status("transcribe", "completed", f"转录完成，共 {len(result.get('segments', []))} 个片段")
+        返回每个窗口的 {"segments", "language", "compression_ratio"}，片段时间戳相对于窗口起点。
+        """
+        raise NotImplementedError(f"{self.name} 不支持批量解码")
 
-            video_info = {"bvid": bvid, "title": "B站视频", "up": "未知"}
-            output_files = self.save_transcript(result, output_name, video_info)
+    def transcribe(self, model_obj, audio, language: Optional[str],
+                   initial_prompt: Optional[str] = None) -> dict:
+        raise NotImplementedError
 
-            # 转换为字符串路径用于JSON序列化
-            files_dict = {k: str(v) for k, v in output_files.items()}
-            self.report_status("save", "completed", "转录结果已保存", {"files": files_dict})
+    def iter_segments(self, model_obj, audio, language: Optional[str], info: dict,
+                      window_seconds: float = 30):
+        """逐窗口解码并逐个产出片段（绝对时间戳），上一窗口的文本作为下一窗口的提示
 
-            self.cleanup(keep_video, output_name)
-            self.report_status("cleanup", "completed", "临时文件已清理")
+        检测到的语言回填到 info["language"]。
+        """
+        prompt = None
+        for start, end in split_on_silence(audio, window_seconds):
+            result = self.transcribe(model_obj, audio[start:end], language, initial_prompt=prompt)
+            language = language or result.get("language")
+            info["language"] = language
+            offset = start / SAMPLE_RATE
+            for seg in result.get("segments", []):
+                seg["start"] = round(seg.get("start", 0) + offset, 3)
+                seg["end"] = round(seg.get("end", 0) + offset, 3)
+                yield seg
+            prompt = (result.get("text") or "")[-200:] or prompt
 
-            return output_files
 
-        except Exception as e:
-            self.report_status("error", "failed", str(e))
-            try:
-                self.cleanup(keep_video, output_name)
-            except:
-                pass
-            raise
+    def iter_file_segments(self, model_obj, path: Path, language: Optional[str], info: dict,
+                           start_seconds: float = 0.0, on_window: Optional[Callable[[int], None]] = None):
+        """从 WAV 文件逐窗口读取并解码，片段时间戳相对于 start_seconds；每个窗口解码后回调 on_window(结束采样)"""
+        prompt = None
+        base = int(start_seconds * SAMPLE_RATE)
+        for pos, window in iter_wav_windows(path, start_seconds):
+            result = self.transcribe(model_obj, window, language, initial_prompt=prompt)
+            language = language or result.get("language")
+            info["language"] = language
+            shift = (pos - base) / SAMPLE_RATE
+            for seg in result.get("segments", []):
+                seg["start"] = round(seg.get("start", 0) + shift, 3)
+                seg["end"] = round(seg.get("end", 0) + shift, 3)
+                yield seg
+            prompt = (result.get("text") or "")[-200:] or prompt
+            if on_window is not None:
+                on_window(pos + len(window))
 
 
-def parse_arguments(args_list):
-    """解析参数，支持多种格式"""
-    parser = argparse.ArgumentParser(
-        description="B站视频转录工具",
-        formatter_class=argparse.RawDescriptionHelpFormatter
-    )
-    parser.add_argument("url", help="B站视频URL或BV号")
-    parser.add_argument("--model", default="small", choices=["tiny", "base", "small", "medium", "large"])
-    parser.add_argument("--language", default="zh", help="视频语言 (默认: zh)")
-    parser.add_argument("--output-dir", default="~/bili-transcribe-output", help="输出目录")
-    parser.add_argument("--keep-video", action="store_true", help="保留视频文件")
-    parser.add_argument("--skip-download", action="store_true", help="跳过下载")
-    parser.add_argument("--task-mode", action="store_true", help="Task模式：输出JSON状态到stderr，最终结果到stdout")
+class WhisperBackend(ASRBackend):
+    """openai-whisper（PyTorch）"""
 
-    return parser.parse_args(args_list)
+    name = "whisper"
+    module = "whisper"
+    package = "openai-whisper"
+    install_hint = "pip install openai-whisper"
+    valid_models = ["tiny", "base", "small", "medium", "large", "large-v1", "large-v2", "large-v3", "turbo"]
+    # int8：CPU 上对线性层做动态量化
+    compute_types = ["fp32", "int8"]
+    share_mode = "fork"
+    supports_batch = True
 
+    def precision(self, device: Optional[str], compute_type: Optional[str]) -> str:
+        return compute_type or "fp32"
 
-def main():
-    """主入口"""
-    args = parse_arguments(sys.argv[1:])
+    def load(self, model: str, device: Optional[str] = None, compute_type: Optional[str] = None,
+             threads: Optional[int] = None, workers: int = 1):
+        import torch
+        import whisper
+
+        if threads:
+            torch.set_num_threads(threads)
+        if self.precision(device, compute_type) != "int8":
+            return whisper.load_model(model, device=device)
+        if device not in (None, "cpu"):
+            raise ValueError("int8 动态量化仅支持 CPU")
+        model_obj = whisper.load_model(model, device="cpu")
+        # whisper 自己的 Linear 子类只是在 forward 中转换精度，换回 nn.Linear 才能被动态量化替换
+        for module in model_obj.modules():
+            if isinstance(module, torch.nn.Linear):
+                module.__class__ = torch.nn.Linear
+        return torch.quantization.quantize_dynamic(model_obj, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+    def set_threads(self, threads: int):
+        import torch
+
+        torch.set_num_threads(threads)
+
+    def decode_batch(self, model_obj, windows: list, language: Optional[str]) -> List[dict]:
+        """各窗口补齐到 30 秒后堆叠成一批 mel 频谱，编码器和（贪心）解码器一次处理整批
+
+        与 model.transcribe() 相比没有温度回退，窗口之间也不传递提示文本；每个窗口返回压缩比，
+        由 BatchDecoder 把疑似重复输出的窗口交给 transcribe() 重新解码。
+        """
+        import torch
+        import whisper
+        from whisper.tokenizer import get_tokenizer
+
+        mels = torch.stack([whisper.log_mel_spectrogram(whisper.pad_or_trim(window), model_obj.dims.n_mels,
+                                                        device=model_obj.device)
+                            for window in windows])
+        options = whisper.DecodingOptions(language=language or None, fp16=False, without_timestamps=False)
+        results = whisper.decode(model_obj, mels, options)
+
+        decoded = []
+        for window, res in zip(windows, results):
+            segments = []
+            # 与 transcribe() 相同的静音判定：无语音概率高且置信度低的窗口不输出
+            if not (res.no_speech_prob > 0.6 and res.avg_logprob < -1.0):
+                tokenizer = get_tokenizer(model_obj.is_multilingual, num_languages=model_obj.num_languages,
+                                          language=res.language, task="transcribe")
+                segments = self._timestamp_segments(tokenizer, res, len(window) / SAMPLE_RATE)
+            decoded.append({"segments": segments, "language": res.language,
+                            "compression_ratio": res.compression_ratio})
+        return decoded
+
+    @staticmethod
+    def _timestamp_segments(tokenizer, res, duration: float) -> List[dict]:
+        """按时间戳 token 把解码结果切成片段：<|t0|> 文本 <|t1|><|t1|> 文本 <|t2|> ..."""
+        segments = []
+        start, text_tokens = 0.0, []
+
+        def close(end: float):
+            text = tokenizer.decode(text_tokens)
+            if text.strip():
+                segments.append({"start": round(min(start, duration), 3), "end": round(min(end, duration), 3),
+                                 "text": text, "tokens": list(text_tokens), "avg_logprob": res.avg_logprob,
+                                 "no_speech_prob": res.no_speech_prob})
+
+        for token in res.tokens:
+            if token >= tokenizer.timestamp_begin:
+                time_ = (token - tokenizer.timestamp_begin) * 0.02
+                if text_tokens:
+                    close(time_)
+                    text_tokens = []
+                start = time_
+            else:
+                text_tokens.append(token)
+        if text_tokens:
+            close(duration)
+        return segments
+
+    def transcribe(self, model_obj, audio, language: Optional[str],
+                   initial_prompt: Optional[str] = None) -> dict:
+        result = model_obj.transcribe(audio, language=language or None, verbose=False, fp16=False,
+                                      beam_size=ASR_BEAM_SIZE, best_of=ASR_BEAM_SIZE,
+                                      initial_prompt=initial_prompt)
+        result["duration"] = len(audio) / SAMPLE_RATE
+        return result
+
+
+class FasterWhisperBackend(ASRBackend):
+    """faster-whisper（CTranslate2），CPU 上可用 int8 量化推理"""
+
+    name = "faster-whisper"
+    module = "faster_whisper"
+    package = "faster-whisper"
+    install_hint = "pip install faster-whisper"
+    valid_models = ["tiny", "base", "small", "medium", "large", "large-v1", "large-v2", "large-v3",
+                    "large-v3-turbo", "turbo", "distil-large-v2", "distil-large-v3",
+                    "tiny.en", "base.en", "small.en", "medium.en"]
+    compute_types = ["int8", "int8_float16", "int8_float32", "float16", "float32"]
+    share_mode = "threads"
+
+    SEGMENT_FIELDS = ("id", "seek", "start", "end", "text", "tokens", "temperature",
+                      "avg_logprob", "compression_ratio", "no_speech_prob")
+
+    def precision(self, device: Optional[str], compute_type: Optional[str]) -> str:
+        return compute_type or "int8"
+
+    def load(self, model: str, device: Optional[str] = None, compute_type: Optional[str] = None,
+             threads: Optional[int] = None, workers: int = 1):
+        from faster_whisper import WhisperModel
+
+        # num_workers > 1 时同一份权重可供多个线程同时推理
+        return WhisperModel(model, device=device or "auto",
+                            compute_type=self.precision(device, compute_type),
+                            cpu_threads=threads or 0, num_workers=workers)
+
+    def _segment_dict(self, seg) -> dict:
+        item = {field: getattr(seg, field, None) for field in self.SEGMENT_FIELDS}
+        item["tokens"] = list(item["tokens"] or [])
+        return item
+
+    def transcribe(self, model_obj, audio, language: Optional[str],
+                   initial_prompt: Optional[str] = None) -> dict:
+        segments_iter, info = model_obj.transcribe(audio, language=language or None, beam_size=ASR_BEAM_SIZE,
+                                                   best_of=ASR_BEAM_SIZE, initial_prompt=initial_prompt)
+        segments = [self._segment_dict(seg) for seg in segments_iter]
+        return {
+            "text": "".join(seg["text"] for seg in segments),
+            "segments": segments,
+            "language": info.language,
+            "duration": info.duration,
+        }
+
+    def iter_segments(self, model_obj, audio, language: Optional[str], info: dict,
+                      window_seconds: float = 30):
+        """faster-whisper 本身就是逐段产出的生成器"""
+        segments_iter, meta = model_obj.transcribe(audio, language=language or None, beam_size=ASR_BEAM_SIZE,
+                                                   best_of=ASR_BEAM_SIZE)
+        info["language"] = meta.language
+        for seg in segments_iter:
+            yield self._segment_dict(seg)
+
+
+ASR_BACKENDS: Dict[str, ASRBackend] = {
+    backend.name: backend for backend in (WhisperBackend(), FasterWhisperBackend())
+}
+
+
+# 分块转录工作进程内的状态，只在工作进程中写入；父进程通过进程池的 initargs 传入模型，不经过这里
+_CHUNK_WORKER: Dict[str, object] = {}
+
+# 共享权重时 fork 工作进程前要 gc.freeze()，这是进程级状态：多个任务（queue/serve 的并发线程）
+# 同时做分块转录时，用这把锁串行化 freeze → fork → unfreeze，避免一个任务在另一个 fork 途中 unfreeze
+_FORK_LOCK = threading.Lock()
+
+
+@contextmanager
+def fork_section(enabled: bool = True):
+    """fork 共享权重的工作进程期间冻结垃圾回收
+
+    gc.freeze() 把现有对象移出回收器的扫描范围，避免回收器改写对象头导致 fork 后的页面被复制；
+    fork 完成后立即 unfreeze。
+    """
+    if not enabled:
+        yield
+        return
+    import gc
+
+    with _FORK_LOCK:
+        gc.collect()
+        gc.freeze()
+        try:
+            yield
+        finally:
+            gc.unfreeze()
+
+
+def _chunk_worker_init(backend: str, model: str, device: Optional[str], compute_type: Optional[str],
+                       core_sets, model_obj=None):
+    """工作进程初始化：绑定CPU核心、限制线程数并加载模型（model_obj 为 fork 时从父进程继承的模型）
+
+    线程数通过后端的 set_threads/load 设置：fork 出的进程已导入 torch，此时再设置
+    OMP_NUM_THREADS 等环境变量不会生效。
+    """
+    cores = None
+    try:
+        cores = core_sets.get_nowait()
+    except Exception:
+        pass
+    if cores and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            pass
+
+    _CHUNK_WORKER["backend"] = ASR_BACKENDS[backend]
+    if model_obj is not None:
+        _CHUNK_WORKER["model"] = model_obj
+        if cores:
+            ASR_BACKENDS[backend].set_threads(len(cores))
+        return
+    _CHUNK_WORKER["model"] = ASR_BACKENDS[backend].load(model, device, compute_type,
+                                                        threads=len(cores) if cores else None)
+
+
+def _chunk_worker_transcribe(index: int, audio, language: Optional[str]):
+    """工作进程中转录一个分块，同时返回本进程的内存构成"""
+    result = _CHUNK_WORKER["backend"].transcribe(_CHUNK_WORKER["model"], audio, language)
+    return index, result, dict(memory_breakdown() or {}, pid=os.getpid())
+
+
+def partition_cores(workers: int) -> List[List[int]]:
+    """把可用CPU核心均分给各工作进程"""
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    workers = max(1, min(workers, len(cores)))
+    size = len(cores) // workers
+    return [cores[i * size:(i + 1) * size] for i in range(workers)]
+
+
+# 当前线程正在计量的阶段（见 JobMetrics.stage / record_metric）
+_METRICS_LOCAL = threading.local()
+
+
+def peak_rss_mb() -> Optional[float]:
+    """本进程的峰值RSS（MB）"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+    except Exception:
+        return None
+
+
+def current_rss_mb() -> Optional[float]:
+    """本进程当前的RSS（MB），仅 Linux"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+# 阶段峰值内存的采样间隔（秒）
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+class RSSSampler:
+    """阶段峰值内存：后台线程周期读取本进程 VmRSS，更新所有正在计量的阶段的峰值
+
+    VmHWM/ru_maxrss 是整个进程生命周期的峰值，模型加载之后每个阶段都报同一个数；
+    用 clear_refs 重置是进程级的，批量模式下并发的阶段会互相清零。采样只看阶段期间的 RSS，
+    短于采样间隔的尖峰可能漏掉。没有 /proc 的平台返回 None，由调用方退回进程峰值。
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._peaks: Dict[int, float] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> Optional[int]:
+        """开始计量一个阶段，返回令牌"""
+        rss = current_rss_mb()
+        if rss is None:
+            return None
+        with self._lock:
+            token = self._next
+            self._next += 1
+            self._peaks[token] = rss
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+                self._thread.start()
+        return token
+
+    def stop(self, token: int) -> float:
+        """结束计量，返回阶段期间的峰值RSS（MB）"""
+        rss = current_rss_mb() or 0.0
+        with self._lock:
+            return max(self._peaks.pop(token, 0.0), rss)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            rss = current_rss_mb() or 0.0
+            with self._lock:
+                if not self._peaks:
+                    # 没有阶段在计量时退出，下次 start() 再启动
+                    self._thread = None
+                    return
+                for token, peak in self._peaks.items():
+                    if rss > peak:
+                        self._peaks[token] = rss
+
+
+RSS_SAMPLER = RSSSampler()
+
+
+def children_peak_rss_mb() -> Optional[float]:
+    """已结束子进程（ffmpeg、BBDown）中最大的峰值RSS（MB）"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+    except Exception:
+        return None
+
+
+def memory_breakdown(pid="self") -> Optional[dict]:
+    """进程的内存构成（MB，读取 /proc/<pid>/smaps_rollup）：独占内存 uss 与和其他进程共享的 shared
+
+    共享权重的多个 worker 之间，权重所在页面计入 shared，只有 uss 是每多一个 worker 真正增加的内存。
+    """
+    fields: Dict[str, float] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                parts = value.split()
+                if len(parts) == 2 and parts[1] == "kB":
+                    fields[name] = int(parts[0]) / 1024
+    except (OSError, ValueError):
+        return None
+    return {
+        "rss_mb": round(fields.get("Rss", 0), 1),
+        "pss_mb": round(fields.get("Pss", 0), 1),
+        "uss_mb": round(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0), 1),
+        "shared_mb": round(fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0), 1),
+    }
+
+
+def children_cpu_seconds() -> float:
+    """已结束子进程累计的 CPU 时间（用户态 + 内核态）"""
+    try:
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+    except Exception:
+        return 0.0
+
+
+def record_metric(**values):
+    """向当前线程正在计量的阶段写入指标（子进程退出码、输入输出字节等），不在计量中时忽略"""
+    stage = getattr(_METRICS_LOCAL, "stage", None)
+    if stage is not None:
+        stage.update(values)
+
+
+class JobMetrics:
+    """单个任务的阶段计量：单调时钟耗时、CPU时间、峰值RSS（含子进程）、输入/输出字节和转录实时率
+
+    CPU 时间和峰值RSS都是整个进程的，批量模式下多个任务并发时会互相叠加；
+    峰值RSS只统计阶段期间（见 RSSSampler）。
+    """
+
+    def __init__(self, job: str):
+        self.job = job
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.stages: Dict[str, dict] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        metrics: dict = {}
+        start = time.perf_counter()
+        cpu = time.process_time()
+        children_cpu = children_cpu_seconds()
+        rss_token = RSS_SAMPLER.start()
+        previous = getattr(_METRICS_LOCAL, "stage", None)
+        _METRICS_LOCAL.stage = metrics
+        try:
+            yield metrics
+        finally:
+            _METRICS_LOCAL.stage = previous
+            seconds = time.perf_counter() - start
+            metrics.update({
+                "seconds": round(seconds, 4),
+                "cpu_seconds": round(time.process_time() - cpu, 4),
+                "children_cpu_seconds": round(children_cpu_seconds() - children_cpu, 4),
+                "peak_rss_mb": round((RSS_SAMPLER.stop(rss_token) if rss_token is not None
+                                      else peak_rss_mb()) or 0, 1),
+                "children_peak_rss_mb": round(children_peak_rss_mb() or 0, 1),
+            })
+            if metrics.get("audio_seconds") and name == "transcribe":
+                metrics["rtf"] = round(seconds / metrics["audio_seconds"], 4)
+            self.stages[name] = metrics
+
+    def summary(self, success: bool, error: Optional[str] = None) -> dict:
+        total = time.perf_counter() - self._start
+        audio = next((m["audio_seconds"] for m in self.stages.values() if m.get("audio_seconds")), None)
+        data = {
+            "job": self.job,
+            "success": success,
+            "started": self.started,
+            "seconds": round(total, 4),
+            "audio_seconds": audio,
+            "rtf": round(total / audio, 4) if audio else None,
+            "stages": self.stages,
+        }
+        if error:
+            data["error"] = error
+        return data
+
+
+class PrometheusTextfile:
+    """以 Prometheus textfile collector 格式导出指标，每个任务结束后原子重写文件
+
+    计数类指标在进程内累计（服务/批量模式下跨任务），last_* 为最近一个任务的值。
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path).expanduser()
+        self._lock = threading.Lock()
+        self.jobs: Dict[str, int] = {}
+        self.stage_seconds: Dict[str, float] = {}
+        self.stage_cpu: Dict[str, float] = {}
+        self.stage_runs: Dict[str, int] = {}
+        self.stage_bytes: Dict[tuple, int] = {}
+        self.audio_seconds = 0.0
+        self.last: Dict[str, float] = {}
+        self.last_stage: Dict[str, dict] = {}
+
+    def observe(self, summary: dict):
+        with self._lock:
+            status = "success" if summary["success"] else "failed"
+            self.jobs[status] = self.jobs.get(status, 0) + 1
+            self.audio_seconds += summary.get("audio_seconds") or 0
+            for stage, m in summary["stages"].items():
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0) + m["seconds"]
+                self.stage_cpu[stage] = self.stage_cpu.get(stage, 0) + m["cpu_seconds"] + m["children_cpu_seconds"]
+                self.stage_runs[stage] = self.stage_runs.get(stage, 0) + 1
+                for direction in ("input", "output"):
+                    key = (stage, direction)
+                    self.stage_bytes[key] = self.stage_bytes.get(key, 0) + m.get(f"{direction}_bytes", 0)
+                self.last_stage[stage] = m
+            self.last = {"seconds": summary["seconds"], "rtf": summary.get("rtf") or 0,
+                         "timestamp": time.time(), "success": 1 if summary["success"] else 0}
+            text = self.render()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            TranscriptCache._atomic_write(self.path, text.encode("utf-8"))
+        except OSError as e:
+            print(f"⚠️  写入 Prometheus 指标失败: {e}")
+
+    def render(self) -> str:
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[tuple]):
+            lines.append(f"# HELP bili_transcribe_{name} {help_text}")
+            lines.append(f"# TYPE bili_transcribe_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"bili_transcribe_{name}{{{label_text}}} {value}" if label_text
+                             else f"bili_transcribe_{name} {value}")
+
+        metric("jobs_total", "counter", "Finished jobs by status.",
+               [({"status": k}, v) for k, v in sorted(self.jobs.items())])
+        metric("audio_seconds_total", "counter", "Seconds of audio processed.", [({}, round(self.audio_seconds, 3))])
+        metric("stage_seconds_total", "counter", "Wall time spent per stage.",
+               [({"stage": k}, round(v, 4)) for k, v in sorted(self.stage_seconds.items())])
+        metric("stage_cpu_seconds_total", "counter", "CPU time per stage, including child processes.",
+               [({"stage": k}, round(v, 4)) for k, v in sorted(self.stage_cpu.items())])
+        metric("stage_runs_total", "counter", "Stage executions.",
+               [({"stage": k}, v) for k, v in sorted(self.stage_runs.items())])
+        metric("stage_bytes_total", "counter", "Bytes read or written per stage.",
+               [({"stage": s, "direction": d}, v) for (s, d), v in sorted(self.stage_bytes.items())])
+        metric("last_stage_seconds", "gauge", "Wall time of each stage in the most recent job.",
+               [({"stage": k}, m["seconds"]) for k, m in sorted(self.last_stage.items())])
+        metric("last_stage_peak_rss_bytes", "gauge", "Peak RSS at the end of each stage in the most recent job.",
+               [({"stage": k, "process": "self"}, int(m["peak_rss_mb"] * 1048576))
+                for k, m in sorted(self.last_stage.items())] +
+               [({"stage": k, "process": "children"}, int(m["children_peak_rss_mb"] * 1048576))
+                for k, m in sorted(self.last_stage.items())])
+        metric("last_job_seconds", "gauge", "Wall time of the most recent job.", [({}, self.last.get("seconds", 0))])
+        metric("last_job_rtf", "gauge", "Real-time factor of the most recent job.", [({}, self.last.get("rtf", 0))])
+        metric("last_job_success", "gauge", "Whether the most recent job succeeded.",
+               [({}, self.last.get("success", 0))])
+        metric("last_job_timestamp_seconds", "gauge", "Completion time of the most recent job.",
+               [({}, round(self.last.get("timestamp", 0), 3))])
+        return "\n".join(lines) + "\n"
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_edge_digest(path: Path, block_size: int = 1 << 20) -> str:
+    """文件大小 + 首尾各一块内容的 SHA-256：校验 GB 级媒体文件是否被替换或截断，而不必读完整个文件"""
+    digest = hashlib.sha256()
+    size = path.stat().st_size
+    digest.update(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(block_size))
+        if size > block_size:
+            f.seek(max(block_size, size - block_size))
+            digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+
+class TranscriptCache:
+    """转录结果缓存 - 内容寻址存储
+
+    结果以内容哈希保存在 blobs/ 下，refs/ 下的引用文件把查找键映射到结果：
+    - 视频键：(bvid, page, model, language, 后端版本)，命中可跳过下载、提取和转录
+    - 音频键：(解码后音频哈希, model, language, 后端版本)，同一内容换了URL也能命中
+    另外保存单个视频的分P列表（分P键），全部命中缓存的重跑无需再用 BBDown 枚举分P。
+    按总大小和最久未访问时间淘汰。
+    """
+
+    def __init__(self, root: Path, max_size_mb: float = 2048, max_age_days: float = 90,
+                 read_enabled: bool = True):
+        self.root = Path(root)
+        self.blobs_dir = self.root / "blobs"
+        self.refs_dir = self.root / "refs"
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.refs_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        # --refresh 时只写不读
+        self.read_enabled = read_enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(parts) -> str:
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def video_key(cls, bvid: str, page: int, model: str, language: str, backend: str) -> str:
+        return "video-" + cls._digest([bvid, page, model, language or "", backend])
+
+    @classmethod
+    def audio_key(cls, audio_hash: str, model: str, language: str, backend: str) -> str:
+        return "audio-" + cls._digest([audio_hash, model, language or "", backend])
+
+    @classmethod
+    def pages_key(cls, bvid: str) -> str:
+        return "pages-" + cls._digest([bvid])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def _read(self, key: str) -> Optional[dict]:
+        if not self.read_enabled:
+            return None
+        ref = self.refs_dir / f"{key}.ref"
+        try:
+            blob = self.blobs_dir / f"{ref.read_text(encoding='utf-8').strip()}.json"
+            with open(blob, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            os.utime(blob)
+            return result
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError):
+            # 损坏的缓存条目直接丢弃
+            ref.unlink(missing_ok=True)
+        return None
+
+    def get_pages(self, bvid: str, max_age: float) -> Optional[dict]:
+        """查找 max_age 秒内枚举过的分P列表（不计入转录结果的命中统计）"""
+        info = self._read(self.pages_key(bvid))
+        if info is None or time.time() - info.get("fetched_at", 0) > max_age:
+            return None
+        return info
+
+    def put_pages(self, bvid: str, info: dict):
+        self.put(dict(info, fetched_at=time.time()), [self.pages_key(bvid)])
+
+    def get(self, key: str) -> Optional[dict]:
+        """查找缓存，命中时刷新访问时间"""
+        result = self._read(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def put(self, result: dict, keys: List[str]) -> str:
+        """写入结果并为每个查找键建立引用，返回内容哈希"""
+        payload = json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        blob_id = hashlib.sha256(payload).hexdigest()
+        blob = self.blobs_dir / f"{blob_id}.json"
+        if blob.exists():
+            os.utime(blob)
+        else:
+            self._atomic_write(blob, payload)
+        for key in keys:
+            self._atomic_write(self.refs_dir / f"{key}.ref", blob_id.encode("utf-8"))
+        self.evict()
+        return blob_id
+
+    @staticmethod
+    def _atomic_write(path: Path, data: bytes):
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def evict(self) -> int:
+        """按访问时间和总大小淘汰缓存，返回淘汰条目数"""
+        now = time.time()
+        entries = []
+        for blob in self.blobs_dir.glob("*.json"):
+            try:
+                st = blob.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, blob))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        removed = set()
+        for mtime, size, blob in entries:
+            if total <= self.max_size and now - mtime <= self.max_age:
+                continue
+            blob.unlink(missing_ok=True)
+            removed.add(blob.stem)
+            total -= size
+
+        if removed:
+            for ref in self.refs_dir.glob("*.ref"):
+                try:
+                    if ref.read_text(encoding="utf-8").strip() in removed:
+                        ref.unlink(missing_ok=True)
+                except FileNotFoundError:
+                    pass
+            with self._lock:
+                self.evictions += len(removed)
+        return len(removed)
+
+
+class FileLock:
+    """进程间排他锁（fcntl.flock）
+
+    锁跟随打开的文件描述符，同一进程内的两个 FileLock 对象之间同样互斥；
+    可在一个线程获取、另一个线程释放。没有 fcntl 的平台上不加锁。
+    释放时删除锁文件，锁文件不会越积越多；等待者拿到锁后若发现锁文件已被删除或替换，
+    说明锁已被前一个持有者释放，重新打开再加锁。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        try:
+            import fcntl
+        except ImportError:
+            return True
+        while True:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            except BaseException:
+                os.close(fd)
+                raise
+            try:
+                current = os.stat(self.path)
+                held = os.fstat(fd)
+                if (current.st_dev, current.st_ino) == (held.st_dev, held.st_ino):
+                    break
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            # 持有锁时删除锁文件，再关闭描述符释放锁
+            try:
+                self.path.unlink()
+            except OSError:
+                pass
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        if self._fd is None:
+            self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def link_or_copy(src: Path, dst: Path):
+    """硬链接到目标位置（跨文件系统时复制），先写临时名再原子替换"""
+    tmp = dst.with_name(f".tmp-{os.getpid()}-{threading.get_ident()}-{dst.name}")
+    try:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+class MediaCache:
+    """下载媒体的共享缓存 - 以 (来源, 分P, 质量) 为键，在多个任务、进程之间复用
+
+    每个键一把文件锁：同一媒体同一时间只有一个任务在下载，其他任务等锁后直接命中。
+    任务通过硬链接使用缓存文件，条目被淘汰不影响进行中的任务。
+    按最近使用时间（mtime）做LRU淘汰，总大小不超过预算，正被加锁的条目跳过；
+    命中、未命中和淘汰次数累计在 stats.json 中。
+    """
+
+    def __init__(self, root: Path, max_size_mb: float = 4096):
+        self.root = Path(root)
+        self.locks_dir = self.root / "locks"
+        self.locks_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.stats_path = self.root / "stats.json"
+
+    @staticmethod
+    def key(source: str, page: int, quality: str) -> str:
+        return hashlib.sha256(json.dumps([source, page, quality]).encode("utf-8")).hexdigest()[:32]
+
+    def lock(self, key: str) -> FileLock:
+        return FileLock(self.locks_dir / f"{key}.lock")
+
+    def _entry(self, key: str) -> Optional[Path]:
+        for path in self.root.glob(f"{key}.*"):
+            return path
+        return None
+
+    def _count(self, **deltas):
+        with FileLock(self.root / "stats.lock"):
+            try:
+                counts = json.loads(self.stats_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                counts = {}
+            for name, delta in deltas.items():
+                counts[name] = counts.get(name, 0) + delta
+            TranscriptCache._atomic_write(self.stats_path, json.dumps(counts).encode("utf-8"))
+
+    def get(self, keys: List[str]) -> Optional[Path]:
+        """按顺序查找各个键，命中时刷新使用时间"""
+        for key in keys:
+            path = self._entry(key)
+            if path is None:
+                continue
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                continue
+            self._count(hits=1)
+            return path
+        self._count(misses=1)
+        return None
+
+    def put(self, key: str, path: Path) -> Path:
+        """把下载好的文件放入缓存（调用方持有该键的锁）"""
+        cached = self.root / f"{key}{path.suffix}"
+        link_or_copy(path, cached)
+        self.evict()
+        return cached
+
+    def evict(self) -> int:
+        """超出预算时从最久未使用的条目开始删除，返回淘汰条目数"""
+        entries = []
+        for path in self.root.iterdir():
+            if path.is_file() and len(path.stem) == 32 and not path.name.startswith("."):
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            lock = self.lock(path.stem)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                path.unlink(missing_ok=True)
+            finally:
+                lock.release()
+            total -= size
+            removed += 1
+        if removed:
+            self._count(evictions=removed)
+        return removed
+
+    def stats(self) -> dict:
+        entries = [p for p in self.root.iterdir() if p.is_file() and len(p.stem) == 32]
+        try:
+            counts = json.loads(self.stats_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            counts = {}
+        return {
+            "entries": len(entries),
+            "size_bytes": sum(p.stat().st_size for p in entries if p.exists()),
+            "max_size_bytes": self.max_size,
+            "hits": counts.get("hits", 0),
+            "misses": counts.get("misses", 0),
+            "evictions": counts.get("evictions", 0),
+        }
+
+
+class JobQueue:
+    """基于 SQLite 的本地持久化任务队列（queue 子命令）
+
+    worker（同一进程的多个线程或多个进程）通过 BEGIN IMMEDIATE 事务原子地认领任务，
+    认领时写入租约到期时间并在运行中定期续约；worker 崩溃后，任务在租约过期时会被重新认领。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        url TEXT NOT NULL,
+        options TEXT NOT NULL DEFAULT '{}',
+        priority INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        available_at REAL NOT NULL,
+        lease_expires REAL,
+        worker TEXT,
+        stage TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        files TEXT,
+        metrics TEXT,
+        error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority DESC, available_at, id);
+    """
+
+    # 这些阶段失败多为网络问题，按指数退避重试；其他阶段的失败直接记为失败
+    RETRY_STAGES = ("download", "list_pages")
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(self.SCHEMA)
+
+    @contextmanager
+    def _db(self, immediate: bool = False):
+        import sqlite3
+
+        db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            if immediate:
+                db.execute("BEGIN IMMEDIATE")
+            yield db
+            if immediate:
+                db.execute("COMMIT")
+        except BaseException:
+            if immediate and db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def enqueue(self, url: str, options: dict, priority: int = 0, max_attempts: int = 3) -> int:
+        now = time.time()
+        with self._db() as db:
+            cursor = db.execute(
+                "INSERT INTO jobs (url, options, priority, max_attempts, available_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, json.dumps(options, ensure_ascii=False), priority, max(1, max_attempts), now, now))
+            return cursor.lastrowid
+
+    def claim(self, worker: str, lease_seconds: float) -> Optional[dict]:
+        """原子地认领一个任务：先回收租约过期的任务，再按优先级取最早可运行的"""
+        now = time.time()
+        with self._db(immediate=True) as db:
+            db.execute("UPDATE jobs SET status = 'failed', finished_at = ?, lease_expires = NULL, "
+                       "error = '租约超时且已达最大尝试次数' "
+                       "WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts", (now, now))
+            db.execute("UPDATE jobs SET status = 'queued', worker = NULL, lease_expires = NULL, "
+                       "error = '租约超时，已重新排队' "
+                       "WHERE status = 'running' AND lease_expires < ?", (now,))
+            row = db.execute("SELECT * FROM jobs WHERE status = 'queued' AND available_at <= ? "
+                             "ORDER BY priority DESC, available_at, id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET status = 'running', worker = ?, lease_expires = ?, "
+                       "attempts = attempts + 1, started_at = ?, stage = NULL WHERE id = ?",
+                       (worker, now + lease_seconds, now, row["id"]))
+        job = dict(row, status="running", worker=worker)
+        job["attempts"] += 1
+        job["options"] = json.loads(job["options"])
+        return job
+
+    def heartbeat(self, job_id: int, worker: str, lease_seconds: float, stage: Optional[str] = None) -> bool:
+        """续约（并记录当前阶段）；任务已不归该 worker 所有时返回 False"""
+        with self._db() as db:
+            cursor = db.execute("UPDATE jobs SET lease_expires = ?, stage = COALESCE(?, stage) "
+                                "WHERE id = ? AND worker = ? AND status = 'running'",
+                                (time.time() + lease_seconds, stage, job_id, worker))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker: str, files: dict, metrics: dict):
+        with self._db() as db:
+            db.execute("UPDATE jobs SET status = 'done', finished_at = ?, lease_expires = NULL, error = NULL, "
+                       "files = ?, metrics = ? WHERE id = ? AND worker = ?",
+                       (time.time(), json.dumps(files, ensure_ascii=False),
+                        json.dumps(metrics, ensure_ascii=False), job_id, worker))
+
+    def fail(self, job_id: int, worker: str, error: str, stage: Optional[str], metrics: dict,
+             retry_delay: Optional[float] = None):
+        """记录失败；给出 retry_delay 时重新排队，延迟后才可再次认领"""
+        now = time.time()
+        with self._db() as db:
+            if retry_delay is not None:
+                db.execute("UPDATE jobs SET status = 'queued', worker = NULL, lease_expires = NULL, "
+                           "available_at = ?, stage = ?, error = ?, metrics = ? WHERE id = ? AND worker = ?",
+                           (now + retry_delay, stage, error, json.dumps(metrics, ensure_ascii=False),
+                            job_id, worker))
+            else:
+                db.execute("UPDATE jobs SET status = 'failed', finished_at = ?, lease_expires = NULL, "
+                           "stage = ?, error = ?, metrics = ? WHERE id = ? AND worker = ?",
+                           (now, stage, error, json.dumps(metrics, ensure_ascii=False), job_id, worker))
+
+    def release(self, job_id: int, worker: str):
+        """worker 正常退出时把未完成的任务放回队列"""
+        with self._db() as db:
+            db.execute("UPDATE jobs SET status = 'queued', worker = NULL, lease_expires = NULL, "
+                       "error = 'worker 退出，已重新排队' WHERE id = ? AND worker = ? AND status = 'running'",
+                       (job_id, worker))
+
+    def pending(self) -> int:
+        """排队中（含等待重试）和运行中的任务数"""
+        with self._db() as db:
+            return db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+
+    def stats(self, recent: int = 10) -> dict:
+        """队列深度、吞吐和运行中的任务"""
+        now = time.time()
+        with self._db() as db:
+            counts = {row["status"]: row["n"] for row in
+                      db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+            delayed = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND available_at > ?",
+                                 (now,)).fetchone()[0]
+            throughput = {}
+            for label, window in (("1h", 3600), ("24h", 86400)):
+                row = db.execute("SELECT COUNT(*) AS n, AVG(finished_at - started_at) AS avg FROM jobs "
+                                 "WHERE status = 'done' AND finished_at >= ?", (now - window,)).fetchone()
+                throughput[label] = {"done": row["n"], "avg_seconds": round(row["avg"], 1) if row["avg"] else None}
+            running = [dict(row) for row in db.execute(
+                "SELECT id, url, worker, stage, attempts, started_at, lease_expires FROM jobs "
+                "WHERE status = 'running' ORDER BY started_at")]
+            jobs = [dict(row) for row in db.execute(
+                "SELECT id, url, priority, status, attempts, stage, error, created_at, finished_at FROM jobs "
+                "ORDER BY id DESC LIMIT ?", (recent,))]
+        return {
+            "db": str(self.path),
+            "counts": {k: counts.get(k, 0) for k in ("queued", "running", "done", "failed")},
+            "delayed": delayed,
+            "throughput": throughput,
+            "running": running,
+            "recent": jobs,
+        }
+
+
+# 检索分词：中日韩文字切成重叠的二字组，字母数字按单词
+CJK_RANGES = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+SEARCH_TOKEN_RE = re.compile(f"([{CJK_RANGES}]+)|[^\\W_{CJK_RANGES}]+")
+
+
+def search_tokens(text: str) -> List[str]:
+    """把文本切成检索词：中文按二字组（单字保留原样），其他按单词并转为小写"""
+    tokens = []
+    for match in SEARCH_TOKEN_RE.finditer(text.lower()):
+        run = match.group(0)
+        if match.group(1) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def bilibili_link(bvid: Optional[str], page: Optional[int], start: float) -> Optional[str]:
+    """带时间戳的播放链接；合集/空间条目没有BV号时返回 None"""
+    if not bvid or not bvid.startswith("BV"):
+        return None
+    page_arg = f"p={page}&" if page and page > 1 else ""
+    return f"https://www.bilibili.com/video/{bvid}?{page_arg}t={int(start)}"
+
+
+class TranscriptIndex:
+    """转录全文检索 - SQLite FTS5 索引，每个片段一行，命中带时间戳
+
+    FTS5 的 unicode61 分词不切分中文，入库前先把文本切成二字组（见 search_tokens），
+    查询词同样切分后按短语匹配，保证字符连续。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS transcripts (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        bvid TEXT,
+        page INTEGER,
+        title TEXT,
+        path TEXT,
+        mtime REAL,
+        indexed_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS segments (
+        id INTEGER PRIMARY KEY,
+        transcript_id INTEGER NOT NULL,
+        start REAL NOT NULL,
+        end REAL NOT NULL,
+        text TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS segments_transcript ON segments (transcript_id);
+    CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5 (tokens, tokenize = 'unicode61');
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(self.SCHEMA)
+
+    @contextmanager
+    def _db(self, immediate: bool = False):
+        import sqlite3
+
+        db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            if immediate:
+                db.execute("BEGIN IMMEDIATE")
+            yield db
+            if immediate:
+                db.execute("COMMIT")
+        except BaseException:
+            if immediate and db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _delete(db, transcript_id: int):
+        db.execute("DELETE FROM segments_fts WHERE rowid IN (SELECT id FROM segments WHERE transcript_id = ?)",
+                   (transcript_id,))
+        db.execute("DELETE FROM segments WHERE transcript_id = ?", (transcript_id,))
+
+    def add(self, name: str, segments: List[dict], bvid: Optional[str] = None, page: Optional[int] = None,
+            title: Optional[str] = None, path: Optional[Path] = None) -> int:
+        """写入（或替换）一个转录的全部片段，返回写入的片段数"""
+        rows = [(float(seg.get("start", 0)), float(seg.get("end", 0)), seg.get("text", "").strip())
+                for seg in segments]
+        rows = [row for row in rows if row[2]]
+        mtime = path.stat().st_mtime if path is not None and path.exists() else None
+        with self._db(immediate=True) as db:
+            old = db.execute("SELECT id FROM transcripts WHERE name = ?", (name,)).fetchone()
+            if old is not None:
+                self._delete(db, old["id"])
+                db.execute("DELETE FROM transcripts WHERE id = ?", (old["id"],))
+            transcript_id = db.execute(
+                "INSERT INTO transcripts (name, bvid, page, title, path, mtime, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, bvid, page, title, str(path) if path else None, mtime, time.time())).lastrowid
+            for start, end, text in rows:
+                segment_id = db.execute("INSERT INTO segments (transcript_id, start, end, text) VALUES (?, ?, ?, ?)",
+                                        (transcript_id, start, end, text)).lastrowid
+                db.execute("INSERT INTO segments_fts (rowid, tokens) VALUES (?, ?)",
+                           (segment_id, " ".join(search_tokens(text))))
+        return len(rows)
+
+    def indexed_mtimes(self) -> Dict[str, Optional[float]]:
+        """已索引的转录及其源文件修改时间，用于增量重建"""
+        with self._db() as db:
+            return {row["name"]: row["mtime"] for row in db.execute("SELECT name, mtime FROM transcripts")}
+
+    def clear(self):
+        with self._db(immediate=True) as db:
+            db.execute("DELETE FROM segments_fts")
+            db.execute("DELETE FROM segments")
+            db.execute("DELETE FROM transcripts")
+
+    def search(self, query: str, limit: int = 20, bvid: Optional[str] = None) -> List[dict]:
+        """按相关度返回命中片段；查询中以空格分隔的多个词需同时出现"""
+        phrases, singles = [], []
+        for term in query.split():
+            tokens = search_tokens(term)
+            if len(tokens) == 1 and len(tokens[0]) == 1 and not tokens[0].isascii():
+                # 单个汉字不在二字组索引中，退回子串匹配
+                singles.append(tokens[0])
+            elif tokens:
+                phrases.append('"' + " ".join(tokens) + '"')
+        if not phrases and not singles:
+            return []
+
+        where, params = [], []
+        if phrases:
+            where.append("segments_fts MATCH ?")
+            params.append(" AND ".join(phrases))
+        for char in singles:
+            where.append("s.text LIKE ?")
+            params.append(f"%{char}%")
+        if bvid:
+            where.append("t.bvid = ?")
+            params.append(bvid)
+        rank = "bm25(segments_fts)" if phrases else "NULL"
+        fts_join = "JOIN segments_fts ON segments_fts.rowid = s.id " if phrases else ""
+        sql = (f"SELECT t.name, t.bvid, t.page, t.title, t.path, s.start, s.end, s.text, {rank} AS score "
+               f"FROM segments s {fts_join}JOIN transcripts t ON t.id = s.transcript_id "
+               f"WHERE {' AND '.join(where)} ORDER BY score, s.transcript_id, s.start LIMIT ?")
+        with self._db() as db:
+            rows = [dict(row) for row in db.execute(sql, params + [limit])]
+        for row in rows:
+            row["url"] = bilibili_link(row["bvid"], row["page"], row["start"])
+        return rows
+
+    def stats(self) -> dict:
+        with self._db() as db:
+            transcripts = db.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+            segments = db.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+        return {"db": str(self.path), "transcripts": transcripts, "segments": segments,
+                "size_bytes": self.path.stat().st_size if self.path.exists() else 0}
+
+
+# 声学指纹：只取开头一段和几个采样窗口，帧长 1024 / 帧移 512（32ms）
+FINGERPRINT_HEAD_SECONDS = 180
+FINGERPRINT_SAMPLE_POINTS = (0.25, 0.5, 0.75)
+FINGERPRINT_SAMPLE_SECONDS = 20
+FINGERPRINT_FFT = 1024
+FINGERPRINT_HOP = 512
+# 频谱峰值取自这些频带（FFT bin 边界，约 0.3–4kHz）；每个锚点与其后 FANOUT 个峰值配对
+FINGERPRINT_BANDS = (10, 20, 40, 80, 160, 256)
+FINGERPRINT_FANOUT = 5
+FINGERPRINT_MAX_DT = 63
+# 复用转录时允许开头多出的、没有对应文本的时长（片头等），秒
+FINGERPRINT_GAP_SECONDS = 10
+# 判定为同一内容的最少命中哈希数（短音频的得分波动大）；得分阈值见 --dedup-threshold
+FINGERPRINT_MIN_HITS = 20
+
+
+def audio_fingerprint(path: Path):
+    """计算音频的频谱峰值哈希指纹，返回 (哈希数组, 帧序号数组, 时长秒数)
+
+    在每个频带中取逐帧最大值，只保留在前后若干帧内也是最大值且高于平均能量的峰值；
+    每个峰值与其后的几个峰值配对，(频率1, 频率2, 帧间隔) 组成哈希，帧序号是锚点在原音频中的位置。
+    """
+    import numpy as np
+
+    with wave.open(str(path), "rb") as wf:
+        if wf.getframerate() != SAMPLE_RATE or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise ValueError(f"音频格式不是 16kHz 单声道 s16: {path}")
+        total = wf.getnframes()
+        regions = [(0, min(total, FINGERPRINT_HEAD_SECONDS * SAMPLE_RATE))]
+        if total > 2 * FINGERPRINT_HEAD_SECONDS * SAMPLE_RATE:
+            size = FINGERPRINT_SAMPLE_SECONDS * SAMPLE_RATE
+            regions += [(int(total * p), min(total, int(total * p) + size)) for p in FINGERPRINT_SAMPLE_POINTS]
+        hashes, times = [], []
+        for start, end in regions:
+            wf.setpos(start)
+            audio = np.frombuffer(wf.readframes(end - start), dtype=np.int16).astype(np.float32) / 32768.0
+            h, t = _spectral_peak_hashes(audio)
+            hashes.append(h)
+            times.append(t + start // FINGERPRINT_HOP)
+    return np.concatenate(hashes), np.concatenate(times), total / SAMPLE_RATE
+
+
+def _spectral_peak_hashes(audio):
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    empty = np.zeros(0, dtype=np.int64)
+    if len(audio) < FINGERPRINT_FFT * 4:
+        return empty, empty
+    frames = sliding_window_view(audio, FINGERPRINT_FFT)[::FINGERPRINT_HOP]
+    spectrum = np.log1p(np.abs(np.fft.rfft(frames * np.hanning(FINGERPRINT_FFT), axis=1)))
+
+    peaks_t, peaks_f = [], []
+    floor = spectrum[:, FINGERPRINT_BANDS[0]:FINGERPRINT_BANDS[-1]].mean()
+    for lo, hi in zip(FINGERPRINT_BANDS, FINGERPRINT_BANDS[1:]):
+        band = spectrum[:, lo:hi]
+        freq = band.argmax(axis=1)
+        value = band.max(axis=1)
+        # 前后各 5 帧内的最大值，用于筛出时间上的局部峰
+        padded = np.pad(value, 5, mode="edge")
+        local_max = sliding_window_view(padded, 11).max(axis=1)
+        keep = np.nonzero((value >= local_max) & (value > floor))[0]
+        peaks_t.append(keep)
+        peaks_f.append(freq[keep] + lo)
+    t = np.concatenate(peaks_t)
+    f = np.concatenate(peaks_f)
+    order = np.lexsort((f, t))
+    t, f = t[order], f[order]
+
+    hashes, anchors = [], []
+    for k in range(1, FINGERPRINT_FANOUT + 1):
+        dt = t[k:] - t[:-k]
+        ok = (dt > 0) & (dt <= FINGERPRINT_MAX_DT)
+        hashes.append((f[:-k][ok].astype(np.int64) << 20) | (f[k:][ok].astype(np.int64) << 10) | dt[ok])
+        anchors.append(t[:-k][ok])
+    return np.concatenate(hashes), np.concatenate(anchors).astype(np.int64)
+
+
+class FingerprintIndex:
+    """声学指纹索引 - SQLite 中保存已转录音频的指纹和转录结果，用于识别搬运/镜像视频并复用转录
+
+    匹配时统计共同哈希的时间差（查询帧 - 索引帧），同一时间差上的命中数占查询哈希数的比例即为得分，
+    该时间差就是两段音频的偏移。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS items (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        bvid TEXT,
+        page INTEGER,
+        language TEXT,
+        model TEXT,
+        signature TEXT,
+        duration REAL NOT NULL,
+        result BLOB NOT NULL,
+        added_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS hashes (
+        hash INTEGER NOT NULL,
+        item_id INTEGER NOT NULL,
+        frame INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS hashes_hash ON hashes (hash);
+    CREATE INDEX IF NOT EXISTS hashes_item ON hashes (item_id);
+    """
+
+    def __init__(self, path: Path, threshold: float = 0.03, read_enabled: bool = True):
+        self.path = path
+        self.threshold = threshold
+        # --refresh 时只写入不匹配
+        self.read_enabled = read_enabled
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(self.SCHEMA)
+
+    @contextmanager
+    def _db(self, immediate: bool = False):
+        import sqlite3
+
+        db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            if immediate:
+                db.execute("BEGIN IMMEDIATE")
+            yield db
+            if immediate:
+                db.execute("COMMIT")
+        except BaseException:
+            if immediate and db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def add(self, name: str, fingerprint: tuple, result: dict, language: Optional[str], model: str,
+            signature: str, bvid: Optional[str] = None, page: Optional[int] = None):
+        """写入（或替换）一个已转录音频的指纹和结果；signature 为转录器的 asr_signature()"""
+        import zlib
+
+        hashes, frames, duration = fingerprint
+        blob = zlib.compress(json.dumps(result, ensure_ascii=False).encode("utf-8"))
+        with self._db(immediate=True) as db:
+            old = db.execute("SELECT id FROM items WHERE name = ?", (name,)).fetchone()
+            if old is not None:
+                db.execute("DELETE FROM hashes WHERE item_id = ?", (old["id"],))
+                db.execute("DELETE FROM items WHERE id = ?", (old["id"],))
+            item_id = db.execute(
+                "INSERT INTO items (name, bvid, page, language, model, signature, duration, result, added_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, bvid, page, language or None, model, signature, duration, blob, time.time())).lastrowid
+            db.executemany("INSERT INTO hashes (hash, item_id, frame) VALUES (?, ?, ?)",
+                           ((int(h), item_id, int(t)) for h, t in zip(hashes, frames)))
+
+    def match(self, fingerprint: tuple, language: Optional[str], model: str, signature: str,
+              exclude: Optional[str] = None) -> Optional[dict]:
+        """查找同一语言、模型和转录器签名（后端版本、精度、语音检测，与转录缓存的键一致）中
+        得分最高且不低于阈值的已转录音频，返回 {name, bvid, page, model, score, offset, result}
+
+        offset 为秒数：本音频中的时间 = 索引音频中的时间 + offset。
+        """
+        import numpy as np
+        import zlib
+
+        hashes, frames, duration = fingerprint
+        if not self.read_enabled or len(hashes) == 0:
+            return None
+        with self._db() as db:
+            db.execute("CREATE TEMP TABLE query (hash INTEGER NOT NULL, frame INTEGER NOT NULL)")
+            db.execute("BEGIN")
+            db.executemany("INSERT INTO query VALUES (?, ?)", ((int(h), int(t)) for h, t in zip(hashes, frames)))
+            db.execute("COMMIT")
+            rows = db.execute(
+                "SELECT h.item_id, q.frame - h.frame FROM query q JOIN hashes h ON h.hash = q.hash "
+                "JOIN items i ON i.id = h.item_id WHERE (i.language IS ? OR i.language = ?) AND i.name IS NOT ? "
+                "AND i.model = ? AND i.signature = ?",
+                (language or None, language or None, exclude, model, signature)).fetchall()
+            if not rows:
+                return None
+            pairs = np.array(rows, dtype=np.int64)
+            # 一次排序统计所有 (条目, 时间差) 的命中数：键 = 条目序号 * span + 时间差，
+            # 时间差平移到 [1, span - 2]，±1 帧的相邻键不会跨到别的条目
+            items, inverse = np.unique(pairs[:, 0], return_inverse=True)
+            base = int(pairs[:, 1].min()) - 1
+            span = int(pairs[:, 1].max()) - base + 2
+            keys, counts = np.unique(inverse.astype(np.int64) * span + (pairs[:, 1] - base), return_counts=True)
+
+            def hits_at(query):
+                pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+                return np.where(keys[pos] == query, counts[pos], 0)
+
+            # 允许 ±1 帧的抖动：候选位置包括命中键的相邻位置
+            candidates = np.unique(np.concatenate([keys - 1, keys, keys + 1]))
+            around = np.stack([hits_at(candidates - 1), hits_at(candidates), hits_at(candidates + 1)])
+            smoothed = around.sum(axis=0)
+            peak = int(smoothed.argmax())
+            hits = int(smoothed[peak])
+            score = min(1.0, hits / len(hashes))
+            key = int(candidates[peak]) + int(around[:, peak].argmax()) - 1
+            item_id, delta = int(items[key // span]), key % span + base
+            if score < self.threshold or hits < FINGERPRINT_MIN_HITS:
+                return None
+            row = db.execute("SELECT * FROM items WHERE id = ?", (item_id,)).fetchone()
+        offset = delta * FINGERPRINT_HOP / SAMPLE_RATE
+        # 索引音频的转录需要覆盖本音频：开头最多缺 FINGERPRINT_GAP_SECONDS，结尾同样
+        gap = max(FINGERPRINT_GAP_SECONDS, duration * 0.02)
+        if offset > gap or offset + row["duration"] < duration - gap:
+            return None
+        return {"name": row["name"], "bvid": row["bvid"], "page": row["page"], "model": row["model"],
+                "score": round(score, 4), "offset": round(offset, 3),
+                "result": json.loads(zlib.decompress(row["result"]).decode("utf-8"))}
+
+
+def shift_result(result: dict, offset: float, duration: float) -> dict:
+    """把复用的转录结果平移 offset 秒，去掉落在本音频时长之外的片段"""
+    segments = []
+    for seg in result.get("segments", []):
+        start, end = seg.get("start", 0) + offset, seg.get("end", 0) + offset
+        if end <= 0 or start >= duration:
+            continue
+        segments.append(dict(seg, id=len(segments), start=round(max(0.0, start), 3),
+                             end=round(min(duration, end), 3)))
+    return dict(result, text="".join(seg.get("text", "") for seg in segments), segments=segments,
+                duration=duration)
+
+
+# 可选的输出格式；json 需要完整结果，流式输出时只写其余格式
+OUTPUT_FORMATS = ("txt", "json", "jsonl", "srt", "md")
+DEFAULT_FORMATS = ("txt", "json", "srt", "md")
+STREAMABLE_FORMATS = ("txt", "jsonl", "srt", "md")
+# 只压缩机器读取的格式，字幕和文本保持可直接打开
+COMPRESSIBLE_FORMATS = ("json", "jsonl")
+COMPRESS_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+# 输出文件的写缓冲，网络存储上减少小块写入
+WRITE_BUFFER = 1 << 20
+
+
+def parse_formats(text: str) -> List[str]:
+    """解析 --formats，例如 txt,srt,jsonl"""
+    formats = []
+    for fmt in text.lower().replace(" ", "").split(","):
+        if not fmt:
+            continue
+        if fmt not in OUTPUT_FORMATS:
+            raise argparse.ArgumentTypeError(f"未知的输出格式: {fmt}（可选: {', '.join(OUTPUT_FORMATS)}）")
+        if fmt not in formats:
+            formats.append(fmt)
+    if not formats:
+        raise argparse.ArgumentTypeError("至少需要一种输出格式")
+    return formats
+
+
+def parse_compress(text: str) -> str:
+    """解析 --compress；zstd 依赖可选的 zstandard 包"""
+    if text not in COMPRESS_SUFFIXES:
+        raise argparse.ArgumentTypeError(f"未知的压缩方式: {text}（可选: {', '.join(COMPRESS_SUFFIXES)}）")
+    if text == "zstd" and importlib.util.find_spec("zstandard") is None:
+        raise argparse.ArgumentTypeError("zstd 压缩需要安装 zstandard: pip install zstandard")
+    return text
+
+
+class TranscriptWriter:
+    """多格式输出 - 一次遍历片段，同时写出所有选中的格式
+
+    JSON 的片段默认去掉 tokens（include_tokens 时保留）并紧凑输出；JSONL 每行一个精简片段。
+    stream=True 时直接写最终文件并在每个片段后刷新（流式输出）；
+    否则使用大缓冲写临时文件，全部写完后再原子地改名，读者不会看到写了一半的文件。
+    """
+
+    def __init__(self, transcriber: "BiliTranscriber", output_name: str, video_info: dict = None,
+                 formats=None, duration: Optional[float] = None, stream: bool = False,
+                 item: Optional[str] = None):
+        self.transcriber = transcriber
+        self.item = item
+        self.stream = stream
+        self.include_tokens = transcriber.include_tokens
+        self.video_info = video_info
+        self.count = 0
+        self.segments: List[dict] = []
+        formats = list(formats or transcriber.formats)
+        # 流式输出不压缩，写到一半也能直接查看
+        compress = None if stream else transcriber.compress
+        self.paths = {fmt: transcriber.output_path(output_name, fmt, compress) for fmt in formats}
+        self.partial = {fmt: path if stream else path.with_name(f".part-{path.name}")
+                        for fmt, path in self.paths.items()}
+        transcriber.output_dir.mkdir(parents=True, exist_ok=True)
+        self.files = {}
+        try:
+            for fmt, path in self.partial.items():
+                if fmt != "json":
+                    self.files[fmt] = open_output(path, compress if fmt in COMPRESSIBLE_FORMATS else None,
+                                                  1 if stream else WRITE_BUFFER)
+        except BaseException:
+            self.discard()
+            raise
+
+        if "txt" in self.files and video_info:
+            self.files["txt"].write(f"标题: {video_info.get('title', '未知')}\n"
+                                    f"UP主: {video_info.get('up', '未知')}\n"
+                                    f"BV号: {video_info.get('bvid', '未知')}\n" + "=" * 50 + "\n\n")
+        if "md" in self.files:
+            md = self.files["md"]
+            md.write(f"# {video_info.get('title', '视频转录') if video_info else '视频转录'}\n\n")
+            if video_info:
+                md.write(f"- **UP主**: {video_info.get('up', '未知')}\n")
+                md.write(f"- **BV号**: {video_info.get('bvid', '未知')}\n")
+                if duration is not None:
+                    md.write(f"- **时长**: {transcriber.format_duration(duration)}\n")
+                md.write("\n")
+            md.write("## 逐字稿\n\n")
+        self._flush()
+
+    def _flush(self):
+        if self.stream:
+            for f in self.files.values():
+                f.flush()
+
+    def __call__(self, seg: dict):
+        """写入一个片段；流式输出时在Task模式下以NDJSON事件输出"""
+        self.count += 1
+        raw = seg.get("text", "")
+        text = raw.strip()
+        start, end = seg.get("start", 0), seg.get("end", 0)
+        record = {"id": seg.get("id", self.count - 1), "start": round(start, 3), "end": round(end, 3), "text": text}
+        if self.include_tokens and "tokens" in seg:
+            record["tokens"] = seg["tokens"]
+
+        files = self.files
+        if "txt" in files:
+            files["txt"].write(raw)
+        if "srt" in files or "md" in files:
+            begin = self.transcriber.format_time(start)
+            if "srt" in files:
+                files["srt"].write(f"{self.count}\n{begin} --> {self.transcriber.format_time(end)}\n{text}\n\n")
+            if "md" in files:
+                files["md"].write(f"**[{begin}]** {text}\n\n")
+        if "jsonl" in files:
+            files["jsonl"].write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        if "json" in self.paths:
+            self.segments.append(seg if self.include_tokens else {k: v for k, v in seg.items() if k != "tokens"})
+        self._flush()
+
+        if self.stream:
+            data = dict(record, item=self.item) if self.item else record
+            self.transcriber.report_status("transcribe", "segment", text, data)
+
+    def write_result(self, result: dict) -> Dict[str, Path]:
+        """一次写出完整结果的所有格式，返回各格式的文件路径"""
+        try:
+            segments = result.get("segments", [])
+            for seg in segments:
+                self(seg)
+            if "txt" in self.files and not segments:
+                self.files["txt"].write(result.get("text", ""))
+            if "json" in self.paths:
+                with open_output(self.partial["json"], self.transcriber.compress, WRITE_BUFFER) as f:
+                    # 附带视频信息，之后可从 JSON 重建检索索引
+                    data = dict(result, segments=self.segments, video=self.video_info) if self.video_info \
+                        else dict(result, segments=self.segments)
+                    json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            self.close()
+        except BaseException:
+            self.discard()
+            raise
+        for fmt, path in self.paths.items():
+            if self.partial[fmt] != path:
+                os.replace(self.partial[fmt], path)
+        return dict(self.paths)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+    def discard(self):
+        """出错时关闭并删除未完成的临时文件"""
+        self.close()
+        for fmt, path in self.partial.items():
+            if path != self.paths[fmt]:
+                path.unlink(missing_ok=True)
+
+
+def open_input(path: Path):
+    """按扩展名打开（可能压缩的）文本输出文件"""
+    if path.suffix == ".gz":
+        import gzip
+
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.suffix == ".zst":
+        import io
+        import zstandard
+
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def open_output(path: Path, compress: Optional[str] = None, buffering: int = -1):
+    """打开文本输出文件，可选 gzip / zstd 压缩"""
+    if compress == "gzip":
+        import gzip
+
+        return gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+    if compress == "zstd":
+        import io
+        import zstandard
+
+        raw = zstandard.ZstdCompressor(level=3).stream_writer(open(path, "wb"))
+        return io.TextIOWrapper(raw, encoding="utf-8", write_through=False)
+    return open(path, "w", encoding="utf-8", buffering=buffering)
+
+
+class SegmentCheckpoint:
+    """转录进度检查点 - 已解码的片段逐行追加到JSONL，重跑时从最后一个片段的结束位置继续"""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def load(self) -> List[dict]:
+        segments = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        segments.append(json.loads(line))
+                    except ValueError:
+                        # 被中断时最后一行可能只写了一半
+                        break
+        except FileNotFoundError:
+            pass
+        return segments
+
+    def append(self, seg: dict):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(seg, ensure_ascii=False) + "\n")
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
+
+class JobManifest:
+    """任务检查点清单 - 记录每个阶段的完成情况、产物路径、大小、修改时间和首尾块摘要
+
+    重跑同一任务时校验清单中的产物，从第一个未完成（或产物已失效）的阶段继续。
+    大小和修改时间都未变时直接认为有效；修改时间变了才读取首尾块比对摘要，不对整个文件求哈希。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.stages: Dict[str, dict] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.stages = json.load(f).get("stages", {})
+        except (FileNotFoundError, ValueError):
+            pass
+        self.segments = SegmentCheckpoint(path.with_suffix(".segments.jsonl"))
+
+    def _save(self):
+        data = json.dumps({"stages": self.stages, "updated": time.time()}, ensure_ascii=False, indent=2)
+        TranscriptCache._atomic_write(self.path, data.encode("utf-8"))
+
+    def artifact(self, stage: str, params: dict) -> Optional[Path]:
+        """返回已完成阶段的产物；参数不一致、文件缺失或校验和不符时返回 None"""
+        entry = self.stages.get(stage)
+        if not entry or entry.get("params") != params:
+            return None
+        path = Path(entry["path"])
+        try:
+            stat = path.stat()
+            if stat.st_size != entry["size"]:
+                return None
+            if stat.st_mtime_ns != entry.get("mtime_ns") and file_edge_digest(path) != entry.get("digest"):
+                return None
+        except OSError:
+            return None
+        return path
+
+    def complete(self, stage: str, artifact: Path, params: dict):
+        """记录阶段完成"""
+        stat = artifact.stat()
+        self.stages[stage] = {
+            "path": str(artifact),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "digest": file_edge_digest(artifact),
+            "params": params,
+            "completed_at": time.time(),
+        }
+        self._save()
+
+    def segment_checkpoint(self, params: dict) -> SegmentCheckpoint:
+        """转录进度检查点；转录参数变化时丢弃旧进度"""
+        if self.stages.get("transcribe_progress", {}).get("params") != params:
+            self.segments.remove()
+            self.stages["transcribe_progress"] = {"params": params}
+            self._save()
+        return self.segments
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+        self.segments.remove()
+
+
+class ToolPathCache:
+    """外部工具路径的磁盘缓存
+
+    PATH 变化，或 PATH / 常见安装目录中任一目录的修改时间变化（有文件增删）时整体失效；
+    缓存的路径不再可执行时单独失效。
+    """
+
+    def __init__(self, path: Path, extra_dirs: List[str]):
+        self.path = path
+        self.signature = self._signature(extra_dirs)
+        self.tools: Dict[str, Optional[str]] = {}
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if data.get("signature") == self.signature:
+                self.tools = data.get("tools", {})
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def _signature(extra_dirs: List[str]) -> dict:
+        env_path = os.environ.get("PATH", "")
+        mtimes = {}
+        for d in env_path.split(os.pathsep) + list(extra_dirs):
+            try:
+                mtimes[d] = os.stat(d).st_mtime_ns
+            except OSError:
+                mtimes[d] = None
+        return {"PATH": env_path, "mtimes": mtimes}
+
+    def get(self, cmd: str):
+        """返回 (是否命中, 路径)；路径为 None 表示上次未找到"""
+        if cmd not in self.tools:
+            return False, None
+        path = self.tools[cmd]
+        if path is not None and not (os.path.isfile(path) and os.access(path, os.X_OK)):
+            return False, None
+        return True, path
+
+    def put(self, cmd: str, path: Optional[str]):
+        self.tools[cmd] = path
+        data = json.dumps({"signature": self.signature, "tools": self.tools}, ensure_ascii=False)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            TranscriptCache._atomic_write(self.path, data.encode("utf-8"))
+        except OSError:
+            pass
+
+
+class ModelCache:
+    """已加载模型的LRU缓存 - 以 (model, device, precision) 为键，避免每个任务重复加载模型
+
+    每个条目带一把锁：同一个模型对象同一时间只允许一个转录在使用。
+    加载在全局锁之外进行，加载一个大模型时其他模型的命中不受阻塞；同一个键同时只加载一次。
+    """
+
+    def __init__(self, max_models: int = 2):
+        self.max_models = max(1, max_models)
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, loader: Callable[[], object]) -> dict:
+        """获取模型条目，未命中时调用 loader 加载并按LRU淘汰"""
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = {"model": None, "lock": threading.Lock(), "hits": 0, "loading": threading.Event()}
+                    self._entries[key] = entry
+                    break
+                loading = entry.get("loading")
+                if loading is None:
+                    self._entries.move_to_end(key)
+                    entry["hits"] += 1
+                    return entry
+            # 其他线程正在加载同一个模型：等它完成（加载失败时条目被移除，重新尝试）
+            loading.wait()
+
+        print(f"📦 加载模型: {'/'.join(str(k) for k in key)}")
+        loading = entry["loading"]
+        try:
+            model = loader()
+        except BaseException:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            loading.set()
+            raise
+        with self._lock:
+            entry["model"] = model
+            del entry["loading"]
+            self._evict(keep=key)
+        loading.set()
+        return entry
+
+    def _evict(self, keep: tuple):
+        """按LRU淘汰超出上限的模型；刚加载的、正在加载或正在使用（锁被持有）的条目跳过，待下次再淘汰"""
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_models:
+                return
+            entry = self._entries[key]
+            if key == keep or "loading" in entry or entry["lock"].locked():
+                continue
+            del self._entries[key]
+            print(f"♻️  卸载模型: {'/'.join(str(k) for k in key)}")
+
+    def keys(self) -> List[tuple]:
+        with self._lock:
+            return [key for key, entry in self._entries.items() if "loading" not in entry]
+
+
+# --model auto 的候选模型（按准确度从低到高）及相对 small 的计算量估计，
+# 某个模型在本机还没有实测值时，用已测模型的 RTF 按此比例外推
+AUTO_MODEL_COST = {"tiny": 0.15, "base": 0.3, "small": 1.0, "medium": 2.8, "turbo": 1.6, "large-v3": 5.5}
+# 本机没有任何实测值时，先用该模型解码一小段音频做校准
+AUTO_CALIBRATION_MODEL = "small"
+AUTO_CALIBRATION_SECONDS = 30
+# 预计 RTF 需低于目标的这个比例，给波动留余量
+AUTO_HEADROOM = 0.85
+
+
+class RTFCalibration:
+    """每台主机上各模型实测实时率（RTF = 解码耗时 / 音频时长）的缓存，供 --model auto 选模型
+
+    以 (主机, CPU, 后端, 设备, 精度, 线程数) 区分环境；每次正常转录后按指数移动平均更新。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def environment(backend: ASRBackend, device: Optional[str], compute_type: Optional[str],
+                    threads: Optional[int]) -> str:
+        import platform
+
+        return "|".join([socket.gethostname(), platform.machine(), str(os.cpu_count()), backend.name,
+                         device or "auto", backend.precision(device, compute_type), str(threads or 0)])
+
+    def _load(self) -> dict:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def measured(self, env: str) -> Dict[str, float]:
+        return {model: entry["rtf"] for model, entry in self._load().get(env, {}).items()}
+
+    def record(self, env: str, model: str, rtf: float, weight: float = 0.3):
+        """记录一次实测值（与已有值做指数移动平均）"""
+        with self._lock, FileLock(self.path.with_suffix(".lock")):
+            data = self._load()
+            entry = data.setdefault(env, {}).get(model)
+            if entry is not None:
+                rtf = entry["rtf"] * (1 - weight) + rtf * weight
+            data[env][model] = {"rtf": round(rtf, 4), "samples": (entry or {}).get("samples", 0) + 1,
+                                "updated": time.time()}
+            TranscriptCache._atomic_write(self.path, json.dumps(data, indent=2).encode("utf-8"))
+
+    @staticmethod
+    def estimate(measured: Dict[str, float], model: str) -> Optional[float]:
+        """模型的预计 RTF：有实测值直接用，否则由计算量最接近的已测模型外推"""
+        if model in measured:
+            return measured[model]
+        known = [m for m in measured if m in AUTO_MODEL_COST]
+        if not known or model not in AUTO_MODEL_COST:
+            return None
+        ref = min(known, key=lambda m: abs(AUTO_MODEL_COST[m] - AUTO_MODEL_COST[model]))
+        return measured[ref] * AUTO_MODEL_COST[model] / AUTO_MODEL_COST[ref]
+
+
+def partition_threads(concurrency: int) -> int:
+    """同时转录 concurrency 个任务时，每个任务可用的推理线程数（均分CPU核心，避免互相争抢）"""
+    return len(partition_cores(concurrency)[0])
+
+
+# 批量解码的窗口：目标 20 秒，在前后 5 秒内找静音处切分，保证每个窗口不超过 Whisper 的 30 秒输入
+BATCH_WINDOW_SECONDS = 20
+BATCH_SEARCH_SECONDS = 5
+# 批量贪心解码的压缩比超过该值（与 transcribe() 的默认阈值相同）视为重复输出，该窗口改用 transcribe() 重新解码
+BATCH_COMPRESSION_RATIO_THRESHOLD = 2.4
+
+
+class BatchDecoder:
+    """跨任务的批量解码器：把多个音频（或同一长音频切出的多个窗口）的窗口凑成一批，一次前向推理
+
+    转录线程调用 transcribe() 提交窗口后等待结果；调度线程在凑满 max_batch 个窗口、
+    或最早的窗口已等待 max_wait 秒时发车。同一批的窗口使用相同的后端、精度、模型、语言和设备，
+    模型由提交窗口的转录器加载，因此一个解码器可以由 queue/serve 的所有任务共用。
+    """
+
+    def __init__(self, max_batch: int = 8, max_wait: float = 0.1):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self._pending: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        # 调度线程只保留最近使用的一个模型
+        self._entries: Dict[tuple, dict] = {}
+        self.batches = 0
+        self.windows = 0
+
+    def transcribe(self, transcriber: "BiliTranscriber", audio, model: str, language: Optional[str],
+                   device: Optional[str] = None) -> dict:
+        """切窗口、提交并等待整段音频的结果，片段时间戳换算回原音频"""
+        key = (transcriber.backend.name, transcriber.compute_type, model, device, language or None)
+        items = [{"key": key, "transcriber": transcriber, "audio": audio[start:end],
+                  "offset": start / SAMPLE_RATE, "queued": time.monotonic(), "done": threading.Event()}
+                 for start, end in split_on_silence(audio, BATCH_WINDOW_SECONDS, BATCH_SEARCH_SECONDS)]
+        print(f"   📦 批量解码: {len(items)} 个窗口（每批最多 {self.max_batch} 个，与其他任务合批）")
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="batch-decoder", daemon=True)
+                self._thread.start()
+            self._pending.extend(items)
+            self._cond.notify()
+        for item in items:
+            item["done"].wait()
+        for item in items:
+            if "error" in item:
+                raise item["error"]
+
+        segments = []
+        for item in items:
+            for seg in item["result"]["segments"]:
+                seg["id"] = len(segments)
+                seg["start"] = round(seg["start"] + item["offset"], 3)
+                seg["end"] = round(seg["end"] + item["offset"], 3)
+                segments.append(seg)
+        fallbacks = sum(1 for item in items if item.get("fallback"))
+        if fallbacks:
+            print(f"   🔁 {fallbacks} 个窗口压缩比超过 {BATCH_COMPRESSION_RATIO_THRESHOLD}，已逐个重新解码")
+        record_metric(batch_windows=len(items), batch_fallbacks=fallbacks)
+        return {
+            "text": "".join(seg["text"] for seg in segments),
+            "segments": segments,
+            "language": language or (items[0]["result"]["language"] if items else None),
+        }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = self._pending[0]["queued"] + self.max_wait
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                key = self._pending[0]["key"]
+                batch = [item for item in self._pending if item["key"] == key][:self.max_batch]
+                for item in batch:
+                    self._pending.remove(item)
+            self._decode(key, batch)
+
+    def _decode(self, key: tuple, batch: List[dict]):
+        _, _, model, device, language = key
+        transcriber = batch[0]["transcriber"]
+        backend = transcriber.backend
+        try:
+            entry = self._entries.get(key[:4])
+            if entry is None:
+                self._entries.clear()
+                entry = self._entries[key[:4]] = transcriber.load_model(model, device)
+            with entry["lock"]:
+                results = backend.decode_batch(entry["model"], [item["audio"] for item in batch], language)
+                for item, result in zip(batch, results):
+                    if result.get("compression_ratio", 0.0) > BATCH_COMPRESSION_RATIO_THRESHOLD:
+                        # 贪心解码陷入重复：用带温度回退的 transcribe() 单独解码这个窗口
+                        retry = backend.transcribe(entry["model"], item["audio"], language)
+                        result = {"segments": retry.get("segments", []),
+                                  "language": retry.get("language") or result["language"]}
+                        item["fallback"] = True
+                    item["result"] = result
+            self.batches += 1
+            self.windows += len(batch)
+        except Exception as e:
+            for item in batch:
+                item["error"] = e
+        finally:
+            for item in batch:
+                item["done"].set()
+
+
+# 缓存的单个视频分P列表的有效期（秒）：UP主可能追加分P，过期后重新枚举；--refresh 时总是重新枚举
+PAGE_LIST_MAX_AGE = 24 * 3600
+
+# BBDown --only-show-info 输出中的标题行与分P行，例如:
+# [2024-01-01 12:00:00.000] - 视频标题: xxx
+# [2024-01-01 12:00:00.000] - P1: [123456] [第一讲 绪论] [12m30s]
+PAGE_TITLE_RE = re.compile(r'(?:视频标题|合集标题|标题)[:：]\s*(.+?)\s*$')
+PAGE_LINE_RE = re.compile(r'P(\d+):\s*\[(\d+)\]\s*\[(.*)\]\s*\[([^\]]*)\]\s*$')
+
+
+# BBDown 进度条中的百分比和速度
+BBDOWN_PROGRESS_RE = re.compile(r'(\d{1,3}(?:\.\d+)?)%\s*(?:-\s*)?([\d.]+\s*[KMG]?B/s)?')
+# ffmpeg 输出中的输入总时长
+FFMPEG_DURATION_RE = re.compile(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)')
+
+
+def parse_page_list(text: str) -> dict:
+    """解析 BBDown --only-show-info 的输出，返回标题和分P列表"""
+    title = None
+    pages = []
+    seen = set()
+    for line in text.splitlines():
+        match = PAGE_LINE_RE.search(line)
+        if match:
+            page = int(match.group(1))
+            if page not in seen:
+                seen.add(page)
+                pages.append({"page": page, "cid": match.group(2),
+                              "title": match.group(3).strip(), "duration": match.group(4).strip()})
+            continue
+        match = PAGE_TITLE_RE.search(line)
+        if match and title is None:
+            title = match.group(1)
+    return {"title": title, "pages": pages}
+
+
+def select_pages(spec: Optional[str], available: List[int]) -> List[int]:
+    """按分P范围筛选：all、3、1-5,8、10-（到最后一P）"""
+    if not spec or spec.strip().lower() == "all":
+        return list(available)
+    wanted = set()
+    last = max(available) if available else 0
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                lo, hi = part.split("-", 1)
+                wanted.update(range(int(lo or 1), int(hi or last) + 1))
+            else:
+                wanted.add(int(part))
+        except ValueError:
+            raise ValueError(f"无效的分P范围: {spec}")
+    selected = [p for p in available if p in wanted]
+    if not selected:
+        raise ValueError(f"分P范围 {spec} 没有匹配的分P（共 {len(available)} P）")
+    return selected
+
+
+# 字幕策略：asr-only 总是语音识别；prefer 有所需语言的字幕时直接使用，跳过下载和转录；
+# compare 照常转录，并与现有字幕比较文本相似度
+SUBTITLE_POLICIES = ("asr-only", "prefer", "compare")
+SUBTITLE_EXTENSIONS = (".srt", ".json")
+# SRT 时间行，例如 00:01:02,500 --> 00:01:05,000
+SRT_TIME_RE = re.compile(r'(\d+):(\d{2}):(\d{2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{2}):(\d{2})[,.](\d{1,3})')
+SUBTITLE_TAG_RE = re.compile(r'<[^>]+>|\{\\[^}]*\}')
+# compare 策略按此时长的窗口逐段比较文本
+SUBTITLE_COMPARE_WINDOW = 60
+
+
+def parse_srt(text: str) -> List[dict]:
+    """解析 SRT 字幕为 [{"start", "end", "text"}, ...]"""
+    cues = []
+    for block in re.split(r'\n\s*\n', text.replace("\r\n", "\n").strip()):
+        lines = block.strip().split("\n")
+        for i, line in enumerate(lines):
+            match = SRT_TIME_RE.search(line)
+            if not match:
+                continue
+            g = match.groups()
+            start = int(g[0]) * 3600 + int(g[1]) * 60 + int(g[2]) + int(g[3].ljust(3, "0")) / 1000
+            end = int(g[4]) * 3600 + int(g[5]) * 60 + int(g[6]) + int(g[7].ljust(3, "0")) / 1000
+            content = " ".join(SUBTITLE_TAG_RE.sub("", l).strip() for l in lines[i + 1:])
+            if content.strip():
+                cues.append({"start": start, "end": end, "text": content.strip()})
+            break
+    return cues
+
+
+def parse_bcc(data: dict) -> List[dict]:
+    """解析B站 BCC（JSON）字幕：{"body": [{"from", "to", "content"}, ...]}"""
+    return [{"start": float(item["from"]), "end": float(item["to"]), "text": item["content"].strip()}
+            for item in data.get("body", []) if str(item.get("content", "")).strip()]
+
+
+def subtitle_language(path: Path) -> str:
+    """BBDown 字幕文件名中的语言代码：<输出名>.<语言>.srt，AI 字幕为 ai-zh 这样的代码"""
+    parts = path.name.split(".")
+    return parts[-2] if len(parts) > 2 else ""
+
+
+def pick_subtitle(files: List[Path], language: Optional[str]) -> Optional[Path]:
+    """挑选所需语言的字幕：UP主上传的 CC 字幕优先于 AI 字幕，SRT 优先于 JSON；未指定语言时任一字幕均可"""
+    wanted = (language or "").lower().split("-")[0]
+    candidates = []
+    for path in files:
+        code = subtitle_language(path).lower()
+        ai = code.startswith("ai-")
+        if wanted and code.removeprefix("ai-").split("-")[0] != wanted:
+            continue
+        candidates.append((ai, path.suffix.lower() != ".srt", path.name, path))
+    return min(candidates)[-1] if candidates else None
+
+
+def subtitle_result(cues: List[dict], language: Optional[str]) -> dict:
+    """把字幕条目转换成与转录结果结构相同的 dict（非CJK文本的片段和 Whisper 一样带前导空格）"""
+    segments = []
+    for cue in sorted(cues, key=lambda c: c["start"]):
+        text = cue["text"] if re.match(f"[{CJK_RANGES}]", cue["text"]) else " " + cue["text"]
+        segments.append({"id": len(segments), "start": round(cue["start"], 3), "end": round(cue["end"], 3),
+                         "text": text})
+    return {
+        "text": "".join(seg["text"] for seg in segments),
+        "segments": segments,
+        "language": language or None,
+        "duration": max((seg["end"] for seg in segments), default=0.0),
+    }
+
+
+def windowed_similarity(a: List[dict], b: List[dict], window: float = SUBTITLE_COMPARE_WINDOW) -> dict:
+    """按时间窗口比较两组片段的文本（忽略空白和标点），返回总体及最低窗口的相似度
+
+    逐窗口比较避免了对整篇长文本做二次方复杂度的匹配，也能定位出分歧较大的时间段。
+    """
+    import difflib
+
+    def bucket(segments: List[dict]) -> Dict[int, str]:
+        texts: Dict[int, List[str]] = {}
+        for seg in segments:
+            texts.setdefault(int(seg.get("start", 0) // window), []).append(seg.get("text", ""))
+        return {k: re.sub(r'[\W_]+', '', "".join(v)).lower() for k, v in texts.items()}
+
+    left, right = bucket(a), bucket(b)
+    matched = total = 0
+    windows = []
+    for key in sorted(set(left) | set(right)):
+        x, y = left.get(key, ""), right.get(key, "")
+        size = len(x) + len(y)
+        if not size:
+            continue
+        ratio = difflib.SequenceMatcher(None, x, y, autojunk=False).ratio()
+        matched += ratio * size
+        total += size
+        windows.append({"start": key * window, "similarity": round(ratio, 4)})
+    return {
+        "similarity": round(matched / total, 4) if total else 1.0,
+        "lowest": sorted(windows, key=lambda w: w["similarity"])[:3],
+    }
+
+
+class BiliTranscriber:
+    """B站视频转录器"""
+
+    COMMON_PATHS = [
+        "/usr/local/bin",
+        "/opt/homebrew/bin",
+        "/usr/bin",
+        "/bin",
+        str(Path.home() / "bin"),
+        str(Path.home() / ".local" / "bin"),
+        "/opt/bin",
+        "/usr/local/opt/bbdown/bin",  # Homebrew 可能的安装路径
+        str(Path.home() / ".dotnet" / "tools"),  # dotnet tools
+    ]
+
+    VIDEO_EXTENSIONS = ['.mp4', '.flv', '.mkv', '.m4v']
+    # BBDown --audio-only 的产物：通常是 m4a(aac)，无损/杜比音轨为 flac/ec3
+    AUDIO_EXTENSIONS = ['.m4a', '.aac', '.flac', '.ec3', '.eac3']
+    FORMAT_LABELS = {"txt": "文本", "json": "JSON", "jsonl": "JSONL", "srt": "SRT", "md": "Markdown"}
+
+    def __init__(self, output_dir: str = "~/bili-transcribe-output", task_mode: bool = False,
+                 model_cache: Optional[ModelCache] = None, result_cache: Optional[TranscriptCache] = None,
+                 asr_workers: int = 0, chunk_minutes: float = 5,
+                 vad: Optional[str] = None, vad_padding: float = 0.3,
+                 backend: str = "whisper", compute_type: Optional[str] = None,
+                 stream: bool = False, checkpoint: bool = True, max_parallel: int = 4,
+                 metrics_json: bool = False, prometheus: Optional[PrometheusTextfile] = None,
+                 formats=DEFAULT_FORMATS, include_tokens: bool = False, compress: Optional[str] = None,
+                 search_index: Optional[TranscriptIndex] = None, media_cache: Optional[MediaCache] = None,
+                 threads: Optional[int] = None, target_rtf: Optional[float] = None,
+                 deadline: Optional[float] = None, calibration: Optional[RTFCalibration] = None,
+                 subtitle_policy: str = "asr-only", share_weights: bool = False,
+                 batch_size: int = 0, batch_wait: float = 0.1, long_audio_minutes: Optional[float] = 60,
+                 fingerprint_index: Optional[FingerprintIndex] = None,
+                 batch_decoder: Optional[BatchDecoder] = None):
+        # 展开 ~ 为实际家目录路径
+        self.output_dir = Path(output_dir).expanduser().resolve()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        # 每个任务在 temp_dir/jobs/<输出名>/ 下有独立的工作目录
+        self.temp_dir = CACHE_DIR
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+        self.media_cache = media_cache
+        self._cmd_cache: Dict[str, Optional[str]] = {}
+        self.tool_cache = ToolPathCache(CACHE_DIR / "tool_paths.json", self.COMMON_PATHS)
+        self._dependencies_ok = False
+        self.task_mode = task_mode
+        self._status_lock = threading.Lock()
+        self.model_cache = model_cache
+        # 线程各自的模型缓存（批量流水线的每个转录线程各持一个模型），未设置时使用 model_cache
+        self._thread_state = threading.local()
+        self.result_cache = result_cache
+        # asr_workers > 1 时长音频切块后在进程池中并行转录
+        self.asr_workers = asr_workers
+        if chunk_minutes <= 0:
+            raise ValueError(f"分块时长必须为正数: {chunk_minutes}")
+        self.chunk_seconds = chunk_minutes * 60
+        # 分块转录的各 worker 共用一份模型权重
+        self.share_weights = share_weights
+        # 超过该时长的音频分窗从文件读取解码，峰值内存与时长无关（None、0 或负数表示关闭）
+        self.long_audio_seconds = long_audio_minutes * 60 if long_audio_minutes and long_audio_minutes > 0 else None
+        if backend not in ASR_BACKENDS:
+            raise ValueError(f"未知的语音识别后端: {backend}（可选: {', '.join(ASR_BACKENDS)}）")
+        self.backend = ASR_BACKENDS[backend]
+        self.backend.check_options(compute_type, batch_size)
+        self.compute_type = compute_type
+        # 跨任务批量解码：各转录线程的窗口凑批后一次推理（queue/serve 的各任务传入同一个解码器）
+        self.batch_decoder = None
+        if batch_size > 1:
+            self.batch_decoder = batch_decoder or BatchDecoder(batch_size, batch_wait)
+        # 推理线程数（并发任务之间均分CPU核心）
+        self.threads = threads
+        # --model auto：目标实时率 / 截止时间（秒），以及本机实测 RTF 缓存
+        self.target_rtf = target_rtf
+        self.deadline = deadline
+        self.calibration = calibration
+        if subtitle_policy not in SUBTITLE_POLICIES:
+            raise ValueError(f"未知的字幕策略: {subtitle_policy}（可选: {', '.join(SUBTITLE_POLICIES)}）")
+        self.subtitle_policy = subtitle_policy
+        # 边解码边写出片段（按约 30 秒窗口逐段解码，分块并行不生效）
+        self.stream = stream
+        if stream and asr_workers > 1:
+            print("⚠️  --stream 按窗口逐段解码，--asr-workers 将被忽略")
+        # 输出格式；JSON/JSONL 是否保留片段 tokens、是否压缩
+        self.formats = list(formats)
+        self.include_tokens = include_tokens
+        self.compress = compress
+        # 保存结果时把片段写入全文检索索引
+        self.search_index = search_index
+        # 声学指纹去重：内容相同的音频复用已有转录
+        self.fingerprint_index = fingerprint_index
+        # 阶段检查点：中断后重跑可从断点继续，失败时保留中间产物
+        self.checkpoint = checkpoint
+        # 转录前的语音检测：跳过静音和非语音片段
+        self.vad = vad
+        self.vad_padding = vad_padding
+        # 多分P/合集拆分后同时处理中的任务数上限
+        self.max_parallel = max_parallel
+        # 每个任务结束后写出 <output_name>.metrics.json；导出 Prometheus textfile
+        self.metrics_json = metrics_json
+        self.prometheus = prometheus
+        # 每个任务的下载字节数，键为 output_name
+        self.download_stats: Dict[str, int] = {}
+        # 流式输出已完整写出的文件（格式 -> 路径），键为 output_name，保存时不再重写
+        self.streamed_outputs: Dict[str, Dict[str, Path]] = {}
+        # 服务模式下用于把状态事件回传给客户端
+        self.status_callback: Optional[Callable[[dict], None]] = None
+
+    def report_status(self, stage: str, status: str, message: str = "", data: dict = None):
+        """在Task模式下报告状态到stderr"""
+        if not self.task_mode and not self.status_callback:
+            return
+        status_obj = {
+            "stage": stage,
+            "status": status,
+            "message": message
+        }
+        if data:
+            status_obj["data"] = data
+        if self.status_callback:
+            self.status_callback(status_obj)
+        if self.task_mode:
+            with self._status_lock:
+                print(json.dumps(status_obj, ensure_ascii=False), file=sys.stderr, flush=True)
+
+    def find_executable(self, cmd: str) -> Optional[str]:
+        """查找可执行文件 - 先查内存和磁盘缓存，未命中再解析并写回缓存"""
+        if cmd in self._cmd_cache:
+            return self._cmd_cache[cmd]
+
+        hit, path = self.tool_cache.get(cmd)
+        if not hit:
+            path = self._resolve_executable(cmd)
+            self.tool_cache.put(cmd, path)
+        self._cmd_cache[cmd] = path
+        return path
+
+    def _resolve_executable(self, cmd: str) -> Optional[str]:
+        """使用多种方法确保找到已安装的命令；不需要子进程的方法优先"""
+        # 方法1: 使用 shutil.which（最标准的方式）
+        result = shutil.which(cmd)
+        if result:
+            return result
+
+        # 方法2: 对于 BBDown，尝试各种大小写变体
+        if cmd.lower() == "bbdown":
+            for variant in ["BBDown", "bbdown", "Bbdown", "bbDown"]:
+                result = shutil.which(variant)
+                if result:
+                    return result
+
+        # 方法3: 在常见路径中搜索
+        for path in self.COMMON_PATHS:
+            full_path = Path(path) / cmd
+            if full_path.exists() and os.access(full_path, os.X_OK):
+                return str(full_path)
+
+            # 对于 BBDown，尝试各种大小写
+            if cmd.lower() == "bbdown":
+                for variant in ["BBDown", "bbdown", "Bbdown"]:
+                    full_path_alt = Path(path) / variant
+                    if full_path_alt.exists() and os.access(full_path_alt, os.X_OK):
+                        return str(full_path_alt)
+
+        # 方法4: 使用 shell 的 command -v（能处理更多情况）
+        try:
+            shell_cmd = f"command -v {cmd}"
+            result = subprocess.run(
+                shell_cmd, shell=True, capture_output=True, text=True, timeout=5
+            )
+            if result.returncode == 0 and result.stdout.strip():
+                path = result.stdout.strip().split('\n')[0]
+                if os.path.isfile(path) and os.access(path, os.X_OK):
+                    return path
+        except Exception:
+            pass
+
+        # 方法5: 使用 which -a 查找所有可能的匹配
+        try:
+            result = subprocess.run(
+                ["which", "-a", cmd],
+                capture_output=True, text=True, timeout=5
+            )
+            if result.returncode == 0:
+                for line in result.stdout.strip().split('\n'):
+                    path = line.strip()
+                    if path and os.path.isfile(path) and os.access(path, os.X_OK):
+                        return path
+        except Exception:
+            pass
+
+        # 方法6: 尝试使用 type 命令（bash 内建）
+        try:
+            result = subprocess.run(
+                ["bash", "-c", f"type -P {cmd}"],
+                capture_output=True, text=True, timeout=5
+            )
+            if result.returncode == 0 and result.stdout.strip():
+                path = result.stdout.strip().split('\n')[0]
+                if os.path.isfile(path):
+                    return path
+        except Exception:
+            pass
+
+        # 方法7: 使用 whereis
+        try:
+            result = subprocess.run(
+                ["whereis", cmd],
+                capture_output=True, text=True, timeout=5
+            )
+            if result.returncode == 0:
+                paths = result.stdout.strip().split(":")[-1].strip().split()
+                for p in paths:
+                    if os.path.isfile(p) and os.access(p, os.X_OK):
+                        return p
+        except Exception:
+            pass
+
+        return None
+
+    def check_dependency(self, cmd: str) -> bool:
+        """检查依赖是否存在 - 改进版，提供更多诊断信息"""
+        with PROFILER.step(f"查找命令 {cmd}"):
+            path = self.find_executable(cmd)
+        if path:
+            print(f"  {cmd}: ✅ 已安装 ({path})")
+            return True
+
+        print(f"  {cmd}: ❌ 未安装")
+        return False
+
+    def get_cmd(self, cmd: str) -> str:
+        """获取命令的绝对路径"""
+        path = self.find_executable(cmd)
+        return path if path else cmd
+
+    def extract_bvid(self, url: str) -> str:
+        """从URL中提取BV号"""
+        url = url.strip()
+
+        bv_pattern = r'BV[a-zA-Z0-9]{10}'
+        match = re.search(bv_pattern, url)
+        if match:
+            return match.group()
+
+        if 'b23.tv' in url or 'bili2233.cn' in url:
+            import urllib.request
+
+            try:
+                print("🔗 正在解析短链接...")
+                req = urllib.request.Request(url, method='HEAD')
+                req.add_header('User-Agent', 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36')
+                req.add_header('Accept', 'text/html,application/xhtml+xml')
+                response = urllib.request.urlopen(req, timeout=15)
+                final_url = response.geturl()
+                match = re.search(bv_pattern, final_url)
+                if match:
+                    return match.group()
+            except Exception as e:
+                print(f"⚠️  解析短链接失败: {e}")
+                try:
+                    req = urllib.request.Request(url, method='GET')
+                    req.add_header('User-Agent', 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36')
+                    response = urllib.request.urlopen(req, timeout=15)
+                    final_url = response.geturl()
+                    match = re.search(bv_pattern, final_url)
+                    if match:
+                        return match.group()
+                except Exception as e2:
+                    print(f"⚠️  GET 请求也失败: {e2}")
+
+        raise ValueError(f"无法从URL中提取BV号: {url}\n请提供完整的B站视频链接或正确的BV号")
+
+    def check_dependencies(self) -> Dict[str, bool]:
+        """检查所有依赖"""
+        print("🔍 检查依赖...")
+
+        deps = {
+            "BBDown": self.check_dependency("BBDown"),
+            "ffmpeg": self.check_dependency("ffmpeg"),
+            self.backend.name: False
+        }
+
+        if self.backend.available():
+            deps[self.backend.name] = True
+            print(f"  {self.backend.name}: ✅ 已安装 (Python包)")
+        else:
+            print(f"  {self.backend.name}: ❌ 未安装")
+
+        return deps
+
+    def job_dir(self, output_name: str) -> Path:
+        """任务独占的工作目录：下载、音频、检查点都放在这里，互不干扰"""
+        path = self.temp_dir / "jobs" / output_name
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def lock_job(self, output_name: str, blocking: bool = True) -> Optional[FileLock]:
+        """获取任务锁：同一输出名同一时间只允许一个任务处理（跨进程），其余等待
+
+        blocking=False 时锁被占用直接返回 None。
+        """
+        lock = FileLock(self.temp_dir / "jobs" / f"{output_name}.lock")
+        if not lock.acquire(blocking=False):
+            if not blocking:
+                return None
+            print(f"⏳ {output_name} 正由另一个任务处理，等待其完成...")
+            self.report_status("lock", "waiting", f"等待任务锁: {output_name}", {"item": output_name})
+            lock.acquire()
+        return lock
+
+    def media_files(self, output_name: str, audio_only: bool = False) -> List[Path]:
+        """列出任务工作目录中的媒体文件"""
+        exts = self.AUDIO_EXTENSIONS if audio_only else self.VIDEO_EXTENSIONS + self.AUDIO_EXTENSIONS
+        job_dir = self.job_dir(output_name)
+        files = []
+        for ext in exts:
+            for f in job_dir.glob(f"*{ext}"):
+                if f.exists() and not f.name.startswith(".") and f not in files:
+                    files.append(f)
+        return files
+
+    def run_subprocess(self, cmd: List[str], on_line: Optional[Callable[[str], None]] = None,
+                       tail_lines: int = 50):
+        """运行子进程并逐行读取合并后的 stdout/stderr（\\r 刷新的进度条也按行处理）
+
+        返回 (退出码, 最后 tail_lines 行输出)，退出码同时记入当前阶段的指标。
+        """
+        tail: deque = deque(maxlen=tail_lines)
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, encoding='utf-8', errors='ignore')
+        for line in proc.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            tail.append(line)
+            if on_line is not None:
+                try:
+                    on_line(line)
+                except Exception:
+                    pass
+        returncode = proc.wait()
+        record_metric(command=Path(cmd[0]).name, exit_code=returncode)
+        return returncode, "\n".join(tail)
+
+    def progress_reporter(self, stage: str, item: str, interval: float = 1.0) -> Callable[..., None]:
+        """返回节流后的进度上报函数：最多每 interval 秒一次，完成（100%）时总会上报"""
+        last = {"time": 0.0, "percent": None}
+
+        def report(percent: float, **data):
+            now = time.monotonic()
+            percent = round(min(100.0, max(0.0, percent)), 1)
+            if percent == last["percent"] or (percent < 100 and now - last["time"] < interval):
+                return
+            last.update(time=now, percent=percent)
+            self.report_status(stage, "progress", f"[{item}] {percent:.1f}%",
+                               dict(data, item=item, percent=percent))
+
+        return report
+
+    def download_video(self, bvid: str, output_name: str, audio_only: bool = False,
+                       page: int = 1, target: Optional[str] = None) -> Path:
+        """下载视频的第 page 个分P；audio_only 时只下载音频流，不下载视频轨也不混流
+
+        target 为合集/UP主空间链接时，page 是列表中的序号。
+        """
+        kind = "音频" if audio_only else "视频"
+        print(f"\n📥 正在下载{kind} {bvid} P{page}...")
+        print("   这可能需要一些时间，请耐心等待...")
+
+        bbdown_cmd = self.get_cmd("BBDown")
+
+        cmd = [
+            bbdown_cmd,
+            "--work-dir", str(self.job_dir(output_name)),
+            # 多P视频、合集和空间用 --multi-file-pattern（默认会写到 <标题>/ 子目录下）
+            "--file-pattern", output_name,
+            "--multi-file-pattern", output_name,
+            "--select-page", str(page),
+        ]
+        if audio_only:
+            cmd += ["--audio-only", "--skip-mux"]
+        cmd.append(target or bvid)
+
+        before = {f: f.stat().st_size for f in self.media_files(output_name)}
+        report = self.progress_reporter("download", output_name)
+
+        def on_line(line: str):
+            # BBDown 进度条形如 "[=====>    ] 45.20% 3.50MB/s"
+            match = BBDOWN_PROGRESS_RE.search(line)
+            if match:
+                report(float(match.group(1)), speed=match.group(2))
+
+        try:
+            returncode, output = self.run_subprocess(cmd, on_line)
+
+            if returncode != 0 and output:
+                print(f"⚠️  BBDown 输出: {output[-500:]}")
+
+            possible_files = self.media_files(output_name, audio_only)
+            if not possible_files and audio_only:
+                # 旧版 BBDown 不认识 --audio-only 时可能仍产出视频文件
+                possible_files = self.media_files(output_name)
+
+            if possible_files:
+                media_file = max(possible_files, key=lambda p: p.stat().st_size)
+                downloaded = sum(f.stat().st_size for f in self.media_files(output_name)
+                                 if before.get(f) != f.stat().st_size)
+                self.download_stats[output_name] = downloaded
+                record_metric(output_bytes=downloaded)
+                print(f"✅ {kind}已下载: {media_file.name} ({downloaded / 1024 / 1024:.1f} MB)")
+                return media_file
+
+            print(f"\n⚠️  未找到下载的{kind}文件")
+            print(f"   工作目录内容: {list(self.job_dir(output_name).glob('*'))}")
+            raise FileNotFoundError(f"{kind}文件未找到，BV号: {bvid}")
+
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            print(f"❌ 下载失败: {e}")
+            raise RuntimeError(f"视频下载失败: {e}")
+
+    def wants_subtitles(self, keep_video: bool = False, keep_audio: bool = False) -> bool:
+        """是否先查找现有字幕：prefer 策略下要保留视频/音频时仍需下载媒体，直接走语音识别"""
+        if self.subtitle_policy == "prefer":
+            return not (keep_video or keep_audio)
+        return self.subtitle_policy == "compare"
+
+    def fetch_subtitles(self, bvid: str, output_name: str, language: Optional[str], page: int = 1,
+                        target: Optional[str] = None) -> Optional[dict]:
+        """用 BBDown --sub-only 只下载字幕（包括 AI 字幕），有所需语言的字幕时转换为转录结果，否则返回 None"""
+        print(f"\n💬 正在查找现有字幕 {bvid} P{page}...")
+        sub_dir = self.job_dir(output_name) / "subtitles"
+        shutil.rmtree(sub_dir, ignore_errors=True)
+        sub_dir.mkdir(parents=True, exist_ok=True)
+        cmd = [
+            self.get_cmd("BBDown"),
+            "--sub-only", "--skip-ai", "false",
+            "--work-dir", str(sub_dir),
+            "--file-pattern", output_name,
+            "--multi-file-pattern", output_name,
+            "--select-page", str(page),
+            target or bvid,
+        ]
+        try:
+            returncode, output = self.run_subprocess(cmd)
+        except Exception as e:
+            print(f"⚠️  获取字幕失败: {e}")
+            return None
+
+        files = [f for f in sub_dir.rglob("*") if f.suffix.lower() in SUBTITLE_EXTENSIONS]
+        path = pick_subtitle(files, language)
+        if path is None:
+            found = ", ".join(sorted(subtitle_language(f) for f in files)) or "无"
+            print(f"   没有 {language or '任意语言'} 的字幕（已有: {found}）")
+            if returncode != 0 and output:
+                print(f"⚠️  BBDown 输出: {output[-300:]}")
+            return None
+        try:
+            text = path.read_text(encoding="utf-8-sig")
+            cues = parse_bcc(json.loads(text)) if path.suffix.lower() == ".json" else parse_srt(text)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"⚠️  解析字幕失败 {path.name}: {e}")
+            return None
+        if not cues:
+            print(f"⚠️  字幕为空: {path.name}")
+            return None
+
+        code = subtitle_language(path)
+        kind = "ai" if code.lower().startswith("ai-") else "cc"
+        result = subtitle_result(cues, language)
+        result["subtitle"] = {"language": code, "kind": kind, "file": path.name}
+        record_metric(input_bytes=path.stat().st_size, subtitle=kind)
+        print(f"✅ 找到{'AI' if kind == 'ai' else 'UP主'}字幕: {code}，{len(cues)} 条")
+        return result
+
+    def compare_subtitles(self, result: dict, subtitle: dict, output_name: str):
+        """compare 策略：比较转录结果与现有字幕，相似度记入结果元数据，字幕原文另存到输出目录"""
+        info = subtitle["subtitle"]
+        comparison = windowed_similarity(result.get("segments", []), subtitle["segments"])
+        result["subtitle"] = dict(info, segments=len(subtitle["segments"]), **comparison)
+        source = self.job_dir(output_name) / "subtitles" / info["file"]
+        if source.exists():
+            dest = self.output_dir / f"{output_name}.{info['language']}{source.suffix}"
+            link_or_copy(source, dest)
+            result["subtitle"]["file"] = dest.name
+        print(f"🔍 与{'AI' if info['kind'] == 'ai' else 'UP主'}字幕 {info['language']} 的相似度: "
+              f"{comparison['similarity']:.1%}")
+        self.report_status("subtitles", "compared", f"与字幕的相似度 {comparison['similarity']:.1%}",
+                           dict(result["subtitle"], item=output_name))
+
+    def extract_audio(self, video_path: Path, output_name: str, keep_audio: bool = False) -> Path:
+        """提取音频 - 一次解码直接得到 Whisper 所需的 16kHz 单声道 PCM
+
+        仅在 keep_audio 时额外输出一份 MP3 到输出目录（同一次 ffmpeg 调用）。
+        """
+        print(f"\n🎵 正在提取音频...")
+
+        # 先写临时文件，完成后再改名，中断时不会留下半截的音频
+        audio_path = self.job_dir(output_name) / f"{output_name}.wav"
+        partial_audio = audio_path.with_name(f".part-{audio_path.name}")
+        mp3_path = self.output_dir / f"{output_name}.mp3"
+        partial_mp3 = mp3_path.with_name(f".part-{mp3_path.name}")
+
+        cmd = [
+            self.get_cmd("ffmpeg"),
+            "-nostats", "-progress", "pipe:1",
+            "-i", str(video_path),
+            "-vn",
+            "-ac", "1",
+            "-ar", str(SAMPLE_RATE),
+            "-acodec", "pcm_s16le",
+            "-y",
+            str(partial_audio)
+        ]
+        if keep_audio:
+            cmd += [
+                "-vn",
+                "-acodec", "libmp3lame",
+                "-q:a", "2",
+                "-y",
+                str(partial_mp3)
+            ]
+
+        report = self.progress_reporter("extract_audio", output_name)
+        total = {"seconds": None}
+
+        def on_line(line: str):
+            # stderr 中的 "Duration: 00:10:00.00" 给出总时长，-progress 输出 out_time_us=... 给出当前位置
+            match = FFMPEG_DURATION_RE.search(line)
+            if match and total["seconds"] is None:
+                h, m, sec = match.groups()
+                total["seconds"] = int(h) * 3600 + int(m) * 60 + float(sec)
+            elif line.startswith("out_time_us=") and total["seconds"]:
+                position = line.split("=", 1)[1]
+                if position.isdigit():
+                    report(int(position) / 1e6 / total["seconds"] * 100,
+                           seconds=round(int(position) / 1e6, 1), total_seconds=total["seconds"])
+            elif line == "progress=end":
+                report(100.0, total_seconds=total["seconds"])
+
+        returncode, output = self.run_subprocess(cmd, on_line)
+
+        if returncode != 0:
+            partial_audio.unlink(missing_ok=True)
+            partial_mp3.unlink(missing_ok=True)
+            error_msg = output or "未知错误"
+            print(f"❌ 音频提取失败: {error_msg[-500:]}")
+            raise RuntimeError(f"音频提取失败: {error_msg[-200:]}")
+
+        if not partial_audio.exists():
+            raise FileNotFoundError(f"音频文件未生成: {audio_path}")
+        os.replace(partial_audio, audio_path)
+        if keep_audio and partial_mp3.exists():
+            os.replace(partial_mp3, mp3_path)
+
+        output_bytes = audio_path.stat().st_size
+        if keep_audio and mp3_path.exists():
+            output_bytes += mp3_path.stat().st_size
+        # 16kHz 单声道 s16 WAV：每秒 32000 字节，文件头 44 字节
+        record_metric(input_bytes=video_path.stat().st_size, output_bytes=output_bytes,
+                      audio_seconds=round((audio_path.stat().st_size - 44) / (SAMPLE_RATE * 2), 3))
+
+        print(f"✅ 音频已提取: {audio_path.name}")
+        return audio_path
+
+    def transcribe_audio(self, audio_path: Path, model: str = "small", language: str = "zh",
+                         device: Optional[str] = None,
+                         on_segment: Optional[Callable[[dict], None]] = None,
+                         manifest: Optional[JobManifest] = None) -> dict:
+        """使用所选的语音识别后端转录音频"""
+        print(f"\n📝 正在进行语音转录...")
+        print(f"   后端: {self.backend.name} | 模型: {model} | 语言: {language}"
+              + (f" | 线程: {self.threads}" if self.threads else ""))
+        print("   ⏳ 这可能需要几分钟，请耐心等待...")
+
+        if not self.backend.available():
+            raise ImportError(f"未安装 {self.backend.package}，请运行: {self.backend.install_hint}")
+
+        if model not in self.backend.valid_models:
+            print(f"⚠️  未知模型 '{model}'，使用默认的 'small'")
+            model = "small"
+
+        if self.window_decode(audio_path):
+            return self.transcribe_windowed(audio_path, model, language, device, on_segment, manifest)
+
+        try:
+            audio = load_pcm_wav(audio_path)
+        except (OSError, ValueError, wave.Error) as e:
+            raise RuntimeError(f"读取音频失败: {e}")
+        duration = len(audio) / SAMPLE_RATE
+        record_metric(input_bytes=audio_path.stat().st_size, audio_seconds=round(duration, 3))
+
+        timeline = None
+        if self.vad:
+            audio, timeline = self.apply_vad(audio)
+            record_metric(speech_seconds=round(len(audio) / SAMPLE_RATE, 3))
+            if len(audio) == 0:
+                print("⚠️  未检测到语音")
+                return {"text": "", "segments": [], "language": language or None, "duration": duration}
+
+        if on_segment is not None and timeline is not None:
+            emit = on_segment
+            on_segment = lambda seg: emit(remap_segment(seg, timeline))
+
+        checkpoint = None
+        if manifest is not None and self.asr_workers <= 1 and self.batch_decoder is None and (
+                self.stream or len(audio) / SAMPLE_RATE >= RESUME_MIN_SECONDS):
+            checkpoint = manifest.segment_checkpoint(
+                {"model": model, "language": language, "signature": self.asr_signature()})
+
+        result = self.run_asr(audio, model, language, device, on_segment, checkpoint)
+        if timeline is not None and on_segment is None:
+            remap_segments(result, timeline)
+        result["duration"] = duration
+
+        segments_count = len(result.get('segments', []))
+        print(f"✅ 转录完成! 共 {segments_count} 个片段")
+        return result
+
+    def window_decode(self, audio_path: Path) -> bool:
+        """是否对该音频使用有界内存的分窗解码：时长超过 long_audio_seconds，且没有开启需要整段音频的
+        语音检测、分块并行和批量解码（开启时给出警告，整段载入内存）"""
+        if self.long_audio_seconds is None:
+            return False
+        try:
+            with wave.open(str(audio_path), "rb") as wf:
+                duration = wf.getnframes() / wf.getframerate()
+        except (OSError, wave.Error):
+            return False
+        if duration < self.long_audio_seconds:
+            return False
+        conflicts = [name for name, enabled in (("--vad", self.vad), ("--asr-workers", self.asr_workers > 1),
+                                                ("--batch-size", self.batch_decoder is not None)) if enabled]
+        if conflicts:
+            message = (f"音频 {duration / 60:.0f} 分钟超过 --long-audio-minutes，但 {'/'.join(conflicts)} "
+                       f"需要整段音频，不使用分窗解码，峰值内存随时长增长")
+            print(f"⚠️  {message}")
+            self.report_status("transcribe", "warning", message,
+                               {"duration": round(duration, 2), "conflicts": conflicts})
+            return False
+        return True
+
+    def transcribe_windowed(self, audio_path: Path, model: str, language: str, device: Optional[str] = None,
+                            on_segment: Optional[Callable[[dict], None]] = None,
+                            manifest: Optional[JobManifest] = None) -> dict:
+        """长音频转录：按窗口从文件读取，不把整段音频载入内存（检查点、流式输出照常可用）"""
+        with wave.open(str(audio_path), "rb") as wf:
+            duration = wf.getnframes() / wf.getframerate()
+        record_metric(input_bytes=audio_path.stat().st_size, audio_seconds=round(duration, 3))
+        checkpoint = None
+        if manifest is not None:
+            checkpoint = manifest.segment_checkpoint(
+                {"model": model, "language": language, "signature": self.asr_signature()})
+        result = self.run_asr_file(audio_path, duration, model, language, device, on_segment, checkpoint)
+        result["duration"] = duration
+        print(f"✅ 转录完成! 共 {len(result.get('segments', []))} 个片段")
+        return result
+
+    def apply_vad(self, audio):
+        """语音检测：只保留（补过余量的）语音区间，返回 (拼接后的音频, 时间映射表)"""
+        detector = VAD_DETECTORS.get(self.vad)
+        if detector is None:
+            raise ValueError(f"未知的语音检测器: {self.vad}（可选: {', '.join(VAD_DETECTORS)}）")
+        try:
+            regions = detector(audio)
+        except ImportError as e:
+            raise ImportError(f"语音检测器 {self.vad} 缺少依赖: {e}")
+
+        regions = pad_regions(regions, len(audio), self.vad_padding)
+        compacted, timeline = compact_speech(audio, regions)
+        speech = sum(end - start for start, end in regions) / SAMPLE_RATE
+        skipped = len(audio) / SAMPLE_RATE - speech
+        print(f"   🔇 语音检测: 保留 {speech:.1f}s 语音，跳过 {skipped:.1f}s")
+        self.report_status("vad", "completed", f"跳过 {skipped:.1f} 秒非语音",
+                           {"detector": self.vad, "regions": len(regions),
+                            "speech_seconds": round(speech, 2), "skipped_seconds": round(skipped, 2)})
+        return compacted, timeline
+
+    def run_asr(self, audio, model: str, language: str, device: Optional[str] = None,
+                on_segment: Optional[Callable[[dict], None]] = None,
+                checkpoint: Optional[SegmentCheckpoint] = None) -> dict:
+        """对内存中的音频数组执行语音识别
+
+        长音频可分块并行；需要逐段回调或记录进度时按窗口解码，
+        有检查点时先回放已完成的片段，再从最后一个片段的结束位置继续。
+        """
+        if self.batch_decoder is not None and checkpoint is None:
+            try:
+                started = time.perf_counter()
+                result = self.batch_decoder.transcribe(self, audio, model, language, device)
+                self.record_rtf(model, device, time.perf_counter() - started, len(audio))
+            except Exception as e:
+                raise RuntimeError(f"语音转录失败: {e}")
+            if on_segment is not None:
+                for seg in result["segments"]:
+                    on_segment(seg)
+            return result
+
+        windowed = on_segment is not None or checkpoint is not None
+        if self.asr_workers > 1 and not windowed:
+            bounds = split_on_silence(audio, self.chunk_seconds)
+            if len(bounds) > 1:
+                return self.transcribe_chunked(audio, bounds, model, language, device)
+
+        backend = self.backend
+        entry = self.load_model(model, device)
+
+        try:
+            with entry["lock"]:
+                started = time.perf_counter()
+                if not windowed:
+                    result = backend.transcribe(entry["model"], audio, language)
+                    self.record_rtf(model, device, time.perf_counter() - started, len(audio))
+                    return result
+
+                result, offset = self.collect_segments(
+                    lambda start, info: backend.iter_segments(entry["model"], audio[int(start * SAMPLE_RATE):],
+                                                              language, info),
+                    language, on_segment, checkpoint)
+                self.record_rtf(model, device, time.perf_counter() - started,
+                                len(audio) - int(offset * SAMPLE_RATE))
+                return result
+        except Exception as e:
+            raise RuntimeError(f"语音转录失败: {e}")
+
+    def run_asr_file(self, audio_path: Path, duration: float, model: str, language: str,
+                     device: Optional[str] = None, on_segment: Optional[Callable[[dict], None]] = None,
+                     checkpoint: Optional[SegmentCheckpoint] = None) -> dict:
+        """长音频的有界内存解码：按窗口从 WAV 文件读取并解码
+
+        内存中只有当前窗口、跨窗口保留的尾部音频和提示文本，峰值内存与音频时长无关。
+        """
+        print(f"   🪟 分窗解码: 音频 {duration / 60:.0f} 分钟，按 {STREAM_WINDOW_SECONDS} 秒窗口从文件读取")
+        backend = self.backend
+        entry = self.load_model(model, device)
+        peak = {"rss": current_rss_mb() or 0.0}
+
+        def on_window(end: int):
+            peak["rss"] = max(peak["rss"], current_rss_mb() or 0.0)
+
+        try:
+            with entry["lock"]:
+                started = time.perf_counter()
+                result, offset = self.collect_segments(
+                    lambda start, info: backend.iter_file_segments(entry["model"], audio_path, language, info,
+                                                                   start, on_window),
+                    language, on_segment, checkpoint)
+                self.record_rtf(model, device, time.perf_counter() - started,
+                                int((duration - offset) * SAMPLE_RATE))
+        except Exception as e:
+            raise RuntimeError(f"语音转录失败: {e}")
+        print(f"   🧠 解码期间峰值RSS: {peak['rss']:.0f} MB")
+        record_metric(window_peak_rss_mb=round(peak["rss"], 1))
+        return result
+
+    def collect_segments(self, source: Callable[[float, dict], Iterable[dict]], language: str,
+                         on_segment: Optional[Callable[[dict], None]] = None,
+                         checkpoint: Optional[SegmentCheckpoint] = None):
+        """逐段收集 source(起点秒数, info) 产出的片段（时间戳相对于起点）
+
+        有检查点时先回放已完成的片段，再从最后一个片段的结束位置继续。返回 (结果, 续转起点)。
+        """
+        segments = []
+
+        def accept(seg: dict, record: bool = True):
+            seg["id"] = len(segments)
+            if checkpoint is not None and record:
+                checkpoint.append(seg)
+            if on_segment is not None:
+                on_segment(seg)
+            segments.append(seg)
+
+        done = checkpoint.load() if checkpoint is not None else []
+        offset = done[-1]["end"] if done else 0.0
+        if done:
+            print(f"   ↩️  从 {offset:.1f}s 处继续转录（已完成 {len(done)} 个片段）")
+            self.report_status("transcribe", "resumed", f"从 {offset:.1f}s 处继续转录",
+                               {"offset": offset, "segments": len(done)})
+        for seg in done:
+            accept(seg, record=False)
+
+        info: dict = {}
+        for seg in source(offset, info):
+            if offset:
+                seg["start"] = round(seg.get("start", 0) + offset, 3)
+                seg["end"] = round(seg.get("end", 0) + offset, 3)
+            accept(seg)
+        return {
+            "text": "".join(seg.get("text", "") for seg in segments),
+            "segments": segments,
+            "language": info.get("language") or language,
+        }, offset
+
+    def load_model(self, model: str, device: Optional[str] = None, threads: Optional[int] = None,
+                   workers: int = 1) -> dict:
+        """加载（或从模型缓存取出）模型，返回 {"model", "lock"}
+
+        workers > 1 时加载可多路并行推理的实例（faster-whisper 的 num_workers），缓存键中带上路数和线程数。
+        """
+        backend = self.backend
+        threads = threads or self.threads
+
+        def load():
+            # 后端（及 torch）直到这里才真正导入
+            with PROFILER.step(f"导入并加载模型 {backend.name}/{model}"):
+                return backend.load(model, device, self.compute_type, threads, workers=workers)
+
+        model_cache = getattr(self._thread_state, "model_cache", None) or self.model_cache
+        try:
+            if model_cache is not None:
+                key = backend.cache_key(model, device, self.compute_type)
+                if workers > 1:
+                    key += (f"workers={workers}", f"threads={threads}")
+                return model_cache.get(key, load)
+            return {"model": load(), "lock": threading.Lock()}
+        except Exception as e:
+            raise RuntimeError(f"加载 {backend.name} 模型失败: {e}")
+
+    def use_thread_model_cache(self, model_cache: Optional[ModelCache]):
+        """让当前线程的 load_model 使用自己的模型缓存"""
+        self._thread_state.model_cache = model_cache
+
+    def calibration_env(self, device: Optional[str]) -> str:
+        return RTFCalibration.environment(self.backend, device, self.compute_type, self.threads)
+
+    def record_rtf(self, model: str, device: Optional[str], elapsed: float, samples: int):
+        """把一次解码的实测 RTF 记入本机校准缓存（太短的音频测不准，跳过）"""
+        seconds = samples / SAMPLE_RATE
+        if self.calibration is None or seconds < AUTO_CALIBRATION_SECONDS / 2:
+            return
+        try:
+            self.calibration.record(self.calibration_env(device), model, elapsed / seconds)
+        except OSError as e:
+            print(f"⚠️  写入 RTF 校准缓存失败: {e}")
+
+    def calibrate(self, audio_path: Path, duration: float, language: str, device: Optional[str]) -> Dict[str, float]:
+        """本机还没有实测值：用 AUTO_CALIBRATION_MODEL 解码音频中部的一小段，测出 RTF"""
+        import numpy as np
+
+        model = AUTO_CALIBRATION_MODEL
+        seconds = min(AUTO_CALIBRATION_SECONDS, duration)
+        with wave.open(str(audio_path), "rb") as wf:
+            wf.setpos(int(max(0.0, (duration - seconds) / 2) * SAMPLE_RATE))
+            frames = wf.readframes(int(seconds * SAMPLE_RATE))
+        clip = np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
+
+        print(f"   📐 校准: 用 {model} 解码 {seconds:.0f}s 音频测量本机速度...")
+        entry = self.load_model(model, device)
+        with PROFILER.step(f"校准 {self.backend.name}/{model}"), entry["lock"]:
+            started = time.perf_counter()
+            self.backend.transcribe(entry["model"], clip, language)
+            rtf = (time.perf_counter() - started) / max(seconds, 1e-3)
+        if self.calibration is not None:
+            try:
+                self.calibration.record(self.calibration_env(device), model, rtf)
+            except OSError as e:
+                print(f"⚠️  写入 RTF 校准缓存失败: {e}")
+        return {model: rtf}
+
+    def select_model(self, audio_path: Path, language: str, device: Optional[str] = None) -> str:
+        """--model auto：选出按本机实测速度能满足目标 RTF / 截止时间的最准确模型"""
+        try:
+            with wave.open(str(audio_path), "rb") as wf:
+                duration = wf.getnframes() / wf.getframerate()
+        except (OSError, wave.Error) as e:
+            raise RuntimeError(f"读取音频失败: {e}")
+
+        budgets = [self.target_rtf] if self.target_rtf else []
+        if self.deadline:
+            budgets.append(self.deadline / max(duration, 1.0))
+        budget = min(budgets) if budgets else 1.0
+
+        measured = self.calibration.measured(self.calibration_env(device)) if self.calibration else {}
+        if not measured:
+            measured = self.calibrate(audio_path, duration, language, device)
+
+        candidates = [m for m in AUTO_MODEL_COST if m in self.backend.valid_models]
+        estimates = {m: RTFCalibration.estimate(measured, m) for m in candidates}
+        fitting = [m for m in candidates if estimates[m] is not None and estimates[m] <= budget * AUTO_HEADROOM]
+        if fitting:
+            model = fitting[-1]
+        else:
+            model = candidates[0]
+            print(f"⚠️  没有模型能满足目标 RTF {budget:.2f}，使用最快的 {model}")
+        estimate = estimates.get(model)
+        print(f"🎯 自动选择模型: {model} | 音频 {duration:.0f}s | 目标 RTF {budget:.2f}"
+              + (f" | 预计 RTF {estimate:.2f}" if estimate is not None else ""))
+        self.report_status("model_select", "completed", f"自动选择模型 {model}",
+                           {"model": model, "duration": round(duration, 2), "target_rtf": round(budget, 3),
+                            "estimates": {m: round(v, 3) for m, v in estimates.items() if v is not None}})
+        record_metric(model=model)
+        return model
+
+    def transcribe_chunked(self, audio, bounds: List[tuple], model: str, language: str,
+                           device: Optional[str] = None) -> dict:
+        """分块并行转录：每个工作进程绑定一组CPU核心，结果按时间顺序拼接
+
+        share_weights 时各 worker 共用一份模型权重：父进程加载后 fork，或同一模型实例多路推理。
+        """
+        core_sets = partition_cores(min(self.asr_workers, len(bounds)))
+        workers = len(core_sets)
+        if self.share_weights and self.backend.share_mode == "threads":
+            return self.transcribe_chunked_threads(audio, bounds, model, language, device, workers,
+                                                   len(core_sets[0]))
+
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        share = self.share_weights and self.backend.share_mode == "fork" \
+            and "fork" in multiprocessing.get_all_start_methods()
+        mode = "共享权重" if share else "各自加载模型"
+        print(f"   🧩 分块转录: {len(bounds)} 块 | {workers} 个进程 | 每进程 {len(core_sets[0])} 核 | {mode}")
+
+        entry = None
+        if share:
+            # 父进程加载一次模型后 fork：权重页面写时复制，只读使用时各 worker 共享同一份物理内存。
+            # 模型经 initargs 传给工作进程，fork 时直接继承，不做序列化
+            entry = self.load_model(model, device)
+            entry["lock"].acquire()
+        ctx = multiprocessing.get_context("fork" if share else None)
+        core_queue = ctx.Queue()
+        for cores in core_sets:
+            core_queue.put(cores)
+
+        chunk_results: List[Optional[dict]] = [None] * len(bounds)
+        memory: Dict[int, dict] = {}
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_chunk_worker_init,
+                                     initargs=(self.backend.name, model, device, self.compute_type,
+                                               core_queue, entry["model"] if share else None)) as pool:
+                # fork 上下文的进程池在第一次提交时一次性创建全部工作进程，提交都在 fork_section 内完成
+                with fork_section(share):
+                    futures = [
+                        pool.submit(_chunk_worker_transcribe, i, audio[start:end], language or None)
+                        for i, (start, end) in enumerate(bounds)
+                    ]
+                for done, future in enumerate(as_completed(futures), 1):
+                    index, result, usage = future.result()
+                    chunk_results[index] = result
+                    if "uss_mb" in usage:
+                        memory[usage["pid"]] = usage
+                    self.report_status("transcribe", "progress", f"分块 {done}/{len(bounds)} 完成",
+                                       {"chunks_done": done, "chunks_total": len(bounds)})
+        except Exception as e:
+            raise RuntimeError(f"分块转录失败: {e}")
+        finally:
+            if share:
+                entry["lock"].release()
+
+        self.report_worker_memory(list(memory.values()), share)
+        return stitch_chunk_results(chunk_results, [start / SAMPLE_RATE for start, _ in bounds])
+
+    def transcribe_chunked_threads(self, audio, bounds: List[tuple], model: str, language: str,
+                                   device: Optional[str], workers: int, threads: int) -> dict:
+        """共享权重的分块转录（faster-whisper）：一个模型实例开 workers 路并行推理，各线程同时解码不同分块
+
+        该实例经 load_model 放入模型缓存（键中带上路数），同一任务的后续分P和后续任务直接复用。
+        """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        print(f"   🧩 分块转录: {len(bounds)} 块 | {workers} 个线程 | 每线程 {threads} 核 | 共享权重")
+        backend = self.backend
+        entry = self.load_model(model, device, threads=threads, workers=workers)
+
+        chunk_results: List[Optional[dict]] = [None] * len(bounds)
+        try:
+            with entry["lock"], ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(backend.transcribe, entry["model"], audio[start:end], language or None): i
+                    for i, (start, end) in enumerate(bounds)
+                }
+                for done, future in enumerate(as_completed(futures), 1):
+                    chunk_results[futures[future]] = future.result()
+                    self.report_status("transcribe", "progress", f"分块 {done}/{len(bounds)} 完成",
+                                       {"chunks_done": done, "chunks_total": len(bounds)})
+        except Exception as e:
+            raise RuntimeError(f"分块转录失败: {e}")
+
+        usage = memory_breakdown()
+        if usage:
+            print(f"   🧠 内存: RSS {usage['rss_mb']:.0f} MB（{workers} 路推理共用一份权重）")
+            record_metric(workers_uss_mb=usage["uss_mb"], workers_shared_mb=usage["shared_mb"])
+        return stitch_chunk_results(chunk_results, [start / SAMPLE_RATE for start, _ in bounds])
+
+    def report_worker_memory(self, usages: List[dict], shared: bool):
+        """输出分块转录各工作进程的独占内存（USS）与共享内存，并记入转录阶段指标"""
+        if not usages:
+            return
+        uss = [u["uss_mb"] for u in usages]
+        shared_mb = max(u["shared_mb"] for u in usages)
+        print(f"   🧠 工作进程内存: 独占 平均 {sum(uss) / len(uss):.0f} MB / 合计 {sum(uss):.0f} MB"
+              f" | 共享 {shared_mb:.0f} MB")
+        self.report_status("transcribe", "memory", f"工作进程独占内存合计 {sum(uss):.0f} MB",
+                           {"workers": usages, "shared_weights": shared})
+        record_metric(workers_uss_mb=round(sum(uss), 1), workers_shared_mb=shared_mb)
+
+    def save_transcript(self, result: dict, output_name: str, video_info: dict = None) -> Dict[str, Path]:
+        """保存转录结果：一次遍历片段写出所有选中的格式
+
+        流式输出已完整写出的格式（TXT/SRT/MD 及未压缩的 JSONL）不再重写，只补写 JSON 等其余格式。
+        """
+        streamed = {fmt: path for fmt, path in self.streamed_outputs.pop(output_name, {}).items()
+                    if fmt in self.formats and path == self.output_path(output_name, fmt, self.compress)}
+        remaining = [fmt for fmt in self.formats if fmt not in streamed]
+        written = {}
+        if remaining:
+            writer = TranscriptWriter(self, output_name, video_info, remaining, duration=result.get("duration", 0))
+            written = writer.write_result(result)
+        files_created = {fmt: streamed.get(fmt) or written[fmt] for fmt in self.formats}
+        for fmt, path in files_created.items():
+            print(f"✅ {self.FORMAT_LABELS[fmt]}: {path.name}")
+        self.index_transcript(result, output_name, video_info, files_created.get("json"))
+
+        # 流式输出的未压缩 JSONL 已被最终版本取代
+        streamed = self.output_path(output_name, "jsonl")
+        if self.stream and files_created.get("jsonl", streamed) != streamed:
+            streamed.unlink(missing_ok=True)
+
+        record_metric(output_bytes=sum(p.stat().st_size for p in files_created.values() if p.exists()))
+        return files_created
+
+    def index_transcript(self, result: dict, output_name: str, video_info: dict = None, path: Optional[Path] = None):
+        """把片段写入全文检索索引，失败不影响主流程"""
+        if self.search_index is None:
+            return
+        import sqlite3
+
+        video_info = video_info or {}
+        try:
+            count = self.search_index.add(output_name, result.get("segments", []), video_info.get("bvid"),
+                                          video_info.get("page"), video_info.get("title"), path)
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️  写入检索索引失败: {e}")
+            return
+        print(f"✅ 检索索引: {count} 个片段")
+
+    def output_path(self, output_name: str, fmt: str, compress: Optional[str] = None) -> Path:
+        """输出文件路径；压缩的格式加 .gz / .zst 后缀"""
+        path = self.output_dir / f"{output_name}.{fmt}"
+        if compress and fmt in COMPRESSIBLE_FORMATS:
+            path = path.with_name(path.name + COMPRESS_SUFFIXES[compress])
+        return path
+
+    def format_time(self, seconds: float) -> str:
+        """格式化时间为 SRT 格式"""
+        hours = int(seconds // 3600)
+        minutes = int((seconds % 3600) // 60)
+        secs = int(seconds % 60)
+        millis = int((seconds % 1) * 1000)
+        return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+    def format_duration(self, seconds: float) -> str:
+        """格式化时长"""
+        hours = int(seconds // 3600)
+        minutes = int((seconds % 3600) // 60)
+        secs = int(seconds % 60)
+        if hours > 0:
+            return f"{hours}:{minutes:02d}:{secs:02d}"
+        return f"{minutes}:{secs:02d}"
+
+    def cleanup(self, output_name: str):
+        """清理临时文件：删除任务工作目录（--keep-video 的视频已导出到输出目录，下载的媒体仍在媒体缓存中）"""
+        print("\n🧹 清理临时文件...")
+
+        job_dir = self.temp_dir / "jobs" / output_name
+        cleaned = [f.name for f in job_dir.iterdir()] if job_dir.is_dir() else []
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+        if cleaned:
+            print(f"   已清理: {', '.join(cleaned[:3])}")
+        print("✅ 清理完成")
+
+    def ensure_dependencies(self):
+        """检查依赖，缺失时给出安装指南并抛出异常（通过后不再重复检查）"""
+        if self._dependencies_ok:
+            return
+        deps = self.check_dependencies()
+        missing = [name for name, installed in deps.items() if not installed]
+        if missing:
+            print(f"\n❌ 缺少依赖: {', '.join(missing)}")
+            print("\n安装指南:")
+            print("  • BBDown: https://github.com/nilaoda/BBDown/releases")
+            print("  • ffmpeg: brew install ffmpeg")
+            print(f"  • {self.backend.name}: {self.backend.install_hint}")
+            self.report_status("dependencies", "failed", f"缺少依赖: {', '.join(missing)}")
+            raise RuntimeError(f"缺少必要依赖: {', '.join(missing)}")
+
+        self._dependencies_ok = True
+        self.report_status("dependencies", "completed", "所有依赖已安装")
+
+    def asr_signature(self) -> str:
+        """影响转录内容的后端及选项标识，作为缓存键的一部分"""
+        signature = self.backend.version()
+        if self.compute_type:
+            signature += f"-{self.compute_type}"
+        if self.vad:
+            signature += f"+vad-{self.vad}-{self.vad_padding}"
+        return signature
+
+    def video_cache_key(self, bvid: str, model: str, language: str, page: int = 1) -> Optional[str]:
+        """生成视频级缓存键
+
+        --model auto 在下载音频之前还不知道会选哪个模型，不使用视频级缓存（返回 None），
+        只按选定模型的音频级键查缓存，避免不同时限/目标的任务拿到先跑的那个模型的结果。
+        """
+        if model == "auto":
+            return None
+        return TranscriptCache.video_key(bvid, page, model, language, self.asr_signature())
+
+    def lookup_cached_result(self, key: Optional[str], lookup: str) -> Optional[dict]:
+        """查询转录结果缓存，并通过 report_status 报告命中/未命中计数"""
+        if self.result_cache is None or key is None:
+            return None
+        result = self.result_cache.get(key)
+        data = {"lookup": lookup, **self.result_cache.stats()}
+        if result is not None:
+            print(f"⚡ 命中转录缓存 ({lookup})")
+            self.report_status("cache", "hit", f"命中转录缓存: {lookup}", data)
+        else:
+            self.report_status("cache", "miss", f"未命中转录缓存: {lookup}", data)
+        return result
+
+    def store_cached_result(self, result: dict, keys: List[str]):
+        """写入转录结果缓存，失败不影响主流程"""
+        if self.result_cache is None:
+            return
+        try:
+            self.result_cache.put(result, [k for k in keys if k])
+        except OSError as e:
+            print(f"⚠️  写入转录缓存失败: {e}")
+
+    def transcribe_cached(self, audio_path: Path, model: str, language: str,
+                          device: Optional[str] = None, video_key: Optional[str] = None,
+                          output_name: Optional[str] = None, video_info: dict = None,
+                          item: Optional[str] = None, manifest: Optional[JobManifest] = None) -> dict:
+        """先按音频哈希查缓存，未命中再转录，并把结果写回缓存
+
+        开启流式输出且给出 output_name 时，转录过程中逐段写出结果。
+        """
+        audio_key = None
+        if self.result_cache is not None:
+            audio_key = TranscriptCache.audio_key(file_sha256(audio_path), model, language,
+                                                  self.asr_signature())
+            result = self.lookup_cached_result(audio_key, "audio")
+            if result is not None:
+                record_metric(cache="audio", audio_seconds=result.get("duration"))
+                self.store_cached_result(result, [video_key])
+                return result
+
+        writer = None
+        if output_name:
+            self.streamed_outputs.pop(output_name, None)
+        if self.stream and output_name:
+            # 流式输出总是包含 JSONL 片段文件
+            formats = [fmt for fmt in self.formats if fmt in STREAMABLE_FORMATS]
+            writer = TranscriptWriter(self, output_name, video_info, formats + ["jsonl"] * ("jsonl" not in formats),
+                                      stream=True, item=item)
+        try:
+            result = self.transcribe_audio(audio_path, model, language, device, on_segment=writer,
+                                           manifest=manifest)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is not None:
+            self.streamed_outputs[output_name] = writer.paths
+        self.store_cached_result(result, [video_key, audio_key])
+        return result
+
+    def job_manifest(self, output_name: str) -> Optional[JobManifest]:
+        """任务检查点清单（关闭检查点时返回 None）"""
+        if not self.checkpoint:
+            return None
+        return JobManifest(self.job_dir(output_name) / "manifest.json")
+
+    def resume_artifact(self, manifest: Optional[JobManifest], stage: str, params: dict) -> Optional[Path]:
+        """检查点中该阶段的产物仍然有效时直接复用"""
+        if manifest is None:
+            return None
+        path = manifest.artifact(stage, params)
+        if path is not None:
+            record_metric(resumed=True)
+            print(f"↩️  检查点: 跳过 {stage}，复用 {path.name}")
+            self.report_status(stage, "resumed", f"检查点: 复用 {path.name}", {"path": str(path)})
+        return path
+
+    def download_stage(self, bvid: str, output_name: str, skip_download: bool = False,
+                       audio_only: bool = False, manifest: Optional[JobManifest] = None,
+                       page: int = 1, target: Optional[str] = None, media_key: Optional[tuple] = None) -> Path:
+        """下载阶段（可从检查点恢复）"""
+        params = {"bvid": bvid, "page": page, "audio_only": audio_only}
+        video_path = self.resume_artifact(manifest, "download", params)
+        if video_path is None:
+            video_path = self.acquire_video(bvid, output_name, skip_download, audio_only, page, target,
+                                            media_key)
+            if manifest is not None:
+                manifest.complete("download", video_path, params)
+        return video_path
+
+    def extract_stage(self, video_path: Path, output_name: str, keep_audio: bool = False,
+                      manifest: Optional[JobManifest] = None) -> Path:
+        """音频提取阶段（可从检查点恢复）"""
+        params = {"source": str(video_path), "keep_audio": keep_audio}
+        audio_path = self.resume_artifact(manifest, "extract_audio", params)
+        if audio_path is not None and keep_audio and not (self.output_dir / f"{output_name}.mp3").exists():
+            audio_path = None
+        if audio_path is None:
+            audio_path = self.extract_audio(video_path, output_name, keep_audio)
+            if manifest is not None:
+                manifest.complete("extract_audio", audio_path, params)
+        return audio_path
+
+    def transcribe_stage(self, audio_path: Path, model: str, language: str, device: Optional[str] = None,
+                         video_key: Optional[str] = None, output_name: Optional[str] = None,
+                         video_info: dict = None, item: Optional[str] = None,
+                         manifest: Optional[JobManifest] = None) -> dict:
+        """转录阶段（可从检查点恢复）：完成后把结果暂存到临时目录，保存失败重跑时无需重新转录"""
+        params = {"model": model, "language": language, "signature": self.asr_signature()}
+        result_path = self.resume_artifact(manifest, "transcribe", params)
+        if result_path is not None:
+            with open(result_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        # 与视频级缓存相同：--model auto 不按模型名查找，先选定模型再比对指纹
+        if model == "auto":
+            model = self.select_model(audio_path, language, device)
+        fingerprint = None
+        if self.fingerprint_index is not None:
+            result, fingerprint = self.match_duplicate(audio_path, language, model, output_name)
+        if fingerprint is None or result is None:
+            result = self.transcribe_cached(audio_path, model, language, device, video_key,
+                                            output_name, video_info, item, manifest)
+            if fingerprint is not None:
+                try:
+                    self.fingerprint_index.add(output_name, fingerprint, result, language, model,
+                                               self.asr_signature(), (video_info or {}).get("bvid"), (video_info or {}).get("page"))
+                except Exception as e:
+                    print(f"⚠️  写入指纹索引失败: {e}")
+        if manifest is not None:
+            result_path = self.job_dir(output_name) / "result.json"
+            TranscriptCache._atomic_write(result_path, json.dumps(result, ensure_ascii=False).encode("utf-8"))
+            manifest.complete("transcribe", result_path, params)
+        return result
+
+    def match_duplicate(self, audio_path: Path, language: str, model: str, output_name: Optional[str] = None):
+        """计算声学指纹并在指纹索引中查找相同内容（搬运/镜像视频），命中时复用并按偏移校正其转录
+
+        只复用同一模型、同一转录器签名的转录（--model auto 须先选定模型）。
+        返回 (复用的结果或 None, 指纹)；计算失败时指纹为 None。
+        """
+        started = time.perf_counter()
+        try:
+            fingerprint = audio_fingerprint(audio_path)
+            match = self.fingerprint_index.match(fingerprint, language, model, self.asr_signature(),
+                                                 exclude=output_name)
+        except Exception as e:
+            print(f"⚠️  声学指纹比对失败: {e}")
+            return None, None
+        record_metric(fingerprint_seconds=round(time.perf_counter() - started, 4))
+        if match is None:
+            return None, fingerprint
+
+        result = shift_result(match.pop("result"), match["offset"], fingerprint[2])
+        result["duplicate_of"] = match
+        source = f"{match['bvid']} P{match['page']}" if match["bvid"] else match["name"]
+        print(f"♻️  检测到重复内容: 与 {source} 相同（得分 {match['score']:.2f}，偏移 {match['offset']:+.1f}s），"
+              f"复用其转录")
+        self.report_status("dedup", "matched", f"复用 {source} 的转录", dict(match, item=output_name))
+        record_metric(dedup=match["name"])
+        return result, fingerprint
+
+    def finish_metrics(self, metrics: JobMetrics, success: bool, error: Optional[str] = None,
+                       item: Optional[str] = None) -> dict:
+        """任务结束：汇总阶段指标，按需写出指标JSON和 Prometheus textfile"""
+        summary = metrics.summary(success, error)
+        data = dict(summary, item=item) if item else summary
+        self.report_status("metrics", "completed", f"任务耗时 {summary['seconds']:.1f}s", data)
+        if self.metrics_json:
+            try:
+                path = self.output_dir / f"{metrics.job}.metrics.json"
+                path.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+            except OSError as e:
+                print(f"⚠️  写入指标文件失败: {e}")
+        if self.prometheus is not None:
+            self.prometheus.observe(summary)
+        return summary
+
+    def discard_checkpoint(self, manifest: Optional[JobManifest], output_name: str):
+        """任务成功完成后删除检查点及暂存结果"""
+        if manifest is None:
+            return
+        manifest.remove()
+        (self.temp_dir / "jobs" / output_name / "result.json").unlink(missing_ok=True)
+
+    def video_info(self, bvid: str, title: Optional[str] = None, page: int = 1) -> dict:
+        """输出文件头部使用的视频信息"""
+        return {"bvid": bvid, "title": title or "B站视频", "up": "未知", "page": page}
+
+    def resolve_source(self, url: str) -> dict:
+        """识别输入类型：单个视频（可含多个分P）、合集/系列、UP主投稿空间
+
+        返回 {"kind", "id", "name", "target"}，target 是传给 BBDown 的地址。
+        """
+        url = url.strip()
+        space = re.search(r'space\.bilibili\.com/(\d+)', url)
+        if space:
+            collection = (re.search(r'[?&](?:sid|season_id|series_id)=(\d+)', url)
+                          or re.search(r'/lists/(\d+)', url))
+            if collection:
+                sid = collection.group(1)
+                return {"kind": "collection", "id": sid, "name": f"collection{sid}", "target": url}
+            mid = space.group(1)
+            return {"kind": "space", "id": mid, "name": f"space{mid}", "target": url}
+        bvid = self.extract_bvid(url)
+        return {"kind": "video", "id": bvid, "name": bvid, "target": bvid}
+
+    def fetch_page_list(self, target: str) -> dict:
+        """调用 BBDown --only-show-info 枚举分P（合集和UP主空间中的每个视频也是一个分P）"""
+        print(f"📑 正在获取分P列表: {target}")
+        cmd = [self.get_cmd("BBDown"), target, "--only-show-info"]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8',
+                                    errors='ignore', timeout=300)
+        except Exception as e:
+            raise RuntimeError(f"获取分P列表失败: {e}")
+        info = parse_page_list(result.stdout)
+        if not info["pages"]:
+            output = (result.stderr or result.stdout).strip()
+            raise RuntimeError(f"获取分P列表失败: {output[-300:] or '没有分P信息'}")
+        return info
+
+    def list_parts(self, url: str, pages: Optional[str] = None, source: Optional[dict] = None) -> dict:
+        """把一个输入展开成作品及其要处理的分P任务
+
+        每个分P是独立任务，有自己的输出名和缓存键。
+        单个视频只处理第1P时输出名仍是BV号，其他情况为 <名称>_p<N>。
+        source 为已经 resolve_source() 过的结果，避免重复识别。
+        单个视频枚举分P失败（或没有解析出分P）时按只有第1P处理，与不枚举时的行为一致。
+        """
+        source = source or self.resolve_source(url)
+        if source["kind"] == "video":
+            print(f"✅ 识别到 BV号: {source['id']}")
+            self.report_status("extract_bvid", "completed", f"识别到BV号: {source['id']}", {"bvid": source["id"]})
+
+        info = None
+        if source["kind"] == "video" and pages and pages.strip().isdigit():
+            # 只要单个分P时不必查询分P列表
+            info = {"title": None, "pages": [{"page": int(pages), "cid": None, "title": None, "duration": None}]}
+        elif source["kind"] == "video" and self.result_cache is not None:
+            # 单个视频的分P列表随转录缓存保存；合集和UP主空间会有新投稿，每次都重新枚举
+            info = self.result_cache.get_pages(source["id"], PAGE_LIST_MAX_AGE)
+            if info is not None:
+                print(f"📑 使用缓存的分P列表: {source['id']}（{len(info['pages'])} P）")
+        if info is None:
+            # 需要先用 BBDown 枚举分P
+            self.ensure_dependencies()
+            self.report_status("list_pages", "running", f"获取分P列表: {source['target']}")
+            try:
+                info = self.fetch_page_list(source["target"])
+                if source["kind"] == "video" and self.result_cache is not None:
+                    self.result_cache.put_pages(source["id"], info)
+            except RuntimeError as e:
+                if source["kind"] != "video":
+                    raise
+                print(f"⚠️  {e}，按单P视频处理")
+                info = {"title": None, "pages": [{"page": 1, "cid": None, "title": None, "duration": None}]}
+        by_page = {p["page"]: p for p in info["pages"]}
+        selected = select_pages(pages, list(by_page))
+        self.report_status("list_pages", "completed", f"共 {len(by_page)} P，选择 {len(selected)} P",
+                           {"total": len(by_page), "selected": selected})
+
+        single = source["kind"] == "video" and selected == [1]
+        parts = []
+        for page in selected:
+            meta = by_page[page]
+            if source["kind"] == "video":
+                cache_id = source["id"]
+            else:
+                # 合集和空间的序号会随新投稿变化，用分P的 cid 作为缓存键
+                cache_id, page_key = f"cid{meta['cid']}", 1
+            title = info["title"]
+            if meta.get("title") and (len(by_page) > 1 or not title):
+                title = f"{title} - P{page} {meta['title']}" if title else meta["title"]
+            parts.append({
+                "bvid": source["id"],
+                "page": page,
+                "target": source["target"],
+                "output_name": source["name"] if single else f"{source['name']}_p{page}",
+                "cache_id": cache_id,
+                "cache_page": page if source["kind"] == "video" else page_key,
+                "title": title,
+                "part_title": meta.get("title"),
+                "duration": meta.get("duration"),
+            })
+        return {"url": url, "kind": source["kind"], "name": source["name"],
+                "title": info["title"] or source["name"], "parts": parts}
+
+    def write_index(self, work: dict, items: List[dict]) -> Path:
+        """为多分P作品写合并索引：目录表格 + 各分P全文"""
+        index_path = self.output_dir / f"{work['name']}_index.md"
+        succeeded = sum(1 for item in items if item.get("success"))
+        link_format = "md" if "md" in self.formats else self.formats[0]
+        with open(index_path, "w", encoding="utf-8") as f:
+            f.write(f"# {work['title']}\n\n")
+            f.write(f"- **来源**: {work['url']}\n")
+            f.write(f"- **分P数**: {len(items)}（成功 {succeeded}）\n\n")
+            f.write("| P | 标题 | 时长 | 转录 |\n")
+            f.write("|---|------|------|------|\n")
+            for item in items:
+                if item.get("success"):
+                    md_name = self.output_path(item["output_name"], link_format, self.compress).name
+                    link = f"[{md_name}]({md_name})"
+                else:
+                    link = f"❌ {item.get('error', '失败')}"
+                f.write(f"| {item['page']} | {item.get('part_title') or ''} | {item.get('duration') or ''} | {link} |\n")
+            for item in items:
+                if item.get("success"):
+                    f.write(f"\n---\n\n## P{item['page']} {item.get('part_title') or ''}\n\n")
+                    f.write(item.get("text", "").strip() + "\n")
+        print(f"✅ 索引: {index_path.name}")
+        return index_path
+
+    def find_existing_video(self, output_name: str, media_keys: List[str] = ()) -> Path:
+        """查找已下载的视频或音频（用于 --skip-download）：先查任务工作目录，再查媒体缓存"""
+        files = self.media_files(output_name)
+        if files:
+            return max(files, key=lambda p: p.stat().st_size)
+        if self.media_cache is not None and media_keys:
+            cached = self.media_cache.get(list(media_keys))
+            if cached is not None:
+                return self.link_cached_media(cached, output_name)
+        raise FileNotFoundError(f"未找到现有视频文件: {self.job_dir(output_name)}")
+
+    def link_cached_media(self, cached: Path, output_name: str) -> Path:
+        """把缓存中的媒体硬链接进任务工作目录"""
+        path = self.job_dir(output_name) / f"{output_name}{cached.suffix}"
+        link_or_copy(cached, path)
+        return path
+
+    def acquire_video(self, bvid: str, output_name: str, skip_download: bool = False,
+                      audio_only: bool = False, page: int = 1, target: Optional[str] = None,
+                      media_key: Optional[tuple] = None) -> Path:
+        """获取媒体文件：复用已有文件、命中媒体缓存或下载
+
+        只要音频时，缓存中同一分P的完整视频也可以直接使用。
+        """
+        source, source_page = media_key or (target or bvid, page)
+        qualities = ["audio", "video"] if audio_only else ["video"]
+        keys = [MediaCache.key(source, source_page, q) for q in qualities]
+        if skip_download:
+            video_path = self.find_existing_video(output_name, keys)
+            print(f"✅ 使用现有视频: {video_path.name}")
+            return video_path
+        if self.media_cache is None:
+            return self.download_video(bvid, output_name, audio_only, page, target)
+
+        # 持有该键的锁下载：其他任务要同一媒体时等待，随后直接命中
+        with self.media_cache.lock(keys[0]):
+            cached = self.media_cache.get(keys)
+            if cached is not None:
+                video_path = self.link_cached_media(cached, output_name)
+                self.download_stats[output_name] = 0
+                record_metric(cache="media")
+                print(f"♻️  命中媒体缓存: {video_path.name}")
+                self.report_status("media_cache", "hit", f"命中媒体缓存: {video_path.name}",
+                                   dict(self.media_cache.stats(), item=output_name))
+                return video_path
+            video_path = self.download_video(bvid, output_name, audio_only, page, target)
+            try:
+                self.media_cache.put(keys[0], video_path)
+            except OSError as e:
+                print(f"⚠️  写入媒体缓存失败: {e}")
+            self.report_status("media_cache", "miss", f"已缓存媒体: {video_path.name}",
+                               dict(self.media_cache.stats(), item=output_name))
+            return video_path
+
+    def extra_outputs(self, output_name: str, keep_audio: bool = False, keep_video: bool = False) -> Dict[str, Path]:
+        """save_transcript 之外的输出：--keep-video 的视频、--keep-audio 的 MP3、
+        流式输出的 JSONL 片段文件（未选择 jsonl 格式时）"""
+        extras = {}
+        videos = [f for f in self.media_files(output_name) if f.suffix in self.VIDEO_EXTENSIONS]
+        if keep_video and videos:
+            video = max(videos, key=lambda p: p.stat().st_size)
+            extras["video"] = self.output_dir / f"{output_name}{video.suffix}"
+            link_or_copy(video, extras["video"])
+        mp3_path = self.output_dir / f"{output_name}.mp3"
+        if keep_audio and mp3_path.exists():
+            extras["mp3"] = mp3_path
+        jsonl_path = self.output_path(output_name, "jsonl")
+        if self.stream and "jsonl" not in self.formats and jsonl_path.exists():
+            extras["jsonl"] = jsonl_path
+        return extras
+
+    def finalize(self, result: dict, bvid: str, output_name: str, keep_video: bool = False,
+                 keep_audio: bool = False, manifest: Optional[JobManifest] = None,
+                 title: Optional[str] = None, page: int = 1) -> Dict[str, Path]:
+        """保存转录结果并清理临时文件"""
+        output_files = self.save_transcript(result, output_name, self.video_info(bvid, title, page))
+        output_files.update(self.extra_outputs(output_name, keep_audio, keep_video))
+        self.cleanup(output_name)
+        self.discard_checkpoint(manifest, output_name)
+        return output_files
+
+    def process(self, url: str, model: str = "small", language: str = "zh",
+                keep_video: bool = False, skip_download: bool = False,
+                device: Optional[str] = None, keep_audio: bool = False,
+                pages: Optional[str] = None) -> Optional[Dict[str, Path]]:
+        """主处理流程
+
+        单个分P直接处理；多分P、合集和UP主空间拆成独立任务交给流水线并发处理，
+        最后写出合并索引。
+        """
+
+        self.report_status("init", "running", f"开始处理: {url}")
+
+        source = self.resolve_source(url)
+        # 依赖在真正需要 BBDown 时才检查：分P列表和各分P结果都命中缓存的重跑不调用任何外部工具
+        work = self.list_parts(url, pages, source)
+        if work["kind"] == "video" and len(work["parts"]) == 1:
+            return self.process_part(work["parts"][0], model, language, keep_video, skip_download,
+                                     device, keep_audio)
+
+        print(f"📚 {work['title']}: 共 {len(work['parts'])} 个任务，最多同时处理 {self.max_parallel} 个")
+        pipeline = BatchPipeline(self, model=model, language=language, keep_video=keep_video,
+                                 skip_download=skip_download, device=device, keep_audio=keep_audio)
+        results = pipeline.run_jobs(pipeline.jobs_for_work(work))
+        failed = [r for r in results if not r["success"]]
+        if failed:
+            raise RuntimeError(f"{len(failed)}/{len(results)} 个分P处理失败: "
+                               + "; ".join(f"P{r['page']} {r['error']}" for r in failed[:5]))
+        output_files = {"index": pipeline.indexes[work["name"]]}
+        for r in results:
+            files = r["files"]
+            output_files[f"p{r['page']}"] = Path(files.get("md") or next(iter(files.values())))
+        return output_files
+
+    def process_part(self, part: dict, model: str = "small", language: str = "zh",
+                     keep_video: bool = False, skip_download: bool = False,
+                     device: Optional[str] = None, keep_audio: bool = False) -> Optional[Dict[str, Path]]:
+        """处理单个分P：下载 → 提取音频 → 转录 → 保存"""
+        bvid = part["bvid"]
+        output_name = part["output_name"]
+        info = self.video_info(bvid, part.get("title"), part["page"])
+
+        # 同一输出名的任务（包括其他进程中的）串行执行，后来者通常会直接命中转录缓存
+        with self.lock_job(output_name):
+            video_key = self.video_cache_key(part["cache_id"], model, language, part["cache_page"])
+            cached = self.lookup_cached_result(video_key, "video")
+            if cached is not None:
+                output_files = self.save_transcript(cached, output_name, info)
+                files_dict = {k: str(v) for k, v in output_files.items()}
+                self.report_status("save", "completed", "转录结果已保存（缓存）", {"files": files_dict})
+                return output_files
+
+            self.ensure_dependencies()
+
+            manifest = self.job_manifest(output_name)
+            metrics = JobMetrics(output_name)
+            try:
+                subtitle = None
+                if self.wants_subtitles(keep_video, keep_audio):
+                    self.report_status("subtitles", "running", "正在查找现有字幕")
+                    with metrics.stage("subtitles") as m:
+                        subtitle = self.fetch_subtitles(bvid, output_name, language, part["page"], part["target"])
+                    self.report_status("subtitles", "completed" if subtitle else "skipped",
+                                       "找到字幕" if subtitle else "没有可用的字幕",
+                                       {"subtitle": subtitle and subtitle["subtitle"], "metrics": m})
+
+                if subtitle is not None and self.subtitle_policy == "prefer":
+                    # 字幕快速路径：跳过下载、音频提取和语音识别
+                    with metrics.stage("save") as m:
+                        output_files = self.save_transcript(subtitle, output_name, info)
+                    files_dict = {k: str(v) for k, v in output_files.items()}
+                    self.report_status("save", "completed", "字幕已转换保存", {"files": files_dict, "metrics": m})
+                    self.cleanup(output_name)
+                    self.finish_metrics(metrics, True)
+                    return output_files
+
+                if not skip_download:
+                    self.report_status("download", "running", "开始下载视频")
+                # 不保留视频时只下载音频流
+                with metrics.stage("download") as m:
+                    video_path = self.download_stage(bvid, output_name, skip_download, not keep_video, manifest,
+                                                     part["page"], part["target"],
+                                                     (part["cache_id"], part["cache_page"]))
+                if not skip_download:
+                    self.report_status("download", "completed", f"下载完成: {video_path.name}",
+                                       {"download_bytes": self.download_stats.get(output_name, 0),
+                                        "audio_only": not keep_video, "metrics": m})
+                else:
+                    self.report_status("download", "skipped", f"使用现有视频: {video_path.name}", {"metrics": m})
+
+                self.report_status("extract_audio", "running", "正在提取音频")
+                with metrics.stage("extract_audio") as m:
+                    audio_path = self.extract_stage(video_path, output_name, keep_audio, manifest)
+                self.report_status("extract_audio", "completed", f"音频提取完成: {audio_path.name}", {"metrics": m})
+
+                self.report_status("transcribe", "running", "正在进行语音转录")
+                with metrics.stage("transcribe") as m:
+                    result = self.transcribe_stage(audio_path, model, language, device, video_key,
+                                                   output_name, info, manifest=manifest)
+                self.report_status("transcribe", "completed", f"转录完成，共 {len(result.get('segments', []))} 个片段",
+                                   {"metrics": m})
+                if subtitle is not None:
+                    self.compare_subtitles(result, subtitle, output_name)
+
+                with metrics.stage("save") as m:
+                    output_files = self.save_transcript(result, output_name, info)
+                    output_files.update(self.extra_outputs(output_name, keep_audio, keep_video))
+
+                # 转换为字符串路径用于JSON序列化
+                files_dict = {k: str(v) for k, v in output_files.items()}
+                self.report_status("save", "completed", "转录结果已保存", {"files": files_dict, "metrics": m})
+
+                with metrics.stage("cleanup") as m:
+                    self.cleanup(output_name)
+                    self.discard_checkpoint(manifest, output_name)
+                self.report_status("cleanup", "completed", "临时文件已清理", {"metrics": m})
+
+                self.finish_metrics(metrics, True)
+                return output_files
+
+            except Exception as e:
+                self.report_status("error", "failed", str(e))
+                self.finish_metrics(metrics, False, str(e))
+                # 有检查点时保留中间产物，重跑同一任务可从断点继续
+                if manifest is None:
+                    try:
+                        self.cleanup(output_name)
+                    except Exception:
+                        pass
+                else:
+                    print(f"💾 已保留检查点，重新运行同一命令即可继续: {manifest.path}")
+                raise
+
+
+class BatchPipeline:
+    """批量流水线 - 下载、音频提取、转录分阶段并发执行
+
+    每个阶段有独立的有界线程池，阶段之间通过有界队列衔接：
+    下游处理不过来时上游会阻塞（背压），从而让网络 I/O 与 CPU 计算重叠。
+    """
+
+    def __init__(self, transcriber: BiliTranscriber, model: str = "small", language: str = "zh",
+                 keep_video: bool = False, skip_download: bool = False,
+                 download_workers: int = 2, extract_workers: int = 2,
+                 transcribe_workers: int = 1, queue_size: int = 4, device: Optional[str] = None,
+                 keep_audio: bool = False, pages: Optional[str] = None):
+        self.transcriber = transcriber
+        self.model = model
+        self.language = language
+        self.device = device
+        self.keep_video = keep_video
+        self.keep_audio = keep_audio
+        self.skip_download = skip_download
+        self.queue_size = max(1, queue_size)
+        self.pages = pages
+        self.transcribe_workers = max(1, transcribe_workers)
+        # 全局并发上限：同时处于流水线中的任务数（多分P作品拆分后任务很多，避免临时文件堆积）
+        self._slots = threading.BoundedSemaphore(max(1, transcriber.max_parallel))
+        # 作品名 -> 作品信息 / 合并索引路径
+        self.works: Dict[str, dict] = {}
+        self.indexes: Dict[str, Path] = {}
+        self.stages = [
+            ("download", self._download, max(1, download_workers)),
+            ("extract_audio", self._extract, max(1, extract_workers)),
+            ("transcribe", self._transcribe, self.transcribe_workers),
+            ("save", self._save, 1),
+        ]
+
+    def _download(self, job: dict):
+        # 任务锁在进入流水线前获取（见 run_jobs），最后一个阶段结束后释放（见 _stage_worker）
+        job["video_key"] = self.transcriber.video_cache_key(job["cache_id"], self.model, self.language,
+                                                            job["cache_page"])
+        cached = self.transcriber.lookup_cached_result(job["video_key"], "video")
+        if cached is not None:
+            job["result"] = cached
+            return "命中转录缓存，跳过下载"
+        self.transcriber.ensure_dependencies()
+        if self.transcriber.wants_subtitles(self.keep_video, self.keep_audio):
+            subtitle = self.transcriber.fetch_subtitles(job["bvid"], job["output_name"], self.language,
+                                                        job["page"], job["target"])
+            if subtitle is not None and self.transcriber.subtitle_policy == "prefer":
+                job["result"] = subtitle
+                job["reuse"] = "使用现有字幕"
+                return "使用现有字幕，跳过下载"
+            job["subtitle"] = subtitle
+        job["manifest"] = self.transcriber.job_manifest(job["output_name"])
+        job["video_path"] = self.transcriber.download_stage(job["bvid"], job["output_name"], self.skip_download,
+                                                            not self.keep_video, job["manifest"],
+                                                            job["page"], job["target"],
+                                                            (job["cache_id"], job["cache_page"]))
+        job["download_bytes"] = self.transcriber.download_stats.get(job["output_name"], 0)
+        return f"媒体就绪: {job['video_path'].name}"
+
+    def _extract(self, job: dict):
+        if "result" in job:
+            return f"{job.get('reuse', '命中转录缓存')}，跳过"
+        job["audio_path"] = self.transcriber.extract_stage(job["video_path"], job["output_name"],
+                                                           self.keep_audio, job["manifest"])
+        return f"音频提取完成: {job['audio_path'].name}"
+
+    def _transcribe(self, job: dict):
+        if "result" in job:
+            return f"{job.get('reuse', '命中转录缓存')}，跳过"
+        job["result"] = self.transcriber.transcribe_stage(job["audio_path"], self.model, self.language,
+                                                          self.device, job["video_key"], job["output_name"],
+                                                          self.transcriber.video_info(job["bvid"], job.get("title"),
+                                                                                      job["page"]),
+                                                          item=job["output_name"], manifest=job["manifest"])
+        return f"转录完成，共 {len(job['result'].get('segments', []))} 个片段"
+
+    def _save(self, job: dict):
+        result = job.pop("result")
+        if job.get("subtitle") is not None:
+            self.transcriber.compare_subtitles(result, job.pop("subtitle"), job["output_name"])
+        job["text"] = result.get("text", "")
+        job["files"] = self.transcriber.finalize(result, job["bvid"], job["output_name"],
+                                                 self.keep_video, self.keep_audio, job.get("manifest"),
+                                                 job.get("title"), job["page"])
+        return "转录结果已保存"
+
+    def _stage_worker(self, name: str, func, in_q: queue.Queue, out_q: queue.Queue,
+                      state: dict, next_workers: int, last_stage: bool = False):
+        """阶段工作线程：从上游队列取任务，处理后放入下游队列
+
+        有多个转录线程时，每个转录线程有自己的模型缓存：各加载一次模型并在后续任务中复用，
+        转录真正并行，不在同一个模型的锁上排队。
+        """
+        if name == "transcribe" and self.transcribe_workers > 1:
+            self.transcriber.use_thread_model_cache(ModelCache(1))
+        try:
+            while True:
+                job = in_q.get()
+                if job is None:
+                    break
+                if not job.get("error"):
+                    item = job["output_name"]
+                    self.transcriber.report_status(name, "running", f"[{item}] 开始", {"item": item})
+                    metrics = job["metrics"]
+                    try:
+                        with metrics.stage(name) as m:
+                            message = func(job)
+                        self.transcriber.report_status(name, "completed", f"[{item}] {message}",
+                                                       {"item": item, "metrics": m})
+                    except Exception as e:
+                        job["error"] = str(e)
+                        job["failed_stage"] = name
+                        print(f"❌ [{item}] {name} 失败: {e}")
+                        self.transcriber.report_status(name, "failed", f"[{item}] {e}",
+                                                       {"item": item, "metrics": metrics.stages.get(name)})
+                        # 有检查点时保留中间产物，重跑可从断点继续
+                        if job.get("manifest") is None:
+                            try:
+                                self.transcriber.cleanup(job["output_name"])
+                            except Exception:
+                                pass
+                if last_stage:
+                    lock = job.pop("lock", None)
+                    if lock is not None:
+                        lock.release()
+                out_q.put(job)
+                if last_stage:
+                    self._slots.release()
+        finally:
+            with state["lock"]:
+                state["remaining"] -= 1
+                last = state["remaining"] == 0
+            if last:
+                for _ in range(next_workers):
+                    out_q.put(None)
+
+    def jobs_for_work(self, work: dict) -> List[dict]:
+        """把作品的分P展开为流水线任务"""
+        self.works[work["name"]] = work
+        return [dict(part, url=work["url"], work=work["name"]) for part in work["parts"]]
+
+    def run(self, urls: List[str]) -> List[dict]:
+        """运行流水线：先枚举每个输入的分P，再逐个分P处理，返回每个分P的结果"""
+
+        def expand(url: str):
+            try:
+                return self.transcriber.list_parts(url, self.pages), None
+            except Exception as e:
+                return None, e
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=self.stages[0][2]) as pool:
+            expanded = list(pool.map(expand, urls))
+
+        jobs = []
+        for url, (work, error) in zip(urls, expanded):
+            if error is not None:
+                print(f"❌ {url}: {error}")
+                jobs.append({"url": url, "error": str(error), "failed_stage": "list_pages"})
+            else:
+                jobs.extend(self.jobs_for_work(work))
+        return self.run_jobs(jobs)
+
+    def run_jobs(self, jobs: List[dict]) -> List[dict]:
+        """运行流水线，返回每个任务的处理结果（与输入顺序一致）"""
+        seen = set()
+        for index, job in enumerate(jobs):
+            job["index"] = index
+            name = job.get("output_name")
+            if name:
+                job["metrics"] = JobMetrics(name)
+            if name and not job.get("error"):
+                if name in seen:
+                    job["error"] = f"重复的任务: {name}"
+                    job["failed_stage"] = "list_pages"
+                seen.add(name)
+
+        self.transcriber.report_status("batch", "running", f"批量处理 {len(jobs)} 个条目",
+                                       {"total": len(jobs)})
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results_q: queue.Queue = queue.Queue()
+        threads = []
+        for i, (name, func, workers) in enumerate(self.stages):
+            out_q = queues[i + 1] if i + 1 < len(self.stages) else results_q
+            next_workers = self.stages[i + 1][2] if i + 1 < len(self.stages) else 1
+            state = {"remaining": workers, "lock": threading.Lock()}
+            for n in range(workers):
+                t = threading.Thread(
+                    target=self._stage_worker,
+                    args=(name, func, queues[i], out_q, state, next_workers, i + 1 == len(self.stages)),
+                    name=f"{name}-{n}",
+                    daemon=True
+                )
+                t.start()
+                threads.append(t)
+
+        def lock(job: dict, blocking: bool) -> bool:
+            try:
+                job["lock"] = self.transcriber.lock_job(job["output_name"], blocking)
+            except OSError as e:
+                job["error"] = f"获取任务锁失败: {e}"
+                job["failed_stage"] = "download"
+                return True
+            return job["lock"] is not None
+
+        def wait_and_feed(job: dict):
+            # 同名任务正由其他进程（或服务中的其他请求）处理：在单独的线程里等锁，不占用阶段线程
+            lock(job, blocking=True)
+            self._slots.acquire()
+            queues[0].put(job)
+
+        # 有界队列：下载阶段跟不上时这里会阻塞；同时在处理中的任务数受全局上限约束
+        waiters = []
+        for job in jobs:
+            self._slots.acquire()
+            if job.get("output_name") and not job.get("error") and not lock(job, blocking=False):
+                self._slots.release()
+                waiter = threading.Thread(target=wait_and_feed, args=(job,),
+                                          name=f"lock-{job['output_name']}", daemon=True)
+                waiter.start()
+                waiters.append(waiter)
+                continue
+            queues[0].put(job)
+        for waiter in waiters:
+            waiter.join()
+        for _ in range(self.stages[0][2]):
+            queues[0].put(None)
+
+        for t in threads:
+            t.join()
+
+        finished = []
+        while True:
+            job = results_q.get()
+            if job is None:
+                break
+            finished.append(job)
+        finished.sort(key=lambda j: j["index"])
+
+        results = []
+        for job in finished:
+            success = not job.get("error")
+            item = {
+                "url": job["url"],
+                "bvid": job.get("bvid"),
+                "page": job.get("page"),
+                "output_name": job.get("output_name"),
+                "success": success,
+                "download_bytes": job.get("download_bytes", 0),
+            }
+            if success:
+                item["files"] = {k: str(v) for k, v in job["files"].items()}
+            else:
+                item["error"] = job["error"]
+                item["stage"] = job.get("failed_stage")
+            if job.get("metrics") is not None:
+                item["metrics"] = self.transcriber.finish_metrics(job["metrics"], success, job.get("error"),
+                                                                  item=job["output_name"])
+            results.append(item)
+            self.transcriber.report_status("item", "completed" if success else "failed",
+                                           job.get("output_name") or job["url"], item)
+
+        self.write_indexes(finished)
+
+        succeeded = sum(1 for r in results if r["success"])
+        self.transcriber.report_status("batch", "completed", f"成功 {succeeded}/{len(results)}",
+                                       {"succeeded": succeeded, "total": len(results)})
+        return results
+
+    def write_indexes(self, finished: List[dict]):
+        """为多分P视频、合集和UP主空间写合并索引"""
+        for name, work in self.works.items():
+            if work["kind"] == "video" and len(work["parts"]) == 1:
+                continue
+            items = [{
+                "page": job["page"],
+                "output_name": job["output_name"],
+                "part_title": job.get("part_title"),
+                "duration": job.get("duration"),
+                "success": not job.get("error"),
+                "error": job.get("error"),
+                "text": job.get("text", ""),
+            } for job in finished if job.get("work") == name]
+            try:
+                self.indexes[name] = self.transcriber.write_index(work, items)
+                self.transcriber.report_status("index", "completed", f"合并索引: {self.indexes[name].name}",
+                                               {"work": name, "file": str(self.indexes[name])})
+            except Exception as e:
+                print(f"⚠️  写合并索引失败: {e}")
+
+
+# 客户端可按任务覆盖的转录器参数（与 BiliTranscriber 构造参数同名），其余沿用服务启动时的设置
+JOB_TRANSCRIBER_OPTIONS = ("backend", "compute_type", "asr_workers", "chunk_minutes", "share_weights",
+                           "long_audio_minutes", "vad", "vad_padding", "stream", "formats", "include_tokens",
+                           "compress", "subtitle_policy", "threads", "target_rtf", "deadline")
+
+
+def job_transcriber_options(base: dict, overrides: dict) -> dict:
+    """在服务端的转录器参数上叠加单个任务的覆盖项；no_cache/refresh 作用于共享的结果缓存"""
+    options = dict(base)
+    options.update({k: overrides[k] for k in JOB_TRANSCRIBER_OPTIONS if k in overrides})
+    if overrides.get("no_cache"):
+        options["result_cache"] = None
+    elif overrides.get("refresh") and options.get("result_cache") is not None:
+        # 只对这个任务跳过读取缓存，结果照常写入共享缓存
+        refreshed = copy.copy(options["result_cache"])
+        refreshed.read_enabled = False
+        options["result_cache"] = refreshed
+    return options
+
+
+class TranscribeRequestHandler(socketserver.StreamRequestHandler):
+    """服务模式请求处理：读取一行JSON任务，逐行回传状态事件，最后一行为结果"""
+
+    JOB_FIELDS = ("model", "language", "keep_video", "skip_download", "device", "keep_audio", "pages")
+
+    def _send(self, obj: dict):
+        line = json.dumps(obj, ensure_ascii=False) + "\n"
+        with self._send_lock:
+            self.wfile.write(line.encode("utf-8"))
+            self.wfile.flush()
+
+    def handle(self):
+        self._send_lock = threading.Lock()
+        raw = self.rfile.readline()
+        try:
+            job = json.loads(raw.decode("utf-8"))
+            if not isinstance(job, dict) or not job.get("url"):
+                raise ValueError("任务缺少 url 字段")
+        except Exception as e:
+            self._send({"success": False, "error": f"无效的任务: {e}", "error_type": type(e).__name__})
+            return
+
+        server: "TranscribeServer" = self.server
+        options = {k: job[k] for k in self.JOB_FIELDS if k in job}
+        options.setdefault("model", server.default_model)
+        print(f"🛰️  收到任务: {job['url']} ({options['model']})")
+
+        try:
+            transcriber = BiliTranscriber(output_dir=job.get("output_dir") or server.output_dir,
+                                          **job_transcriber_options(server.transcriber_options,
+                                                                    job.get("options") or {}))
+            transcriber.status_callback = self._send
+            result = transcriber.process(url=job["url"], **options)
+            self._send({
+                "success": bool(result),
+                "output_dir": str(transcriber.output_dir),
+                "files": {k: str(v) for k, v in (result or {}).items()}
+            })
+        except BrokenPipeError:
+            print(f"⚠️  客户端已断开: {job['url']}")
+        except Exception as e:
+            try:
+                self._send({"success": False, "error": str(e), "error_type": type(e).__name__})
+            except OSError:
+                pass
+
+
+class TranscribeServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """常驻转录服务（本地TCP端口），模型只加载一次"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, output_dir: str, transcriber_options: dict, default_model: str = "small"):
+        self.output_dir = output_dir
+        # 所有任务共享的转录器参数（模型缓存、结果缓存等）
+        self.transcriber_options = transcriber_options
+        self.default_model = default_model
+        super().__init__(address, TranscribeRequestHandler)
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class UnixTranscribeServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """常驻转录服务（Unix socket）"""
+
+        daemon_threads = True
+
+        def __init__(self, address, output_dir: str, transcriber_options: dict, default_model: str = "small"):
+            self.output_dir = output_dir
+            self.transcriber_options = transcriber_options
+            self.default_model = default_model
+            super().__init__(address, TranscribeRequestHandler)
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser):
+    """添加转录结果缓存相关参数"""
+    group = parser.add_argument_group("转录缓存")
+    group.add_argument("--no-cache", action="store_true", help="不读取也不写入转录结果缓存")
+    group.add_argument("--refresh", action="store_true", help="忽略已有缓存重新转录，并更新缓存")
+    group.add_argument("--cache-max-size", type=float, default=2048, help="缓存总大小上限，单位MB (默认: 2048)")
+    group.add_argument("--cache-max-age", type=float, default=90, help="缓存条目最长保留天数 (默认: 90)")
+    group.add_argument("--media-cache-max-size", type=float, default=4096,
+                       help="下载媒体缓存的磁盘预算，单位MB，按LRU淘汰；0 表示不缓存 (默认: 4096)")
+    group.add_argument("--dedup", action="store_true",
+                       help="提取音频后计算声学指纹，与已转录音频内容相同时（搬运/镜像视频）复用其转录并校正偏移")
+    group.add_argument("--dedup-threshold", type=float, default=0.03,
+                       help="判定为相同内容的指纹得分下限，即同一偏移上命中的哈希比例 (默认: 0.03)")
+    group.add_argument("--dedup-db", default=str(CACHE_DIR / "fingerprints.db"),
+                       help="声学指纹索引数据库 (默认: ~/.cache/bili_transcribe/fingerprints.db)")
+    group.add_argument("--no-resume", action="store_true",
+                       help="不使用检查点：忽略上次中断留下的进度，失败时也立即清理中间文件")
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser):
+    """添加阶段指标输出相关参数"""
+    group = parser.add_argument_group("指标")
+    group.add_argument("--metrics-json", action="store_true",
+                       help="每个任务结束后在输出目录写出 <名称>.metrics.json（各阶段耗时、CPU、峰值内存、字节数、RTF）")
+    group.add_argument("--prometheus-textfile", help="以 Prometheus textfile 格式导出指标到该文件（node_exporter 收集）")
+
+
+def add_output_arguments(parser: argparse.ArgumentParser):
+    """添加输出格式和检索索引相关参数"""
+    group = parser.add_argument_group("输出格式")
+    group.add_argument("--formats", type=parse_formats, default=list(DEFAULT_FORMATS),
+                       help=f"输出格式，逗号分隔，可选 {','.join(OUTPUT_FORMATS)} (默认: {','.join(DEFAULT_FORMATS)})")
+    group.add_argument("--include-tokens", action="store_true", help="JSON/JSONL 片段中保留 tokens（默认省略）")
+    group.add_argument("--compress", type=parse_compress,
+                       help="压缩 JSON/JSONL 输出（zstd 需要 pip install zstandard）")
+    group.add_argument("--search-index", action="store_true",
+                       help="保存结果时把片段写入全文检索索引（用 search 子命令查询）")
+    group.add_argument("--index-db", default=str(CACHE_DIR / "search.db"),
+                       help="检索索引路径 (默认: ~/.cache/bili_transcribe/search.db)")
+
+
+def build_media_cache(args) -> Optional[MediaCache]:
+    """根据命令行参数创建媒体缓存（预算为 0 时不缓存）"""
+    if args.media_cache_max_size <= 0:
+        return None
+    return MediaCache(CACHE_DIR / "media", max_size_mb=args.media_cache_max_size)
+
+
+def build_result_cache(args) -> Optional[TranscriptCache]:
+    """根据命令行参数创建转录结果缓存"""
+    if args.no_cache:
+        return None
+    return TranscriptCache(CACHE_DIR / "results", max_size_mb=args.cache_max_size,
+                           max_age_days=args.cache_max_age, read_enabled=not args.refresh)
+
+
+def add_asr_arguments(parser: argparse.ArgumentParser):
+    """添加语音转录执行相关参数"""
+    group = parser.add_argument_group("转录执行")
+    group.add_argument("--backend", default="whisper", choices=sorted(ASR_BACKENDS),
+                       help="语音识别后端 (默认: whisper)，faster-whisper 在CPU上更快、内存更省")
+    group.add_argument("--compute-type", choices=sorted({t for b in ASR_BACKENDS.values() for t in b.compute_types}),
+                       help="推理精度 (faster-whisper 默认: int8；whisper 默认 fp32，int8 为CPU上线性层动态量化)")
+    group.add_argument("--asr-workers", type=int, default=0,
+                       help="长音频按静音切块，用N个进程并行转录，每个进程绑定一部分CPU核心 (默认: 关闭)")
+    group.add_argument("--chunk-minutes", type=positive_float, default=5, help="分块转录时每块的目标时长，单位分钟 (默认: 5)")
+    group.add_argument("--batch-size", type=int, default=0,
+                       help="跨任务批量解码：把同时转录的多个音频的 30 秒窗口凑成一批推理，N 为每批窗口数上限 "
+                            "(默认: 关闭，仅 whisper)")
+    group.add_argument("--batch-wait", type=float, default=0.1,
+                       help="批量解码凑批的最长等待时间，单位秒 (默认: 0.1)")
+    group.add_argument("--long-audio-minutes", type=float, default=60,
+                       help="音频超过该时长时按 30 秒窗口从文件读取并解码，峰值内存与时长无关；"
+                            "与 --vad/--asr-workers/--batch-size 同时开启时不分窗（会给出警告） (默认: 60，0 或负数关闭)")
+    group.add_argument("--share-weights", action="store_true",
+                       help="分块转录的各 worker 共用一份模型权重：whisper 在父进程加载后 fork（写时复制），"
+                            "faster-whisper 用一个模型实例多路并行")
+    group.add_argument("--stream", action="store_true",
+                       help="流式输出：每解码出一个片段就追加写入 TXT/SRT/MD/JSONL，Task模式下逐段输出事件。"
+                            "音频按约 30 秒窗口分别解码（窗口间传递提示文本），结果可能与整段转录略有不同；"
+                            "--asr-workers 不生效")
+    group.add_argument("--vad", choices=sorted(VAD_DETECTORS), help="转录前做语音检测，跳过静音和非语音片段")
+    group.add_argument("--vad-padding", type=float, default=0.3, help="语音区间两端保留的余量，单位秒 (默认: 0.3)")
+    group.add_argument("--subtitle-policy", choices=SUBTITLE_POLICIES, default="asr-only",
+                       help="现有字幕（UP主CC字幕/AI字幕）的用法：asr-only 总是语音识别 (默认)；"
+                            "prefer 有所需语言的字幕时直接使用，跳过下载和转录；compare 照常转录并与字幕比较")
+    group.add_argument("--threads", type=int, default=0,
+                       help="每个转录任务的推理线程数 (默认: CPU核心数按真正并行的转录数均分；"
+                            "共用模型或批量解码时使用全部核心)")
+    group.add_argument("--target-rtf", type=float,
+                       help="--model auto 的目标实时率（解码耗时/音频时长），选能满足它的最准确模型 (默认: 1.0)")
+    group.add_argument("--deadline", type=parse_duration,
+                       help="--model auto 的单个任务转录时限，如 10m；与 --target-rtf 同时给出时取更严者")
+
+
+def check_asr_arguments(parser: argparse.ArgumentParser, args, backends: Optional[List[str]] = None):
+    """在参数解析阶段校验 --compute-type/--batch-size 是否受所选后端支持（各子命令共用）"""
+    for name in backends or [args.backend]:
+        try:
+            ASR_BACKENDS[name].check_options(args.compute_type, args.batch_size)
+        except ValueError as e:
+            parser.error(str(e))
+
+
+def transcriber_options_from_args(args, concurrency: int = 1) -> dict:
+    """把命令行参数转换为 BiliTranscriber 的构造参数
+
+    concurrency 为真正并行的解码数（各自持有模型，用于划分推理线程）。共用一个模型的转录在条目锁上
+    串行执行，批量解码也只在一个调度线程里推理，这两种情况应传 1，每次解码使用全部核心。
+    """
+    if args.batch_size > 1:
+        concurrency = 1
+    return {
+        "result_cache": build_result_cache(args),
+        "asr_workers": args.asr_workers,
+        "share_weights": args.share_weights,
+        "batch_size": args.batch_size,
+        "batch_wait": args.batch_wait,
+        # 同一组参数创建的所有转录器（queue/serve 的每个任务）共用一个批量解码器，窗口才能跨任务合批
+        "batch_decoder": BatchDecoder(args.batch_size, args.batch_wait) if args.batch_size > 1 else None,
+        "long_audio_minutes": args.long_audio_minutes,
+        "chunk_minutes": args.chunk_minutes,
+        "vad": args.vad,
+        "vad_padding": args.vad_padding,
+        "backend": args.backend,
+        "compute_type": args.compute_type,
+        "stream": args.stream,
+        "checkpoint": not args.no_resume,
+        "max_parallel": args.max_parallel,
+        "metrics_json": args.metrics_json,
+        "prometheus": PrometheusTextfile(args.prometheus_textfile) if args.prometheus_textfile else None,
+        "formats": args.formats,
+        "include_tokens": args.include_tokens,
+        "compress": args.compress,
+        "search_index": TranscriptIndex(Path(args.index_db).expanduser()) if args.search_index else None,
+        "media_cache": build_media_cache(args),
+        "fingerprint_index": FingerprintIndex(Path(args.dedup_db).expanduser(), args.dedup_threshold,
+                                              read_enabled=not args.refresh) if args.dedup else None,
+        "threads": args.threads or partition_threads(concurrency),
+        "target_rtf": args.target_rtf,
+        "deadline": args.deadline,
+        "calibration": RTFCalibration(CACHE_DIR / "calibration.json"),
+        "subtitle_policy": args.subtitle_policy,
+    }
+
+
+def parse_server_address(address: str):
+    """解析服务地址：unix:/path/to.sock、/path/to.sock 或 host:port"""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    if "/" in address:
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"无效的服务地址: {address}")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def serve_main(args_list) -> int:
+    """serve 子命令：启动常驻转录服务"""
+    parser = argparse.ArgumentParser(prog="bili-transcribe.py serve", description="常驻转录服务")
+    parser.add_argument("--listen", default="127.0.0.1:8765",
+                        help="监听地址：host:port 或 unix:/path/to.sock (默认: 127.0.0.1:8765)")
+    parser.add_argument("--output-dir", default="~/bili-transcribe-output", help="默认输出目录")
+    parser.add_argument("--model", default="small", help="任务未指定模型时使用的模型 (默认: small)，可为 auto")
+    parser.add_argument("--max-models", type=int, default=2, help="最多同时驻留的模型数 (默认: 2)")
+    parser.add_argument("--preload", action="append", default=[], help="启动时预加载的模型，可重复")
+    parser.add_argument("--max-parallel", type=int, default=4, help="单个任务拆分出的分P同时处理数上限 (默认: 4)")
+    add_cache_arguments(parser)
+    add_asr_arguments(parser)
+    add_metrics_arguments(parser)
+    add_output_arguments(parser)
+    args = parser.parse_args(args_list)
+    check_asr_arguments(parser, args)
+
+    family, address = parse_server_address(args.listen)
+    model_cache = ModelCache(args.max_models)
+    transcriber_options = dict(transcriber_options_from_args(args), model_cache=model_cache)
+
+    backend = ASR_BACKENDS[args.backend]
+    for name in args.preload:
+        model_cache.get(backend.cache_key(name, None, args.compute_type),
+                        lambda: backend.load(name, None, args.compute_type))
+
+    if family == socket.AF_UNIX:
+        if not hasattr(socketserver, "UnixStreamServer"):
+            print("❌ 当前平台不支持 Unix socket")
+            return 1
+        if os.path.exists(address):
+            os.unlink(address)
+        server = UnixTranscribeServer(address, args.output_dir, transcriber_options, args.model)
+    else:
+        server = TranscribeServer(address, args.output_dir, transcriber_options, args.model)
+
+    print(f"🛰️  转录服务已启动: {args.listen}")
+    print(f"   最多驻留模型: {model_cache.max_models} | 默认模型: {args.model}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 服务已停止")
+    finally:
+        server.server_close()
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.unlink(address)
+    return 0
+
+
+def submit_to_server(address: str, job: dict, on_event: Callable[[dict], None]) -> dict:
+    """作为客户端提交任务到常驻服务，逐个回调状态事件并返回最终结果"""
+    family, addr = parse_server_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.connect(addr)
+        sock.sendall((json.dumps(job, ensure_ascii=False) + "\n").encode("utf-8"))
+        with sock.makefile("r", encoding="utf-8") as reader:
+            for line in reader:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if "success" in event:
+                    return event
+                on_event(event)
+    raise RuntimeError("服务端在返回结果前断开连接")
+
+
+def client_options(args) -> dict:
+    """客户端显式给出的缓存/转录参数（与默认值不同的），随任务转发给服务端"""
+    parser = argparse.ArgumentParser(add_help=False)
+    add_cache_arguments(parser)
+    add_asr_arguments(parser)
+    add_output_arguments(parser)
+    defaults = vars(parser.parse_args([]))
+    return {k: getattr(args, k) for k in JOB_TRANSCRIBER_OPTIONS + ("no_cache", "refresh")
+            if getattr(args, k) != defaults[k]}
+
+
+def run_client(args, urls: List[str]) -> int:
+    """客户端模式：把任务交给常驻服务执行，多个URL时按 --max-parallel 同时提交"""
+    job = {
+        "model": args.model,
+        "language": args.language,
+        "keep_video": args.keep_video,
+        "skip_download": args.skip_download,
+        "keep_audio": args.keep_audio,
+        "pages": args.pages,
+        "output_dir": str(Path(args.output_dir).expanduser().resolve()),
+        "options": client_options(args),
+    }
+
+    def on_event(event: dict):
+        if args.task_mode:
+            print(json.dumps(event, ensure_ascii=False), file=sys.stderr, flush=True)
+        else:
+            print(f"   [{event.get('stage')}] {event.get('status')} {event.get('message', '')}")
+
+    def submit(url: str) -> dict:
+        try:
+            return submit_to_server(args.server, dict(job, url=url), on_event)
+        except (OSError, RuntimeError, ValueError) as e:
+            return {"success": False, "error": f"无法连接转录服务: {e}", "error_type": type(e).__name__}
+
+    print(f"🛰️  提交任务到服务: {args.server}" + (f"（{len(urls)} 个条目）" if len(urls) > 1 else ""))
+    try:
+        if len(urls) == 1:
+            results = [submit(urls[0])]
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=max(1, args.max_parallel)) as pool:
+                results = list(pool.map(submit, urls))
+    except KeyboardInterrupt:
+        print("\n\n⚠️ 用户中断操作")
+        if args.task_mode:
+            print(json.dumps({"success": False, "error": "用户中断"}, ensure_ascii=False))
+        return 130
+
+    for url, result in zip(urls, results):
+        prefix = f"{url}: " if len(urls) > 1 else ""
+        if result.get("success"):
+            print(f"✅ {prefix}转录完成！")
+            for file_type, file_path in result.get("files", {}).items():
+                print(f"  • {file_type.upper()}: {Path(file_path).name}")
+        else:
+            print(f"❌ {prefix}处理失败: {result.get('error')}")
+
+    succeeded = all(result.get("success") for result in results)
+    if args.task_mode:
+        if len(urls) == 1:
+            print(json.dumps(results[0], ensure_ascii=False))
+        else:
+            print(json.dumps({"success": succeeded,
+                              "items": [dict(result, url=url) for url, result in zip(urls, results)]},
+                             ensure_ascii=False))
+    return 0 if succeeded else 1
+
+
+def positive_float(text: str) -> float:
+    """argparse 类型：正数"""
+    try:
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的数值: {text}")
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"必须为正数: {text}")
+    return value
+
+
+def parse_arguments(args_list):
+    """解析参数，支持多种格式"""
+    parser = argparse.ArgumentParser(
+        description="B站视频转录工具",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("url", nargs="*", help="B站视频URL或BV号（可传多个，进入批量模式）")
+    parser.add_argument("--model", default="small",
+                        help="模型名称 (默认: small)，可选值取决于 --backend；auto 按本机实测速度和 --target-rtf/--deadline 自动选择")
+    parser.add_argument("--language", default="zh", help="视频语言 (默认: zh)")
+    parser.add_argument("--output-dir", default="~/bili-transcribe-output", help="输出目录")
+    parser.add_argument("--keep-video", action="store_true", help="保留视频文件")
+    parser.add_argument("--skip-download", action="store_true", help="跳过下载")
+    parser.add_argument("--keep-audio", action="store_true", help="在输出目录保留一份MP3音频")
+    parser.add_argument("--pages", help="选择分P：all（默认，全部分P）、3、1-5,8、10-")
+    parser.add_argument("--task-mode", action="store_true", help="Task模式：输出JSON状态到stderr，最终结果到stdout")
+    parser.add_argument("--server", help="提交到常驻转录服务（见 serve 子命令）：host:port 或 unix:/path/to.sock")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="结束时输出启动耗时分析（模块导入、命令查找、后端加载），子命令同样适用")
+    add_cache_arguments(parser)
+    add_asr_arguments(parser)
+    add_metrics_arguments(parser)
+    add_output_arguments(parser)
+
+    batch = parser.add_argument_group("批量模式")
+    batch.add_argument("--input-file", help="从文件读取URL列表，每行一个（'-' 表示标准输入）")
+    batch.add_argument("--download-workers", type=int, default=2, help="并发下载数 (默认: 2)")
+    batch.add_argument("--extract-workers", type=int, default=2, help="并发音频提取数 (默认: 2)")
+    batch.add_argument("--transcribe-workers", type=int, default=1, help="并发转录数 (默认: 1)")
+    batch.add_argument("--queue-size", type=int, default=4, help="阶段间队列容量 (默认: 4)")
+    batch.add_argument("--max-parallel", type=int, default=4,
+                       help="同时处理中的视频/分P数上限，多分P和合集同样适用 (默认: 4)")
+
+    args = parser.parse_args(args_list)
+    if not args.url and not args.input_file:
+        parser.error("请提供B站视频URL/BV号，或使用 --input-file")
+    backend = ASR_BACKENDS[args.backend]
+    if args.model != "auto" and args.model not in backend.valid_models:
+        parser.error(f"后端 {backend.name} 不支持模型 '{args.model}'，可选: auto, {', '.join(backend.valid_models)}")
+    check_asr_arguments(parser, args)
+    return args
+
+
+def queue_worker(job_queue: JobQueue, args, transcriber_options: dict, stop: threading.Event, index: int,
+                 inflight: dict):
+    """队列 worker 线程：循环认领并执行任务，直到收到停止信号（或 --exit-when-empty 时队列已空）"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    while not stop.is_set():
+        job = job_queue.claim(worker_id, args.lease)
+        if job is None:
+            if args.exit_when_empty and job_queue.pending() == 0:
+                return
+            stop.wait(args.poll_interval)
+            continue
+
+        options = dict(job["options"])
+        output_dir = options.pop("output_dir", None) or args.output_dir
+        print(f"\n📋 [{worker_id}] 认领任务 #{job['id']}: {job['url']}（第 {job['attempts']} 次尝试）")
+        state = {"stage": "init", "failed": [], "metrics": {}}
+        done = threading.Event()
+        inflight[job["id"]] = worker_id
+
+        def on_event(event: dict):
+            stage, status = event.get("stage"), event.get("status")
+            data = event.get("data") or {}
+            if stage == "metrics":
+                state["metrics"][data.get("item") or data.get("job")] = data
+            elif status == "running" and stage not in ("init", "batch"):
+                state["stage"] = stage
+                job_queue.heartbeat(job["id"], worker_id, args.lease, stage)
+            elif status == "failed" and stage != "error":
+                state["failed"].append(stage)
+
+        def keep_alive():
+            # 转录等长阶段中没有事件，定期续约
+            while not done.wait(args.lease / 3):
+                if not job_queue.heartbeat(job["id"], worker_id, args.lease):
+                    print(f"⚠️  任务 #{job['id']} 的租约已失效")
+                    return
+
+        heartbeat = threading.Thread(target=keep_alive, name=f"lease-{job['id']}", daemon=True)
+        heartbeat.start()
+        try:
+            transcriber = BiliTranscriber(output_dir=output_dir, **transcriber_options)
+            transcriber.status_callback = on_event
+            files = transcriber.process(url=job["url"], **options)
+            job_queue.complete(job["id"], worker_id, {k: str(v) for k, v in (files or {}).items()},
+                               state["metrics"])
+            print(f"✅ 任务 #{job['id']} 完成")
+        except Exception as e:
+            stages = state["failed"] or [state["stage"]]
+            retry = job["attempts"] < job["max_attempts"] and any(st in JobQueue.RETRY_STAGES for st in stages)
+            delay = min(args.retry_base * 2 ** (job["attempts"] - 1), args.retry_max) if retry else None
+            job_queue.fail(job["id"], worker_id, str(e), stages[-1], state["metrics"], delay)
+            if retry:
+                print(f"🔁 任务 #{job['id']} 在 {stages[-1]} 阶段失败，{delay:.0f} 秒后重试: {e}")
+            else:
+                print(f"❌ 任务 #{job['id']} 失败: {e}")
+        finally:
+            done.set()
+            inflight.pop(job["id"], None)
+
+
+def queue_main(args_list) -> int:
+    """queue 子命令：基于本地 SQLite 的持久化任务队列（enqueue / worker / status）"""
+    parser = argparse.ArgumentParser(prog="bili-transcribe.py queue", description="持久化任务队列")
+    parser.add_argument("--db", default=str(CACHE_DIR / "queue.db"), help="队列数据库路径 (默认: ~/.cache/bili_transcribe/queue.db)")
+    actions = parser.add_subparsers(dest="action", required=True)
+
+    enqueue = actions.add_parser("enqueue", help="添加任务")
+    enqueue.add_argument("url", nargs="*", help="B站视频URL或BV号")
+    enqueue.add_argument("--input-file", help="从文件读取URL列表，每行一个（'-' 表示标准输入）")
+    enqueue.add_argument("--priority", type=int, default=0, help="优先级，越大越先执行 (默认: 0)")
+    enqueue.add_argument("--max-attempts", type=int, default=3, help="最多尝试次数 (默认: 3)")
+    enqueue.add_argument("--model", default="small", help="模型名称 (默认: small)，auto 为按 worker 所在主机自动选择")
+    enqueue.add_argument("--language", default="zh", help="视频语言 (默认: zh)")
+    enqueue.add_argument("--pages", help="选择分P：all（默认）、3、1-5,8、10-")
+    enqueue.add_argument("--keep-video", action="store_true", help="保留视频文件")
+    enqueue.add_argument("--keep-audio", action="store_true", help="在输出目录保留一份MP3音频")
+    enqueue.add_argument("--output-dir", help="输出目录（默认使用 worker 的 --output-dir）")
+
+    worker = actions.add_parser("worker", help="运行 worker，认领并执行任务")
+    worker.add_argument("--concurrency", type=int, default=1, help="同时执行的任务数 (默认: 1)")
+    worker.add_argument("--output-dir", default="~/bili-transcribe-output", help="默认输出目录")
+    worker.add_argument("--lease", type=float, default=600, help="任务租约秒数，超时未续约的任务会被重新认领 (默认: 600)")
+    worker.add_argument("--retry-base", type=float, default=30, help="重试退避的初始秒数，每次翻倍 (默认: 30)")
+    worker.add_argument("--retry-max", type=float, default=3600, help="重试退避的最长秒数 (默认: 3600)")
+    worker.add_argument("--poll-interval", type=float, default=5, help="队列为空时的轮询间隔秒数 (默认: 5)")
+    worker.add_argument("--exit-when-empty", action="store_true", help="队列中没有待执行任务时退出")
+    worker.add_argument("--max-parallel", type=int, default=4, help="单个任务拆分出的分P同时处理数上限 (默认: 4)")
+    add_cache_arguments(worker)
+    add_asr_arguments(worker)
+    add_metrics_arguments(worker)
+    add_output_arguments(worker)
+
+    status = actions.add_parser("status", help="查看队列深度、吞吐和运行中的任务")
+    status.add_argument("--recent", type=int, default=10, help="列出最近的任务数 (默认: 10)")
+    status.add_argument("--json", action="store_true", help="以JSON输出")
+
+    args = parser.parse_args(args_list)
+    if args.action == "worker":
+        check_asr_arguments(parser, args)
+    job_queue = JobQueue(Path(args.db).expanduser())
+
+    if args.action == "enqueue":
+        urls = list(args.url)
+        if args.input_file:
+            urls.extend(read_url_list(args.input_file))
+        if not urls:
+            parser.error("请提供URL/BV号，或使用 --input-file")
+        options = {"model": args.model, "language": args.language, "pages": args.pages,
+                   "keep_video": args.keep_video, "keep_audio": args.keep_audio}
+        if args.output_dir:
+            options["output_dir"] = str(Path(args.output_dir).expanduser().resolve())
+        for url in urls:
+            job_id = job_queue.enqueue(url, options, args.priority, args.max_attempts)
+            print(f"✅ 已加入队列 #{job_id}: {url}")
+        return 0
+
+    if args.action == "status":
+        stats = job_queue.stats(args.recent)
+        if args.json:
+            print(json.dumps(stats, ensure_ascii=False, indent=2))
+            return 0
+        counts = stats["counts"]
+        print(f"📋 队列: {stats['db']}")
+        print(f"   排队 {counts['queued']}（其中 {stats['delayed']} 个等待重试） | 运行中 {counts['running']} | "
+              f"完成 {counts['done']} | 失败 {counts['failed']}")
+        for label, data in stats["throughput"].items():
+            avg = f"，平均耗时 {data['avg_seconds']}s" if data["avg_seconds"] else ""
+            print(f"   最近{label}: 完成 {data['done']} 个{avg}")
+        if stats["running"]:
+            print("\n运行中:")
+            for job in stats["running"]:
+                print(f"   #{job['id']} {job['url']} [{job['stage'] or '-'}] {job['worker']} "
+                      f"已运行 {time.time() - job['started_at']:.0f}s")
+        if stats["recent"]:
+            print("\n最近任务:")
+            for job in stats["recent"]:
+                error = f" - {job['error']}" if job["error"] and job["status"] != "done" else ""
+                print(f"   #{job['id']} [{job['status']}] P{job['priority']} {job['url']} "
+                      f"(尝试 {job['attempts']}){error}")
+        return 0
+
+    backend = ASR_BACKENDS[args.backend]
+    concurrency = max(1, args.concurrency)
+    transcriber_options = transcriber_options_from_args(args, concurrency)
+    probe = BiliTranscriber(output_dir=args.output_dir, **transcriber_options)
+    probe.ensure_dependencies()
+
+    print(f"🛠️  队列 worker 启动: {args.db} | 并发 {concurrency} | 后端 {backend.name}")
+    if concurrency > 1:
+        print(f"   每个 worker 线程各自加载模型（内存约为 {concurrency} 份），推理线程按并发数均分CPU核心")
+    stop = threading.Event()
+    inflight: Dict[int, str] = {}
+    # 每个 worker 线程有自己的模型缓存：多个转录真正并行，任务切换模型时也只替换本线程的模型
+    threads = [threading.Thread(target=queue_worker,
+                                args=(job_queue, args, dict(transcriber_options, model_cache=ModelCache(1)),
+                                      stop, n, inflight),
+                                name=f"queue-worker-{n}", daemon=True)
+               for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    try:
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(timeout=0.5)
+    except KeyboardInterrupt:
+        # 把执行中的任务放回队列；若进程被强制杀死，则由租约过期机制回收
+        stop.set()
+        for job_id, worker_id in list(inflight.items()):
+            job_queue.release(job_id, worker_id)
+        print(f"\n⚠️ 收到中断，worker 退出，{len(inflight)} 个执行中的任务已重新排队")
+        return 130
+    return 0
+
+
+# 输出名形如 BVxxxx 或 BVxxxx_p3 / collection123_p3
+OUTPUT_NAME_RE = re.compile(r'^(.+?)(?:_p(\d+))?$')
+
+
+def transcript_outputs(directory: Path) -> Dict[str, Path]:
+    """在输出目录中找出每个转录的 JSON（没有 JSON 时用 JSONL），键为输出名"""
+    found: Dict[str, Path] = {}
+    for fmt in ("jsonl", "json"):
+        for suffix in ("", *COMPRESS_SUFFIXES.values()):
+            for path in directory.rglob(f"*.{fmt}{suffix}"):
+                name = path.name[:-len(f".{fmt}{suffix}")]
+                if not name.endswith(".metrics"):
+                    found[name] = path
+    return found
+
+
+def load_transcript_output(path: Path) -> Optional[dict]:
+    """读取 JSON 或 JSONL 输出，返回 {"segments", "video"}；不是转录结果时返回 None"""
+    with open_input(path) as f:
+        if ".jsonl" in path.suffixes:
+            segments = [json.loads(line) for line in f if line.strip()]
+            data = {"segments": segments}
+        else:
+            data = json.load(f)
+    if not isinstance(data, dict) or not isinstance(data.get("segments"), list):
+        return None
+    return data
+
+
+def reindex_outputs(index: TranscriptIndex, directories: List[Path], rebuild: bool = False) -> dict:
+    """从已有的输出文件重建检索索引；默认跳过源文件未变化的转录"""
+    if rebuild:
+        index.clear()
+    indexed = index.indexed_mtimes()
+    counts = {"indexed": 0, "segments": 0, "unchanged": 0, "skipped": 0}
+    for directory in directories:
+        for name, path in sorted(transcript_outputs(directory).items()):
+            if name in indexed and indexed[name] == path.stat().st_mtime:
+                counts["unchanged"] += 1
+                continue
+            try:
+                data = load_transcript_output(path)
+            except (OSError, ValueError, ImportError) as e:
+                print(f"⚠️  跳过 {path.name}: {e}")
+                data = None
+            if data is None:
+                counts["skipped"] += 1
+                continue
+            video = data.get("video") or {}
+            base, page = OUTPUT_NAME_RE.match(name).groups()
+            title = video.get("title")
+            md_path = path.with_name(f"{name}.md")
+            if not title and md_path.exists():
+                with open(md_path, encoding="utf-8") as f:
+                    title = f.readline().lstrip("# ").strip() or None
+            counts["segments"] += index.add(name, data["segments"], video.get("bvid") or base,
+                                            video.get("page") or int(page or 1), title, path)
+            counts["indexed"] += 1
+    return counts
+
+
+def search_main(args_list) -> int:
+    """search 子命令：在全文检索索引中查找说过某句话的位置"""
+    parser = argparse.ArgumentParser(prog="bili-transcribe.py search",
+                                     description="全文检索所有转录结果，返回带时间戳的命中片段")
+    parser.add_argument("query", nargs="*", help="检索词，多个词用空格分隔（需同时出现）")
+    parser.add_argument("--db", default=str(CACHE_DIR / "search.db"), help="检索索引路径 (默认: ~/.cache/bili_transcribe/search.db)")
+    parser.add_argument("--limit", type=int, default=20, help="最多返回的结果数 (默认: 20)")
+    parser.add_argument("--bvid", help="只在该BV号的转录中检索")
+    parser.add_argument("--json", action="store_true", help="以JSON输出")
+    parser.add_argument("--reindex", nargs="+", metavar="DIR",
+                        help="从这些输出目录中已有的 JSON/JSONL 结果更新索引（跳过未变化的文件）")
+    parser.add_argument("--rebuild", action="store_true", help="与 --reindex 一起使用：先清空索引再全部重建")
+    parser.add_argument("--stats", action="store_true", help="显示索引规模")
+    args = parser.parse_args(args_list)
+    if args.rebuild and not args.reindex:
+        parser.error("--rebuild 需要与 --reindex DIR 一起使用")
+    if not (args.query or args.reindex or args.stats):
+        parser.error("请提供检索词，或使用 --reindex / --stats")
+
+    index = TranscriptIndex(Path(args.db).expanduser())
+    if args.reindex:
+        start = time.perf_counter()
+        counts = reindex_outputs(index, [Path(d).expanduser() for d in args.reindex], args.rebuild)
+        print(f"✅ 已索引 {counts['indexed']} 个转录（{counts['segments']} 个片段），"
+              f"未变化 {counts['unchanged']}，跳过 {counts['skipped']}，用时 {time.perf_counter() - start:.1f}s")
+    if args.stats:
+        stats = index.stats()
+        print(f"📚 {stats['db']}: {stats['transcripts']} 个转录，{stats['segments']} 个片段，"
+              f"{stats['size_bytes'] / 1024 / 1024:.1f} MB")
+    if not args.query:
+        return 0
+
+    query = " ".join(args.query)
+    start = time.perf_counter()
+    hits = index.search(query, args.limit, args.bvid)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if args.json:
+        print(json.dumps({"query": query, "elapsed_ms": round(elapsed_ms, 2), "hits": hits},
+                         ensure_ascii=False, indent=2))
+        return 0
+
+    print(f"🔍 {query}: {len(hits)} 条结果（{elapsed_ms:.1f} ms）")
+    terms = [t for t in query.split() if t]
+    for i, hit in enumerate(hits, 1):
+        text = hit["text"]
+        for term in terms:
+            text = re.sub(re.escape(term), lambda m: f"【{m.group(0)}】", text, flags=re.IGNORECASE)
+        where = hit["title"] or hit["name"]
+        print(f"\n{i:>3}. {where} [P{hit['page'] or 1}] {time.strftime('%H:%M:%S', time.gmtime(hit['start']))}")
+        print(f"     {hit['url'] or hit['name']}")
+        print(f"     {text}")
+    return 0
+
+
+def read_url_list(path: str) -> List[str]:
+    """读取URL列表文件，忽略空行和 # 注释"""
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        lines = Path(path).expanduser().read_text(encoding="utf-8").splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+
+def run_batch(args, urls: List[str]) -> int:
+    """批量模式入口"""
+    print(f"🎬 B站视频批量转录")
+    print(f"{'─' * 40}")
+    print(f"📹 条目: {len(urls)}")
+    print(f"🤖 模型: {args.model}")
+    print(f"🌐 语言: {args.language}")
+    print(f"📁 输出: {args.output_dir}")
+    print(f"⚙️  并发: 下载 {args.download_workers} | 提取 {args.extract_workers} | 转录 {args.transcribe_workers}")
+    print(f"{'─' * 40}\n")
+
+    try:
+        # 复用已加载的模型，避免逐个视频重复加载；多个转录线程时流水线为每个线程各建一个模型缓存
+        transcriber = BiliTranscriber(output_dir=args.output_dir, task_mode=args.task_mode,
+                                      model_cache=ModelCache(1),
+                                      **transcriber_options_from_args(args, args.transcribe_workers))
+        transcriber.ensure_dependencies()
+        pipeline = BatchPipeline(
+            transcriber,
+            model=args.model,
+            language=args.language,
+            keep_video=args.keep_video,
+            skip_download=args.skip_download,
+            download_workers=args.download_workers,
+            extract_workers=args.extract_workers,
+            transcribe_workers=args.transcribe_workers,
+            queue_size=args.queue_size,
+            keep_audio=args.keep_audio,
+            pages=args.pages
+        )
+        results = pipeline.run(urls)
+    except KeyboardInterrupt:
+        print("\n\n⚠️ 用户中断操作")
+        if args.task_mode:
+            print(json.dumps({"success": False, "error": "用户中断"}, ensure_ascii=False))
+        return 130
+    except Exception as e:
+        print(f"\n❌ 处理失败: {e}")
+        if args.task_mode:
+            print(json.dumps({"success": False, "error": str(e), "error_type": type(e).__name__},
+                             ensure_ascii=False))
+        return 1
+
+    succeeded = [r for r in results if r["success"]]
+    print(f"\n{'─' * 40}")
+    print(f"✅ 批量转录完成: 成功 {len(succeeded)}/{len(results)}")
+    for r in results:
+        if not r["success"]:
+            print(f"  ❌ {r.get('output_name') or r['url']}: {r['error']}")
+
+    if args.task_mode:
+        print(json.dumps({
+            "success": len(succeeded) == len(results),
+            "output_dir": str(transcriber.output_dir),
+            "items": results
+        }, ensure_ascii=False))
+
+    return 0 if len(succeeded) == len(results) else 1
+
+
+# bench 子命令的合成测试素材：ffmpeg lavfi 表达式，结果确定可复现
+BENCH_FIXTURES = {
+    # 纯音
+    "tone": "sine=frequency=440:sample_rate=16000",
+    # 7秒音 + 3秒静音交替
+    "gaps": "aevalsrc=exprs='0.5*sin(2*PI*440*t)*lt(mod(t,10),7)':s=16000",
+    # 类语音噪声：4Hz 音节包络调制的噪声，每6秒停顿1秒（random 使用固定种子）
+    "noise": "aevalsrc=exprs='(2*random(0)-1)*(0.3+0.3*sin(2*PI*4*t))*lt(mod(t,6),5)':s=16000",
+}
+
+BENCH_STAGES = ("download", "extract_audio", "transcribe", "save", "cleanup")
+
+# bench 用的 BBDown 替身：模拟一个 BENCH_PAGES P 的视频，把 BILI_BENCH_FIXTURE 指向的素材复制到 --work-dir 下。
+# 与真实 BBDown 一致，多P视频使用 --multi-file-pattern，未指定时写到 <标题>/[P<N>]<分P标题> 子目录。
+# --sub-only 时按 BILI_BENCH_SUBTITLES（如 ai-zh.json,zh-CN.srt）写出 <文件名>.<语言>.srt/.json 字幕
+BENCH_PAGES = 2
+BENCH_BBDOWN = """#!/usr/bin/env python3
+import json, os, shutil, sys
+args = sys.argv[1:]
+pages = %d
+if "--only-show-info" in args:
+    print("视频标题: bench")
+    for p in range(1, pages + 1):
+        print(f"P{p}: [{p}] [bench{p}] [00m00s]")
+    sys.exit(0)
+def option(name, default=None):
+    return args[args.index(name) + 1] if name in args else default
+work_dir = option("--work-dir")
+page = option("--select-page", "1")
+if pages > 1:
+    pattern = option("--multi-file-pattern", os.path.join("bench", f"[P{int(page):02d}]bench{page}"))
+else:
+    pattern = option("--file-pattern", "bench")
+base = os.path.join(work_dir, pattern)
+os.makedirs(os.path.dirname(base), exist_ok=True)
+if "--sub-only" in args:
+    for name in filter(None, os.environ.get("BILI_BENCH_SUBTITLES", "").split(",")):
+        lang, ext = name.rsplit(".", 1)
+        label = "AI" if lang.startswith("ai-") else "CC"
+        cues = [(i * 3.0, i * 3.0 + 2.5, f"{label}字幕{lang}第{i}句") for i in range(10)]
+        with open(f"{base}.{lang}.{ext}", "w", encoding="utf-8") as f:
+            if ext == "json":
+                json.dump({"body": [{"from": a, "to": b, "content": t} for a, b, t in cues]}, f, ensure_ascii=False)
+            else:
+                for i, (a, b, t) in enumerate(cues):
+                    f.write(f"{i + 1}\\n00:00:{a:06.3f} --> 00:00:{b:06.3f}\\n{t}\\n\\n".replace(".", ","))
+    sys.exit(0)
+src = os.environ["BILI_BENCH_FIXTURE"]
+shutil.copyfile(src, base + os.path.splitext(src)[1])
+""" % BENCH_PAGES
+
+# bench 的字幕检查：(名称, 替身产出的字幕文件, 语言, 期望选中的字幕语言)
+BENCH_SUBTITLE_CASES = [
+    ("cc-over-ai", ("ai-zh.json", "zh-CN.srt"), "zh", "zh-CN"),
+    ("ai-only", ("ai-zh.json",), "zh", "ai-zh"),
+    ("ai-language", ("ai-en.json", "ai-zh.json"), "zh", "ai-zh"),
+    ("no-match", ("en-US.srt",), "zh", None),
+]
+
+
+def parse_duration(text: str) -> float:
+    """解析时长：30、30s、5m、2h"""
+    text = text.strip().lower()
+    units = {"s": 1, "m": 60, "h": 3600}
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def make_fixture(transcriber: "BiliTranscriber", kind: str, seconds: float, fixture_dir: Path) -> Path:
+    """用 ffmpeg 生成确定性的测试素材（AAC 音频，与 BBDown 音频流格式一致），已存在时复用"""
+    fixture_dir.mkdir(parents=True, exist_ok=True)
+    path = fixture_dir / f"{kind}-{int(seconds)}s.m4a"
+    if path.exists() and path.stat().st_size > 0:
+        return path
+    tmp = path.with_name(f".{path.name}.tmp.m4a")
+    cmd = [transcriber.get_cmd("ffmpeg"), "-y", "-loglevel", "error",
+           "-f", "lavfi", "-i", BENCH_FIXTURES[kind], "-t", str(seconds),
+           "-ac", "1", "-ar", str(SAMPLE_RATE), "-c:a", "aac", "-b:a", "64k", str(tmp)]
+    result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore')
+    if result.returncode != 0 or not tmp.exists():
+        raise RuntimeError(f"生成测试素材失败 ({kind}, {seconds}s): {result.stderr[-300:]}")
+    os.replace(tmp, path)
+    return path
+
+
+class BenchRecorder:
+    """bench 的阶段计量：以 process() 的状态事件为边界，统计每个阶段的耗时、峰值内存和写入字节"""
+
+    def __init__(self, dirs: List[Path], audio_seconds: float):
+        self.dirs = dirs
+        self.audio_seconds = audio_seconds
+        self.stages: Dict[str, dict] = {}
+        self._rss_token = None
+        self._mark()
+
+    def _sizes(self) -> Dict[str, int]:
+        sizes = {}
+        for d in self.dirs:
+            for f in d.rglob("*"):
+                try:
+                    if f.is_file():
+                        sizes[str(f)] = f.stat().st_size
+                except OSError:
+                    pass
+        return sizes
+
+    def _mark(self):
+        self._start = time.perf_counter()
+        self._sizes_before = self._sizes()
+        if self._rss_token is not None:
+            RSS_SAMPLER.stop(self._rss_token)
+        self._rss_token = RSS_SAMPLER.start()
+
+    def __call__(self, event: dict):
+        stage, status = event.get("stage"), event.get("status")
+        if stage not in BENCH_STAGES:
+            return
+        if status == "running":
+            self._mark()
+        elif status in ("completed", "skipped"):
+            seconds = time.perf_counter() - self._start
+            # 新建或变大的文件计为本阶段写入
+            written = sum(max(0, size - self._sizes_before.get(path, 0))
+                          for path, size in self._sizes().items())
+            peak = RSS_SAMPLER.stop(self._rss_token) if self._rss_token is not None else peak_rss_mb()
+            self._rss_token = None
+            self.stages[stage] = {
+                "seconds": round(seconds, 4),
+                "rtf": round(seconds / self.audio_seconds, 5) if self.audio_seconds else None,
+                "peak_rss_mb": round(peak or 0, 1),
+                "children_peak_rss_mb": round(children_peak_rss_mb() or 0, 1),
+                "bytes_written": written,
+            }
+            self._mark()
+
+    def close(self):
+        if self._rss_token is not None:
+            RSS_SAMPLER.stop(self._rss_token)
+            self._rss_token = None
+
+
+def bench_case(transcriber: "BiliTranscriber", fixture: Path, kind: str, seconds: float,
+               model: str, language: str) -> dict:
+    """跑一个素材：通过 BBDown 替身完整执行 process()，返回各阶段计量"""
+    bvid = "BV" + hashlib.sha1(f"{kind}-{seconds}".encode()).hexdigest()[:10]
+    recorder = BenchRecorder([transcriber.temp_dir, transcriber.output_dir], seconds)
+    transcriber.status_callback = recorder
+    os.environ["BILI_BENCH_FIXTURE"] = str(fixture)
+    start = time.perf_counter()
+    try:
+        # 用范围而不是单个数字选第1P，走一遍分P枚举（替身是多P视频）
+        transcriber.process(bvid, model=model, language=language, pages="1-1")
+    finally:
+        transcriber.status_callback = None
+        recorder.close()
+    total = time.perf_counter() - start
+    return {
+        "fixture": {"kind": kind, "seconds": seconds},
+        "audio_seconds": seconds,
+        "total_seconds": round(total, 4),
+        "rtf": round(total / seconds, 5),
+        "stages": recorder.stages,
+    }
+
+
+def bench_subtitles(transcriber: "BiliTranscriber", fixture: Path, model: str) -> List[dict]:
+    """字幕路径检查：替身按用例产出字幕，核对 fetch_subtitles 的选择（CC 优先于 AI、ai-zh 匹配 zh），
+    再用 prefer / compare 策略各完整跑一次 process()"""
+    checks = []
+    os.environ["BILI_BENCH_FIXTURE"] = str(fixture)
+    for name, files, language, expected in BENCH_SUBTITLE_CASES:
+        os.environ["BILI_BENCH_SUBTITLES"] = ",".join(files)
+        output_name = f"bench-subtitles-{name}"
+        try:
+            result = transcriber.fetch_subtitles("BVbench", output_name, language)
+            picked = result["subtitle"]["language"] if result else None
+            ok = picked == expected and (result is None or len(result["segments"]) == 10)
+            checks.append({"case": name, "files": list(files), "expected": expected, "picked": picked, "ok": ok})
+        except Exception as e:
+            checks.append({"case": name, "files": list(files), "expected": expected, "ok": False, "error": str(e)})
+        finally:
+            transcriber.cleanup(output_name)
+
+    os.environ["BILI_BENCH_SUBTITLES"] = "ai-zh.json,zh-CN.srt"
+    policy = transcriber.subtitle_policy
+    for name in ("prefer", "compare"):
+        events = []
+        transcriber.subtitle_policy = name
+        transcriber.status_callback = events.append
+        try:
+            transcriber.process(f"BVbenchsub{name}", model=model, language="zh", pages="1-1")
+            seen = {(e.get("stage"), e.get("status")) for e in events}
+            if name == "prefer":
+                ok = ("subtitles", "completed") in seen and ("transcribe", "running") not in seen
+            else:
+                ok = ("subtitles", "compared") in seen
+            checks.append({"case": f"policy-{name}", "ok": ok})
+        except Exception as e:
+            checks.append({"case": f"policy-{name}", "ok": False, "error": str(e)})
+        finally:
+            transcriber.subtitle_policy = policy
+            transcriber.status_callback = None
+    os.environ.pop("BILI_BENCH_SUBTITLES", None)
+    for check in checks:
+        print(f"   {'✅' if check['ok'] else '❌'} 字幕检查 {check['case']}: "
+              f"{check.get('error') or check.get('picked', '')}")
+    return checks
+
+
+def bench_failure(backend: str, model: str, kind: str, seconds: float, error: Exception) -> dict:
+    """失败的用例：记录错误，不中断其余用例"""
+    return {"backend": backend, "model": model, "fixture": {"kind": kind, "seconds": seconds},
+            "error": str(error), "error_type": type(error).__name__}
+
+
+def bench_key(item: dict) -> tuple:
+    return (item["backend"], item["model"], item["fixture"]["kind"], item["fixture"]["seconds"])
+
+
+def compare_bench(results: List[dict], baseline: List[dict], threshold: float) -> List[dict]:
+    """与基线逐项比较总耗时和各阶段耗时，超过 (1 + threshold) 倍记为退化"""
+    base = {bench_key(item): item for item in baseline}
+    comparison = []
+    for item in results:
+        old = base.get(bench_key(item))
+        if old is None or "error" in old or "error" in item:
+            continue
+        entry = {"backend": item["backend"], "model": item["model"], "fixture": item["fixture"],
+                 "total": {"baseline": old["total_seconds"], "current": item["total_seconds"]},
+                 "stages": {}}
+        regressions = []
+        pairs = [("total", old["total_seconds"], item["total_seconds"])]
+        pairs += [(stage, old["stages"][stage]["seconds"], data["seconds"])
+                  for stage, data in item["stages"].items() if stage in old.get("stages", {})]
+        for name, before, after in pairs:
+            ratio = after / before if before else None
+            if name != "total":
+                entry["stages"][name] = {"baseline": before, "current": after}
+            target = entry["total"] if name == "total" else entry["stages"][name]
+            target["ratio"] = round(ratio, 3) if ratio is not None else None
+            if ratio is not None and ratio > 1 + threshold:
+                regressions.append(name)
+        entry["regressions"] = regressions
+        comparison.append(entry)
+    return comparison
+
+
+def bench_main(args_list) -> int:
+    """bench 子命令：用合成素材和 BBDown 替身离线测量流水线各阶段性能"""
+    import platform
+
+    parser = argparse.ArgumentParser(prog="bili-transcribe.py bench", description="离线性能基准测试")
+    parser.add_argument("--durations", default="30,300",
+                        help="素材时长列表，支持 s/m/h 后缀，如 30,5m,30m,2h (默认: 30,300)")
+    parser.add_argument("--fixtures", default=",".join(BENCH_FIXTURES),
+                        help=f"素材类型列表 (默认: {','.join(BENCH_FIXTURES)})")
+    parser.add_argument("--backends", default="whisper", help="语音识别后端列表 (默认: whisper)")
+    parser.add_argument("--models", default="tiny", help="模型列表 (默认: tiny)")
+    parser.add_argument("--language", default="zh", help="转录语言 (默认: zh)")
+    parser.add_argument("--work-dir", help="工作目录（默认使用临时目录，结束后删除）")
+    parser.add_argument("--output", default="bench-results.json", help="结果JSON文件 (默认: bench-results.json)")
+    parser.add_argument("--baseline", help="与之比较的基线结果JSON")
+    parser.add_argument("--save-baseline", help="把本次结果另存为基线")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定退化的耗时增幅 (默认: 0.1，即10%%)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="有退化时以非零状态退出")
+    add_asr_arguments(parser)
+    args = parser.parse_args(args_list)
+
+    durations = [parse_duration(d) for d in args.durations.split(",") if d.strip()]
+    kinds = [k.strip() for k in args.fixtures.split(",") if k.strip()]
+    unknown = [k for k in kinds if k not in BENCH_FIXTURES]
+    if unknown:
+        parser.error(f"未知的素材类型: {', '.join(unknown)}（可选: {', '.join(BENCH_FIXTURES)}）")
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    for name in backends:
+        if name not in ASR_BACKENDS:
+            parser.error(f"未知的语音识别后端: {name}（可选: {', '.join(ASR_BACKENDS)}）")
+        for model in models:
+            if model not in ASR_BACKENDS[name].valid_models:
+                parser.error(f"后端 {name} 不支持模型 '{model}'")
+    check_asr_arguments(parser, args, backends)
+
+    work_dir = Path(args.work_dir).expanduser() if args.work_dir else Path(tempfile.mkdtemp(prefix="bili-bench-"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+    stub = work_dir / "bin" / "BBDown"
+    stub.parent.mkdir(exist_ok=True)
+    stub.write_text(BENCH_BBDOWN, encoding="utf-8")
+    stub.chmod(0o755)
+
+    results = []
+    subtitle_checks = None
+    try:
+        for backend in backends:
+            for model in models:
+                try:
+                    # 不使用结果缓存和检查点，每次都完整执行
+                    transcriber = BiliTranscriber(output_dir=str(work_dir / "out"), model_cache=ModelCache(1),
+                                                  asr_workers=args.asr_workers, chunk_minutes=args.chunk_minutes,
+                                                  vad=args.vad, vad_padding=args.vad_padding, backend=backend,
+                                                  compute_type=args.compute_type, stream=args.stream,
+                                                  checkpoint=False)
+                    transcriber.temp_dir = work_dir / "tmp"
+                    transcriber.temp_dir.mkdir(exist_ok=True)
+                    # 直接指定替身，不改 PATH，也不写入工具路径缓存
+                    transcriber._cmd_cache["BBDown"] = str(stub)
+                    transcriber.ensure_dependencies()
+
+                    # 预先加载模型，加载耗时单独统计，不计入各素材的转录阶段
+                    start = time.perf_counter()
+                    transcriber.model_cache.get(
+                        transcriber.backend.cache_key(model, None, transcriber.compute_type),
+                        lambda: transcriber.backend.load(model, None, transcriber.compute_type))
+                    load_seconds = round(time.perf_counter() - start, 4)
+                    if subtitle_checks is None:
+                        print(f"\n💬 [{backend}/{model}] 字幕路径检查")
+                        subtitle_checks = bench_subtitles(
+                            transcriber, make_fixture(transcriber, kinds[0], min(durations), work_dir / "fixtures"),
+                            model)
+                except Exception as e:
+                    print(f"\n❌ [{backend}/{model}] 初始化失败，跳过其全部用例: {e}")
+                    results.extend(bench_failure(backend, model, kind, seconds, e)
+                                   for seconds in durations for kind in kinds)
+                    continue
+
+                for seconds in durations:
+                    for kind in kinds:
+                        print(f"\n⏱️  [{backend}/{model}] {kind} {seconds:g}s")
+                        try:
+                            fixture = make_fixture(transcriber, kind, seconds, work_dir / "fixtures")
+                            item = bench_case(transcriber, fixture, kind, seconds, model, args.language)
+                        except Exception as e:
+                            print(f"   ❌ 用例失败: {e}")
+                            results.append(bench_failure(backend, model, kind, seconds, e))
+                            continue
+                        item.update({"backend": backend, "model": model, "model_load_seconds": load_seconds})
+                        results.append(item)
+                        print(f"   总耗时 {item['total_seconds']:.2f}s | RTF {item['rtf']:.3f} | " +
+                              " | ".join(f"{k} {v['seconds']:.2f}s" for k, v in item["stages"].items()))
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"platform": platform.platform(), "python": platform.python_version(),
+                 "cpu_count": os.cpu_count()},
+        "config": {"durations": durations, "fixtures": kinds, "backends": backends, "models": models,
+                   "language": args.language, "asr_workers": args.asr_workers, "vad": args.vad,
+                   "compute_type": args.compute_type},
+        "results": results,
+        "subtitles": subtitle_checks or [],
+        "failed": sum(1 for item in results if "error" in item),
+    }
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["baseline"] = args.baseline
+        report["comparison"] = compare_bench(results, baseline.get("results", []), args.threshold)
+        print(f"\n📊 与基线比较 ({args.baseline}):")
+        for entry in report["comparison"]:
+            fixture = entry["fixture"]
+            flag = "❌ 退化: " + ", ".join(entry["regressions"]) if entry["regressions"] else "✅"
+            print(f"   [{entry['backend']}/{entry['model']}] {fixture['kind']} {fixture['seconds']:g}s: "
+                  f"{entry['total']['baseline']:.2f}s → {entry['total']['current']:.2f}s "
+                  f"(x{entry['total']['ratio']}) {flag}")
+            regressed = regressed or bool(entry["regressions"])
+
+    data = json.dumps(report, ensure_ascii=False, indent=2)
+    Path(args.output).write_text(data, encoding="utf-8")
+    print(f"\n✅ 结果: {args.output}")
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(data, encoding="utf-8")
+        print(f"✅ 基线: {args.save_baseline}")
+    if report["failed"]:
+        print(f"❌ {report['failed']}/{len(results)} 个用例失败，详见结果文件")
+        return 1
+    if not all(check["ok"] for check in report["subtitles"]):
+        print("❌ 字幕检查未通过，详见结果文件中的 subtitles")
+        return 1
+    return 1 if regressed and args.fail_on_regression else 0
+
+
+def backends_main(args_list) -> int:
+    """backends 子命令：输出各语音识别后端的能力报告"""
+    parser = argparse.ArgumentParser(prog="bili-transcribe.py backends", description="语音识别后端能力报告")
+    parser.parse_args(args_list)
+    print(json.dumps([b.capabilities() for b in ASR_BACKENDS.values()], ensure_ascii=False, indent=2))
+    return 0
+
+
+COMMANDS = {
+    "serve": serve_main,
+    "backends": backends_main,
+    "bench": bench_main,
+    "queue": queue_main,
+    "search": search_main,
+}
+
+
+def main():
+    """主入口"""
+    argv = sys.argv[1:]
+    if "--profile-startup" in argv:
+        argv.remove("--profile-startup")
+        PROFILER.enabled = True
+        atexit.register(PROFILER.report, "--task-mode" in argv)
+
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+
+    with PROFILER.step("参数解析"):
+        args = parse_arguments(argv)
+
+    urls = list(args.url)
+    if args.input_file:
+        urls.extend(read_url_list(args.input_file))
+    if args.server:
+        return run_client(args, urls)
+    if len(urls) != 1:
+        return run_batch(args, urls)
+    args.url = urls[0]
 
     print(f"🎬 B站视频转录")
     print(f"{'─' * 40}")
@@ -553,13 +5713,16 @@ def main():
     print(f"{'─' * 40}\n")
 
     try:
-        transcriber = BiliTranscriber(output_dir=args.output_dir, task_mode=args.task_mode)
+        transcriber = BiliTranscriber(output_dir=args.output_dir, task_mode=args.task_mode,
+                                      **transcriber_options_from_args(args))
         result = transcriber.process(
             url=args.url,
             model=args.model,
             language=args.language,
             keep_video=args.keep_video,
-            skip_download=args.skip_download
+            skip_download=args.skip_download,
+            keep_audio=args.keep_audio,
+            pages=args.pages
         )
 
         if result:
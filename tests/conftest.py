@@ -0,0 +1,17 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(scope="session")
+def bt():
+    """以模块方式加载 bili-transcribe.py（文件名含连字符，不能直接 import）"""
+    spec = importlib.util.spec_from_file_location("bili_transcribe", ROOT / "bili-transcribe.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["bili_transcribe"] = module
+    spec.loader.exec_module(module)
+    return module
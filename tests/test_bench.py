@@ -0,0 +1,52 @@
+"""bench 的 BBDown 替身与基线比较"""
+
+import pytest
+
+BVID = "BV1xx411c7mD"
+
+
+@pytest.fixture
+def transcriber(bt, tmp_path, monkeypatch):
+    monkeypatch.setattr(bt, "CACHE_DIR", tmp_path / "cache")
+    stub = tmp_path / "BBDown"
+    stub.write_text(bt.BENCH_BBDOWN, encoding="utf-8")
+    stub.chmod(0o755)
+    fixture = tmp_path / "fixture.m4a"
+    fixture.write_bytes(b"bench-audio")
+    monkeypatch.setenv("BILI_BENCH_FIXTURE", str(fixture))
+    transcriber = bt.BiliTranscriber(output_dir=str(tmp_path / "out"))
+    transcriber._cmd_cache["BBDown"] = str(stub)
+    transcriber._dependencies_ok = True
+    return transcriber
+
+
+def test_stub_enumerates_pages(bt, transcriber):
+    work = transcriber.list_parts(BVID)
+    assert [p["page"] for p in work["parts"]] == list(range(1, bt.BENCH_PAGES + 1))
+    assert [p["output_name"] for p in work["parts"]] == [f"{BVID}_p{n}" for n in range(1, bt.BENCH_PAGES + 1)]
+
+
+def test_stub_download_lands_in_job_dir(transcriber):
+    # 多P视频按 --multi-file-pattern 命名，文件直接落在任务工作目录中
+    for part in transcriber.list_parts(BVID)["parts"]:
+        path = transcriber.download_video(BVID, part["output_name"], audio_only=True, page=part["page"])
+        assert path == transcriber.job_dir(part["output_name"]) / f"{part['output_name']}.m4a"
+        assert path.read_bytes() == b"bench-audio"
+
+
+def result(bt, seconds, download, error=None):
+    if error is not None:
+        return bt.bench_failure("whisper", "tiny", "tone", 30, RuntimeError(error))
+    return {"backend": "whisper", "model": "tiny", "fixture": {"kind": "tone", "seconds": 30},
+            "total_seconds": seconds, "stages": {"download": {"seconds": download}}}
+
+
+def test_compare_bench_flags_regressions(bt):
+    comparison = bt.compare_bench([result(bt, 1.2, 0.5)], [result(bt, 1.0, 0.5)], 0.1)
+    assert comparison[0]["regressions"] == ["total"]
+    assert comparison[0]["stages"]["download"]["ratio"] == 1.0
+
+
+def test_compare_bench_skips_failed_cases(bt):
+    assert bt.compare_bench([result(bt, 0, 0, error="boom")], [result(bt, 1.0, 0.5)], 0.1) == []
+    assert bt.compare_bench([result(bt, 1.0, 0.5)], [result(bt, 0, 0, error="boom")], 0.1) == []
@@ -0,0 +1,105 @@
+"""分P枚举：用本地的 BBDown 替身输出 --only-show-info，检查 fetch_page_list / list_parts"""
+
+import sys
+
+import pytest
+
+BVID = "BV1xx411c7mD"
+
+# BBDown --only-show-info 的替身：按给定的分P输出，每次调用在日志中记一行；pages 为空时模拟枚举失败
+INFO_STUB = """#!{python}
+import sys
+with open({log!r}, "a") as f:
+    f.write(" ".join(sys.argv[1:]) + "\\n")
+pages = {pages!r}
+if not pages:
+    print("获取视频信息失败: -404")
+    sys.exit(1)
+print("[2024-01-01 12:00:00.000] - 视频标题: 测试课程")
+for page, (title, duration) in enumerate(pages, 1):
+    print(f"[2024-01-01 12:00:00.000] - P{{page}}: [{{1000 + page}}] [{{title}}] [{{duration}}]")
+"""
+
+
+@pytest.fixture
+def make_transcriber(bt, tmp_path, monkeypatch):
+    monkeypatch.setattr(bt, "CACHE_DIR", tmp_path / "cache")
+    log = tmp_path / "bbdown.log"
+
+    def make(pages):
+        stub = tmp_path / "BBDown"
+        stub.write_text(INFO_STUB.format(python=sys.executable, log=str(log), pages=pages), encoding="utf-8")
+        stub.chmod(0o755)
+        transcriber = bt.BiliTranscriber(output_dir=str(tmp_path / "out"),
+                                         result_cache=bt.TranscriptCache(tmp_path / "results"))
+        transcriber._cmd_cache["BBDown"] = str(stub)
+        # 只测分P枚举，不要求安装 ffmpeg 和语音识别后端
+        transcriber._dependencies_ok = True
+        return transcriber
+
+    make.calls = lambda: log.read_text(encoding="utf-8").splitlines() if log.exists() else []
+    return make
+
+
+COURSE = [("绪论", "12m30s"), ("第二讲", "20m00s"), ("第三讲", "08m05s")]
+
+
+def test_fetch_page_list(make_transcriber):
+    info = make_transcriber(COURSE).fetch_page_list(BVID)
+    assert info["title"] == "测试课程"
+    assert [p["page"] for p in info["pages"]] == [1, 2, 3]
+    assert info["pages"][0] == {"page": 1, "cid": "1001", "title": "绪论", "duration": "12m30s"}
+
+
+def test_fetch_page_list_failure(make_transcriber):
+    with pytest.raises(RuntimeError, match="获取分P列表失败"):
+        make_transcriber([]).fetch_page_list(BVID)
+
+
+def test_list_parts_names_every_page(make_transcriber):
+    work = make_transcriber(COURSE).list_parts(BVID)
+    assert work["title"] == "测试课程"
+    assert [p["output_name"] for p in work["parts"]] == [f"{BVID}_p1", f"{BVID}_p2", f"{BVID}_p3"]
+    assert [(p["cache_id"], p["cache_page"]) for p in work["parts"]] == [(BVID, 1), (BVID, 2), (BVID, 3)]
+    assert work["parts"][1]["title"] == "测试课程 - P2 第二讲"
+
+
+def test_list_parts_range(make_transcriber):
+    transcriber = make_transcriber(COURSE)
+    assert [p["page"] for p in transcriber.list_parts(BVID, "2-")["parts"]] == [2, 3]
+    assert [p["page"] for p in transcriber.list_parts(BVID, "1,3")["parts"]] == [1, 3]
+
+
+def test_single_page_number_skips_enumeration(make_transcriber):
+    work = make_transcriber(COURSE).list_parts(BVID, "2")
+    assert [(p["page"], p["output_name"]) for p in work["parts"]] == [(2, f"{BVID}_p2")]
+    assert make_transcriber.calls() == []
+
+
+def test_single_page_video_keeps_bvid_name(make_transcriber):
+    work = make_transcriber([("正片", "03m00s")]).list_parts(BVID)
+    assert [p["output_name"] for p in work["parts"]] == [BVID]
+
+
+def test_enumeration_failure_falls_back_to_p1(make_transcriber):
+    work = make_transcriber([]).list_parts(BVID)
+    assert [(p["page"], p["output_name"]) for p in work["parts"]] == [(1, BVID)]
+    assert len(make_transcriber.calls()) == 1
+
+
+def test_collection_enumeration_failure_raises(make_transcriber):
+    with pytest.raises(RuntimeError):
+        make_transcriber([]).list_parts("https://space.bilibili.com/123/channel/collectiondetail?sid=456")
+
+
+def test_cached_page_list_skips_bbdown(make_transcriber):
+    make_transcriber(COURSE).list_parts(BVID)
+    work = make_transcriber(COURSE).list_parts(BVID)
+    assert len(work["parts"]) == 3
+    assert len(make_transcriber.calls()) == 1
+
+    # 缓存只用于单个视频；不读缓存（--refresh）时重新枚举
+    refreshed = make_transcriber(COURSE)
+    refreshed.result_cache.read_enabled = False
+    refreshed.list_parts(BVID)
+    assert len(make_transcriber.calls()) == 2